@@ -1,8 +1,17 @@
 from django.contrib import admin
-from .models import User, Product, Vehicle, DeliveryAgent, Shipment
+from .models import (
+    User, Product, Vehicle, DeliveryAgent, Shipment, RouteCacheEntry, WeatherSnapshot, EnrichmentJob, LocationChunk,
+    ShipmentStatusRollup, MonthlyVolumeRollup,
+)
 
 admin.site.register(User)
 admin.site.register(Product)
 admin.site.register(Vehicle)
 admin.site.register(DeliveryAgent)
 admin.site.register(Shipment)
+admin.site.register(RouteCacheEntry)
+admin.site.register(WeatherSnapshot)
+admin.site.register(EnrichmentJob)
+admin.site.register(LocationChunk)
+admin.site.register(ShipmentStatusRollup)
+admin.site.register(MonthlyVolumeRollup)
@@ -7,15 +7,15 @@ class ApiConfig(AppConfig):
     def ready(self):
         """
         This method is called when the Django application is ready.
-        We'll use it to train our ML models on startup if they don't exist.
+        Models are trained at build time (`manage.py train_models`), so here we
+        only check that the coefficient artifact is present. Nothing in this
+        path imports scikit-learn.
         """
         # Import utils here to avoid AppRegistryNotReady error
-        from . import utils
-        import os
-
-        # We only want this to run once, not every time the server reloads.
-        # The run_main check ensures it runs only in the main Django process.
-        if os.environ.get('RUN_MAIN', None) != 'true':
-            print("Checking for ML models...")
-            utils.train_and_save_models()
+        from . import signals, utils  # noqa: F401 (signals registers its receivers on import)
 
+        if not utils.model_artifacts_exist():
+            print(
+                f"WARNING: No ML model artifact at {utils.COEFFICIENTS_PATH}. "
+                "Run `python manage.py train_models`; falling back to heuristic predictions."
+            )
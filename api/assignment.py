@@ -0,0 +1,271 @@
+"""
+Nearest-available assignment of delivery agents and vehicles.
+
+Each process keeps a KD-tree (scipy.spatial.cKDTree) over the last known
+positions of agents and vehicles, projected onto the unit sphere so that
+euclidean nearest neighbours are great-circle nearest neighbours. The index
+is maintained incrementally:
+
+* availability changes only flip membership in a set;
+* moved resources go to a small overlay that is searched by brute force and
+  folded into a rebuilt tree once it grows past ASSIGNMENT_INDEX_OVERLAY_LIMIT;
+* a full reload every ASSIGNMENT_INDEX_TTL picks up writes made by other
+  processes.
+
+The index only proposes candidates. A resource is handed out only after a
+conditional `UPDATE ... SET is_available = false WHERE is_available` claims
+it, so concurrent requests can never double-book an agent or a vehicle.
+"""
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from . import caching
+from .models import DeliveryAgent, Vehicle
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def _unit_vector(lat, lng):
+    phi, lam = math.radians(lat), math.radians(lng)
+    return (math.cos(phi) * math.cos(lam), math.cos(phi) * math.sin(lam), math.sin(phi))
+
+def _chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2))
+
+
+class ResourceIndex:
+    def __init__(self, model):
+        self.model = model
+        self._lock = threading.RLock()
+        self._loaded_at = None
+        self._tree = None
+        self._tree_ids = []
+        self._tree_pos = {}
+        self._moved = {}
+        self._positionless = set()
+        self._available = set()
+        self._counters = {'rebuilds': 0, 'reloads': 0, 'queries': 0}
+
+    def reload(self):
+        """Rebuilds the whole index from the database (one query)."""
+        rows = self.model.objects.values_list('id', 'last_lat', 'last_lng', 'is_available')
+        with self._lock:
+            self._available = set()
+            self._positionless = set()
+            positions = {}
+            for pk, lat, lng, is_available in rows:
+                if is_available:
+                    self._available.add(pk)
+                if lat is None or lng is None:
+                    self._positionless.add(pk)
+                else:
+                    positions[pk] = _unit_vector(lat, lng)
+            self._moved = {}
+            self._build(positions)
+            self._loaded_at = time.monotonic()
+            self._counters['reloads'] += 1
+
+    def _build(self, positions):
+        from scipy.spatial import cKDTree
+
+        self._tree_ids = list(positions)
+        self._tree_pos = positions
+        self._tree = cKDTree([positions[pk] for pk in self._tree_ids]) if positions else None
+        self._counters['rebuilds'] += 1
+
+    def _ensure_loaded(self):
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > settings.ASSIGNMENT_INDEX_TTL:
+            self.reload()
+
+    def update(self, pk, is_available, lat=None, lng=None):
+        """Records a resource's availability and, when given, its new position."""
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            if is_available:
+                self._available.add(pk)
+            else:
+                self._available.discard(pk)
+            if lat is None or lng is None:
+                if pk not in self._tree_pos and pk not in self._moved:
+                    self._positionless.add(pk)
+                return
+            position = _unit_vector(lat, lng)
+            self._positionless.discard(pk)
+            if self._tree_pos.get(pk) == position:
+                self._moved.pop(pk, None)
+                return
+            self._moved[pk] = position
+            if len(self._moved) > settings.ASSIGNMENT_INDEX_OVERLAY_LIMIT:
+                self._build({**self._tree_pos, **self._moved})
+                self._moved = {}
+
+    def mark_unavailable(self, pks):
+        with self._lock:
+            self._available.difference_update(pks)
+
+    def nearest(self, lat, lng, k=1, exclude=()):
+        """
+        Up to `k` (pk, distance_km) pairs of available resources closest to
+        (lat, lng). Resources with no known position come last, with a
+        distance of None.
+        """
+        self._ensure_loaded()
+        with self._lock:
+            self._counters['queries'] += 1
+            exclude = set(exclude)
+            usable = self._available - exclude
+            query = _unit_vector(lat, lng)
+            found = []
+
+            if self._tree is not None and usable:
+                size = len(self._tree_ids)
+                ask = min(size, max(4 * k, 8))
+                while True:
+                    distances, indexes = self._tree.query(query, k=ask)
+                    if ask == 1:
+                        distances, indexes = [distances], [indexes]
+                    found = [
+                        (self._tree_ids[i], distance)
+                        for distance, i in zip(distances, indexes)
+                        if i < size and self._tree_ids[i] in usable and self._tree_ids[i] not in self._moved
+                    ]
+                    if len(found) >= k or ask >= size:
+                        break
+                    ask = min(size, ask * 4)
+
+            for pk, position in self._moved.items():
+                if pk in usable:
+                    found.append((pk, math.dist(query, position)))
+            found.sort(key=lambda item: item[1])
+
+            result = [(pk, _chord_to_km(chord)) for pk, chord in found[:k]]
+            if len(result) < k:
+                result += [(pk, None) for pk in sorted(usable & self._positionless)][:k - len(result)]
+            return result
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                self._counters, indexed=len(self._tree_ids), moved=len(self._moved),
+                available=len(self._available), positionless=len(self._positionless),
+            )
+
+
+vehicle_index = ResourceIndex(Vehicle)
+agent_index = ResourceIndex(DeliveryAgent)
+
+
+class _ClaimConflict(Exception):
+    pass
+
+
+def _candidates(index, lat, lng, k, exclude=()):
+    """Candidate pks nearest-first from the index, topped up from the database."""
+    pks = []
+    if lat is not None and lng is not None:
+        pks = [pk for pk, _ in index.nearest(lat, lng, k=k, exclude=exclude)]
+    if len(pks) < k:
+        pks += list(
+            index.model.objects.filter(is_available=True).exclude(pk__in=[*pks, *exclude])
+            .values_list('pk', flat=True)[:k - len(pks)]
+        )
+    return pks
+
+def _claim_nearest(index, lat, lng):
+    """
+    Marks the nearest free resource busy with a conditional
+    `UPDATE ... WHERE is_available` and returns it. Losing every candidate
+    to concurrent requests reloads the index and retries.
+    """
+    for _ in range(settings.ASSIGNMENT_CLAIM_RETRIES):
+        candidates = _candidates(index, lat, lng, settings.ASSIGNMENT_CANDIDATES)
+        if not candidates:
+            return None
+        for pk in candidates:
+            if index.model.objects.filter(pk=pk, is_available=True).update(is_available=False):
+                index.mark_unavailable([pk])
+                caching.invalidate('vehicles')
+                return index.model.objects.get(pk=pk)
+        index.reload()
+    return None
+
+def claim_nearest(lat, lng):
+    """
+    Claims the agent and vehicle closest to (lat, lng). Either may be None
+    if the fleet is exhausted; call inside a transaction so that a partial
+    claim is rolled back when the caller gives up.
+    """
+    return _claim_nearest(agent_index, lat, lng), _claim_nearest(vehicle_index, lat, lng)
+
+def _claim_for_points(index, points):
+    depth = settings.ASSIGNMENT_CANDIDATES + len(points)
+    for _ in range(settings.ASSIGNMENT_CLAIM_RETRIES):
+        candidate_lists = [
+            [pk for pk, _ in index.nearest(lat, lng, k=depth)] if lat is not None and lng is not None else []
+            for lat, lng in points
+        ]
+        try:
+            with transaction.atomic():
+                free = index.model.objects.filter(is_available=True)
+                if connection.features.has_select_for_update_skip_locked:
+                    free = free.select_for_update(skip_locked=True)
+                available = set(free.filter(pk__in={pk for pks in candidate_lists for pk in pks}).values_list('pk', flat=True))
+
+                taken, chosen = set(), []
+                for pks in candidate_lists:
+                    pick = next((pk for pk in pks if pk in available and pk not in taken), None)
+                    if pick is not None:
+                        taken.add(pick)
+                    chosen.append(pick)
+                missing = chosen.count(None)
+                if missing:
+                    spare = iter(free.exclude(pk__in=taken).values_list('pk', flat=True)[:missing])
+                    chosen = [pk if pk is not None else next(spare, None) for pk in chosen]
+
+                claimed = [pk for pk in chosen if pk is not None]
+                if index.model.objects.filter(pk__in=claimed, is_available=True).update(is_available=False) != len(claimed):
+                    raise _ClaimConflict()
+        except _ClaimConflict:
+            index.reload()
+            continue
+        index.mark_unavailable(claimed)
+        caching.invalidate('vehicles')
+        objects = index.model.objects.in_bulk(claimed)
+        return [objects.get(pk) if pk is not None else None for pk in chosen]
+    return [None] * len(points)
+
+def claim_many(points):
+    """
+    Claims an (agent, vehicle) pair per (lat, lng) start point, nearest first
+    and never reusing a resource. Candidates are locked with
+    SELECT ... FOR UPDATE SKIP LOCKED where supported and claimed with one
+    conditional UPDATE per model; a lost race retries. Entries are None
+    once the fleet runs out; release the other half of such pairs.
+    """
+    agents = _claim_for_points(agent_index, points)
+    vehicles = _claim_for_points(vehicle_index, points)
+    return list(zip(agents, vehicles))
+
+def release(agents=(), vehicles=()):
+    """Makes claimed resources available again (e.g. the unused half of a pair)."""
+    for index, resources in ((agent_index, agents), (vehicle_index, vehicles)):
+        pks = [resource.pk for resource in resources if resource is not None]
+        if pks:
+            index.model.objects.filter(pk__in=pks).update(is_available=True)
+            for pk in pks:
+                index.update(pk, True)
+            caching.invalidate('vehicles')
+
+def resources_available():
+    """Cheap existence check used to fail fast before any routing work."""
+    return DeliveryAgent.objects.filter(is_available=True).exists() and Vehicle.objects.filter(is_available=True).exists()
+
+def resource_changed(instance):
+    """Feeds a saved agent/vehicle into the in-process index (wired from api/signals.py)."""
+    index = vehicle_index if isinstance(instance, Vehicle) else agent_index
+    index.update(instance.pk, instance.is_available, instance.last_lat, instance.last_lng)
@@ -0,0 +1,102 @@
+"""
+Response cache for read-heavy GET endpoints, with ETags.
+
+Each cached view depends on a few scopes: `shipments:<client_id>` (that
+client's shipments), `shipments` (any shipment, including live positions),
+`products` and `vehicles` (vehicles and delivery agents). Every scope has a
+random generation token in the Django cache; writes replace the token via
+`invalidate()`, from model signals (api/signals.py) and from the write paths
+that bypass signals (conditional/bulk updates in inventory, assignment,
+rollups, tracking and weather). The cache key and the ETag are a hash of the
+request path, the user when the response is per user, and the tokens, so an
+`If-None-Match` that still matches is answered with 304 before the view runs
+or the cached body is even read.
+
+Tokens and bodies live in the `default` cache: set CACHE_REDIS_URL so that
+all processes see each other's invalidations.
+"""
+import functools
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from rest_framework import status
+from rest_framework.response import Response
+
+PREFIX = 'response-cache'
+
+
+def _token_key(scope):
+    return f'{PREFIX}:gen:{scope}'
+
+def _bump(scopes):
+    cache.set_many({_token_key(scope): uuid.uuid4().hex for scope in scopes}, timeout=None)
+
+def invalidate(*scopes):
+    """
+    Expires every response depending on `scopes`. Inside a transaction the
+    tokens are replaced again on commit, so a response computed from the
+    pre-commit state in the meantime is not served afterwards.
+    """
+    scopes = [scope for scope in scopes if scope]
+    if not scopes:
+        return
+    _bump(scopes)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: _bump(scopes))
+
+def shipments_changed(client_ids):
+    invalidate('shipments', *(f'shipments:{client_id}' for client_id in set(client_ids)))
+
+def _tokens(scopes):
+    keys = [_token_key(scope) for scope in scopes]
+    tokens = cache.get_many(keys)
+    for key in keys:
+        if key not in tokens:
+            cache.add(key, uuid.uuid4().hex, timeout=None)
+            tokens[key] = cache.get(key)
+    return [tokens[key] for key in keys]
+
+def _matches(if_none_match, etag):
+    # Weak comparison: compression middleware may have turned our tag into W/"..."
+    tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+    return if_none_match.strip() == '*' or etag in tags
+
+def cached_response(*scopes, per_user=False, extra=None):
+    """
+    Caches a DRF view method's 200 responses. `scopes` may contain
+    '{user}', which is replaced by the requesting user's id (and makes the
+    response per user, as does per_user=True). `extra(request)` returns
+    anything else the response depends on (e.g. today's date).
+    """
+    per_user = per_user or any('{user}' in scope for scope in scopes)
+
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            user_id = request.user.pk if per_user else None
+            resolved = [scope.format(user=user_id) for scope in scopes]
+            parts = [request.get_full_path(), user_id, *_tokens(resolved), *(extra(request) if extra else ())]
+            digest = hashlib.sha1(repr(parts).encode()).hexdigest()
+            etag = f'"{digest}"'
+
+            if _matches(request.headers.get('If-None-Match', ''), etag):
+                response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            else:
+                data = cache.get(f'{PREFIX}:body:{digest}')
+                if data is not None:
+                    response = Response(data)
+                else:
+                    response = method(view, request, *args, **kwargs)
+                    if response.status_code != status.HTTP_200_OK:
+                        return response
+                    cache.set(f'{PREFIX}:body:{digest}', response.data, timeout=settings.RESPONSE_CACHE_TIMEOUT)
+            response['ETag'] = etag
+            patch_cache_control(response, private=True, no_cache=True)
+            patch_vary_headers(response, ['Authorization'])
+            return response
+        return wrapper
+    return decorator
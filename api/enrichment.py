@@ -0,0 +1,245 @@
+"""
+Route and weather enrichment for new shipments.
+
+Route cache misses are fetched concurrently on a small bounded thread pool
+under one overall deadline. Weather never blocks: a forecast comes from the
+per-city cache (stale ones are refreshed in the background), and a city
+not cached yet gets FORECAST_PENDING, filled in after commit by the caller
+(see api/weather.py). Batches (bulk creation) dedupe identical lanes and
+cities first.
+
+Only the HTTP calls run on pool threads; cache reads and writes stay on the
+calling thread so no database connection is shared across threads.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import assignment, eta, inventory, rollups, routing, utils, weather
+from .models import Shipment
+
+
+class NoResourcesAvailable(Exception):
+    """No delivery agent or vehicle is free to take the shipment."""
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.ENRICHMENT_WORKERS, thread_name_prefix='shipment-enrichment',
+                )
+    return _executor
+
+
+def enrich_many(lanes, timeout=None):
+    """
+    Enriches a list of (start_address, end_address) lanes. Identical lanes
+    share one route lookup; route cache misses are fetched concurrently
+    under a single deadline of `timeout` seconds (default
+    settings.ENRICHMENT_TIMEOUT).
+
+    Returns one entry per lane, in order: either a dict with 'route',
+    'distance_km', 'predicted_hours', 'destination_city' and
+    'weather_forecast', or the RouteLookupError for that lane. A city whose
+    forecast is not cached yet gets weather.FORECAST_PENDING at once; the
+    caller should schedule weather.fill_shipment_forecast for it.
+    """
+    deadline = time.monotonic() + (timeout if timeout is not None else settings.ENRICHMENT_TIMEOUT)
+    executor = _get_executor()
+
+    routes, route_futures = {}, {}
+    for start_address, end_address in lanes:
+        key = routing.lane_key(start_address, end_address)
+        if key in routes or key in route_futures:
+            continue
+        route = routing.cached_route(start_address, end_address)
+        if route is not None:
+            routes[key] = route
+        else:
+            route_futures[key] = (executor.submit(routing.fetch_route, start_address, end_address), start_address, end_address)
+
+    forecasts = {}
+    for _, end_address in lanes:
+        city = weather.destination_city(end_address)
+        key = weather.city_key(city)
+        if key in forecasts:
+            continue
+        if not city:
+            forecasts[key] = "N/A"
+        elif not settings.WEATHER_API_KEY:
+            forecasts[key] = "API key missing"
+        else:
+            forecast, state = weather.weather_cache.lookup(city)
+            if state == 'stale':
+                weather.weather_cache.schedule_refresh(city)
+            forecasts[key] = weather.FORECAST_PENDING if state == 'missing' else forecast
+
+    pending = [item[0] for item in route_futures.values()]
+    if pending:
+        wait(pending, timeout=max(0.0, deadline - time.monotonic()))
+
+    for key, (future, start_address, end_address) in route_futures.items():
+        if not future.done():
+            future.cancel()
+            routes[key] = routing.RouteLookupError("Google Maps Error: TIMEOUT. Could not calculate route in time.")
+            continue
+        try:
+            routes[key] = future.result()
+        except routing.RouteLookupError as e:
+            routes[key] = e
+            continue
+        routing.store_route(start_address, end_address, routes[key])
+
+    results = []
+    for start_address, end_address in lanes:
+        route = routes[routing.lane_key(start_address, end_address)]
+        if isinstance(route, routing.RouteLookupError):
+            results.append(route)
+            continue
+        city = weather.destination_city(end_address)
+        distance_km = route['distance_m'] / 1000.0
+        results.append({
+            'route': route,
+            'distance_km': distance_km,
+            'predicted_hours': utils.predict_delivery_time(distance_km),
+            'destination_city': city,
+            'weather_forecast': forecasts[weather.city_key(city)],
+        })
+    return results
+
+def enrich(start_address, end_address, timeout=None):
+    """Single-lane enrich_many; raises RouteLookupError instead of returning it."""
+    result = enrich_many([(start_address, end_address)], timeout)[0]
+    if isinstance(result, routing.RouteLookupError):
+        raise result
+    return result
+
+def shipment_fields(enriched, created_at=None):
+    """
+    Shipment model fields derived from one enrich/enrich_many result. The
+    promised delivery time counts from `created_at` (now for new shipments).
+    """
+    route = enriched['route']
+    return {
+        'start_location_lat': route['start_lat'],
+        'start_location_lng': route['start_lng'],
+        'end_location_lat': route['end_lat'],
+        'end_location_lng': route['end_lng'],
+        'route_polyline': route['polyline'],
+        'distance_km': enriched['distance_km'],
+        'predicted_duration': eta.format_hours(enriched['predicted_hours']),
+        'predicted_hours': float(enriched['predicted_hours']),
+        'expected_delivery_at': (created_at or timezone.now()) + timedelta(hours=enriched['predicted_hours']),
+        'weather_forecast': enriched['weather_forecast'],
+        'current_lat': route['start_lat'],
+        'current_lng': route['start_lng'],
+    }
+
+
+def enrich_and_save(start_address, end_address, save, created_at=None):
+    """
+    Resolves route, distance, ETA and weather for a lane, assigns an agent
+    and a vehicle, and persists everything through `save(**fields)`, which
+    must return the saved shipment. External calls happen before the
+    transaction is opened. Raises NoResourcesAvailable or RouteLookupError
+    before anything is written; `save` may raise (e.g. inventory.OutOfStock)
+    to roll back the agent/vehicle claim.
+    """
+    if not assignment.resources_available():  # fail fast before paying for the route lookup
+        raise NoResourcesAvailable("No available delivery agents or vehicles at the moment.")
+    enriched = enrich(start_address, end_address)
+    route = enriched['route']
+
+    with transaction.atomic():
+        # Claims are conditional UPDATEs; raising here rolls back a half-claimed pair.
+        agent, vehicle = assignment.claim_nearest(route['start_lat'], route['start_lng'])
+        if agent is None or vehicle is None:
+            raise NoResourcesAvailable("No available delivery agents or vehicles at the moment.")
+        shipment = save(agent=agent, vehicle=vehicle, status='In Transit', **shipment_fields(enriched, created_at))
+
+    if enriched['weather_forecast'] == weather.FORECAST_PENDING:
+        transaction.on_commit(lambda: weather.fill_shipment_forecast(shipment.id, enriched['destination_city']))
+    return shipment
+
+def enrich_shipment(shipment):
+    """Enriches an already saved Pending shipment in place (the queue worker's entry point)."""
+    def save(**fields):
+        before = rollups.snapshot(shipment)
+        for name, value in fields.items():
+            setattr(shipment, name, value)
+        shipment.save()
+        rollups.record(before, rollups.snapshot(shipment))
+        return shipment
+    return enrich_and_save(shipment.start_address, shipment.end_address, save, shipment.created_at)
+
+def quantities_by_product(items):
+    """{product_id: total quantity} over bulk `items`."""
+    totals = {}
+    for item in items:
+        totals[item['product'].id] = totals.get(item['product'].id, 0) + item['quantity']
+    return totals
+
+def bulk_enrich_and_create(client, items):
+    """
+    Creates enriched, assigned shipments for validated bulk `items` (dicts
+    with product, quantity, start_address and end_address). Lanes are
+    deduplicated, each order gets the nearest free agent and vehicle in one
+    greedy pass (see assignment.claim_many), stock for the assigned orders is
+    reserved, and all rows are written with bulk_create in a single
+    transaction. Raises inventory.OutOfStock (nothing written) if the
+    reservation fails.
+
+    Returns (created, errors): created is [(index, shipment)] and errors is
+    [{'index', 'error'}] for orders whose route failed or for which no
+    agent/vehicle was left.
+    """
+    results = enrich_many([(item['start_address'], item['end_address']) for item in items])
+    errors = [
+        {'index': index, 'error': str(result)}
+        for index, result in enumerate(results) if isinstance(result, routing.RouteLookupError)
+    ]
+    routable = [index for index, result in enumerate(results) if not isinstance(result, routing.RouteLookupError)]
+
+    with transaction.atomic():
+        pairs = assignment.claim_many([
+            (results[index]['route']['start_lat'], results[index]['route']['start_lng']) for index in routable
+        ])
+        assigned, unused_agents, unused_vehicles = [], [], []
+        for index, (agent, vehicle) in zip(routable, pairs):
+            if agent is None or vehicle is None:
+                unused_agents.append(agent)
+                unused_vehicles.append(vehicle)
+                errors.append({'index': index, 'error': "No available delivery agents or vehicles at the moment."})
+                continue
+            assigned.append((index, Shipment(
+                client=client, product=items[index]['product'], quantity=items[index]['quantity'],
+                start_address=items[index]['start_address'], end_address=items[index]['end_address'],
+                agent=agent, vehicle=vehicle, status='In Transit', stock_reserved=True,
+                **shipment_fields(results[index]),
+            )))
+        assignment.release(agents=unused_agents, vehicles=unused_vehicles)
+
+        inventory.reserve_many(quantities_by_product([items[index] for index, _ in assigned]))
+        Shipment.objects.bulk_create([shipment for _, shipment in assigned])
+        rollups.created([shipment for _, shipment in assigned])
+
+    pending_by_city = {}
+    for index, shipment in assigned:
+        if shipment.weather_forecast == weather.FORECAST_PENDING:
+            pending_by_city.setdefault(results[index]['destination_city'], []).append(shipment.id)
+    for city, shipment_ids in pending_by_city.items():
+        transaction.on_commit(lambda city=city, ids=shipment_ids: weather.fill_shipments_forecast(ids, city))
+
+    errors.sort(key=lambda error: error['index'])
+    return assigned, errors
@@ -0,0 +1,138 @@
+"""
+Progress-aware ETAs.
+
+A shipment's ETA used to be predicted once from its total distance. Here
+the stored route polyline is decoded once per process into a `RouteGeometry`
+(segment start points and vectors in local kilometres, plus cumulative
+distance), the truck's current position is projected onto every segment in
+one vectorised pass, and the remaining distance is fed to the delivery-time
+model in a single batch for all shipments asked about. Geometries are kept
+in an LRU keyed by shipment, so refreshing ETAs on every location ingest
+costs no queries once a shipment has been seen.
+"""
+import math
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from . import geo, utils
+from .models import Shipment
+
+KM_PER_DEGREE_LAT = 110.574
+KM_PER_DEGREE_LNG = 111.320
+
+
+class RouteGeometry:
+    def __init__(self, points, distance_km):
+        import numpy as np
+
+        points = np.asarray(points, dtype=float)
+        self.cos_lat = math.cos(math.radians(points[:, 0].mean()))
+        xy = self._project(points[:, 0], points[:, 1])
+        self.starts = xy[:-1]
+        self.vectors = xy[1:] - xy[:-1]
+        lengths = np.hypot(self.vectors[:, 0], self.vectors[:, 1])
+        self.lengths_sq = np.where(lengths > 0, lengths ** 2, 1.0)
+        self.cumulative = np.concatenate(([0.0], np.cumsum(lengths)))
+        self.length_km = float(self.cumulative[-1])
+        # The model was trained on Google's road distance; scale the polyline to it.
+        self.distance_km = distance_km if distance_km else self.length_km
+
+    def _project(self, lat, lng):
+        import numpy as np
+
+        return np.column_stack((np.asarray(lng) * KM_PER_DEGREE_LNG * self.cos_lat, np.asarray(lat) * KM_PER_DEGREE_LAT))
+
+    def remaining_km(self, lat, lng):
+        """Road distance left from the route point closest to (lat, lng)."""
+        import numpy as np
+
+        if len(self.starts) == 0 or self.length_km == 0:
+            return self.distance_km
+        position = self._project(lat, lng)[0]
+        offsets = position - self.starts
+        t = np.clip((offsets * self.vectors).sum(axis=1) / self.lengths_sq, 0.0, 1.0)
+        nearest = self.starts + self.vectors * t[:, None]
+        segment = int(np.argmin(((nearest - position) ** 2).sum(axis=1)))
+        travelled = self.cumulative[segment] + t[segment] * (self.cumulative[segment + 1] - self.cumulative[segment])
+        return max(0.0, (1 - travelled / self.length_km) * self.distance_km)
+
+
+class GeometryCache:
+    """
+    LRU of {shipment_id: RouteGeometry}. Shipments without a route yet
+    (Pending ones in async mode) are not remembered, so they are picked up
+    once enriched.
+    """
+
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries or settings.ETA_GEOMETRY_CACHE_SIZE
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._counters = {'hits': 0, 'loads': 0, 'evictions': 0}
+
+    def get_many(self, shipment_ids):
+        """{shipment_id: RouteGeometry or None}, loading misses in one query."""
+        found, missing = {}, []
+        with self._lock:
+            for pk in shipment_ids:
+                if pk in self._entries:
+                    self._entries.move_to_end(pk)
+                    found[pk] = self._entries[pk]
+                    self._counters['hits'] += 1
+                else:
+                    missing.append(pk)
+        if missing:
+            rows = Shipment.objects.filter(pk__in=missing).values_list('id', 'route_polyline', 'distance_km')
+            loaded = {pk: None for pk in missing}
+            for pk, encoded, distance_km in rows.iterator():
+                points = geo.decode_polyline(encoded)
+                loaded[pk] = RouteGeometry(points, distance_km) if len(points) >= 2 else None
+            with self._lock:
+                for pk, geometry in loaded.items():
+                    if geometry is None:
+                        continue
+                    self._entries[pk] = geometry
+                    self._entries.move_to_end(pk)
+                    self._counters['loads'] += 1
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self._counters['evictions'] += 1
+            found.update(loaded)
+        return found
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            for name in self._counters:
+                self._counters[name] = 0
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, shipments=len(self._entries))
+
+
+geometry_cache = GeometryCache()
+
+
+def live_etas(positions):
+    """
+    {shipment_id: (remaining_km, predicted_hours)} for {shipment_id: (lat, lng)},
+    with one batched model call. Shipments without a stored route, or
+    without a position, are left out.
+    """
+    geometries = geometry_cache.get_many(list(positions))
+    remaining = {
+        pk: geometries[pk].remaining_km(lat, lng)
+        for pk, (lat, lng) in positions.items()
+        if geometries.get(pk) is not None and lat is not None and lng is not None
+    }
+    if not remaining:
+        return {}
+    hours = utils.predict_delivery_time_batch(list(remaining.values()))
+    return {pk: (km, float(h)) for (pk, km), h in zip(remaining.items(), hours)}
+
+def format_hours(hours):
+    """The Shipment.predicted_duration text for `hours`."""
+    return f"{hours:.1f} hours"
@@ -0,0 +1,217 @@
+"""
+Geometry for the fleet map: Google encoded polylines, Douglas-Peucker
+simplification and bounding-box tests.
+
+A route drawn at zoom 6 needs a few dozen vertices, not the thousands
+Google returns, so `FleetMapCache` keeps, per shipment, the route's bounding
+box and one simplified polyline per zoom bucket. Only active (already
+enriched) shipments are looked up and their routes never change, so
+entries only leave the cache by LRU eviction.
+"""
+import math
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+MIN_ZOOM, MAX_ZOOM = 0, 21
+
+
+# --- Encoded polylines ---
+def decode_polyline(encoded):
+    """[(lat, lng), ...] from a Google encoded polyline."""
+    points, index, lat, lng = [], 0, 0, 0
+    length = len(encoded or '')
+    while index < length:
+        deltas = []
+        for _ in range(2):
+            shift = result = 0
+            while True:
+                byte = ord(encoded[index]) - 63
+                index += 1
+                result |= (byte & 0x1f) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += deltas[0]
+        lng += deltas[1]
+        points.append((lat / 1e5, lng / 1e5))
+    return points
+
+def _encode_value(value):
+    value = ~(value << 1) if value < 0 else value << 1
+    chunks = []
+    while value >= 0x20:
+        chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+        value >>= 5
+    chunks.append(chr(value + 63))
+    return ''.join(chunks)
+
+def encode_polyline(points):
+    encoded, prev_lat, prev_lng = [], 0, 0
+    for lat, lng in points:
+        lat, lng = round(lat * 1e5), round(lng * 1e5)
+        encoded.append(_encode_value(lat - prev_lat) + _encode_value(lng - prev_lng))
+        prev_lat, prev_lng = lat, lng
+    return ''.join(encoded)
+
+
+# --- Simplification ---
+def simplify(points, tolerance):
+    """
+    Douglas-Peucker: drops vertices closer than `tolerance` degrees to the
+    line through their kept neighbours. Iterative, with the per-span
+    distance computation vectorised in numpy.
+    """
+    import numpy as np
+
+    points = np.asarray(points, dtype=float)
+    if len(points) < 3 or tolerance <= 0:
+        return points
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    spans = [(0, len(points) - 1)]
+    while spans:
+        start, end = spans.pop()
+        if end - start < 2:
+            continue
+        origin, direction = points[start], points[end] - points[start]
+        offsets = points[start + 1:end] - origin
+        length = np.hypot(direction[0], direction[1])
+        if length == 0:
+            distances = np.hypot(offsets[:, 0], offsets[:, 1])
+        else:
+            distances = np.abs(direction[0] * offsets[:, 1] - direction[1] * offsets[:, 0]) / length
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            split = start + 1 + farthest
+            keep[split] = True
+            spans.append((start, split))
+            spans.append((split, end))
+    return points[keep]
+
+def parse_zoom(raw):
+    """A finite zoom level clamped to [MIN_ZOOM, MAX_ZOOM]; raises ValueError."""
+    zoom = float(raw)
+    if not math.isfinite(zoom):
+        raise ValueError("zoom must be a finite number.")
+    return min(MAX_ZOOM, max(MIN_ZOOM, zoom))
+
+def zoom_bucket(zoom):
+    return min(MAX_ZOOM, max(MIN_ZOOM, int(zoom)))
+
+def zoom_tolerance(zoom):
+    """Degrees covered by FLEET_MAP_TOLERANCE_PX web-mercator pixels at `zoom`."""
+    return settings.FLEET_MAP_TOLERANCE_PX * 360.0 / (256 * 2 ** zoom_bucket(zoom))
+
+
+# --- Bounding boxes ---
+def parse_bbox(raw):
+    """(west, south, east, north) from "west,south,east,north"; raises ValueError."""
+    west, south, east, north = (float(part) for part in raw.split(','))
+    if not (-180 <= west <= east <= 180 and -90 <= south <= north <= 90):
+        raise ValueError("bbox must be west,south,east,north with west <= east and south <= north.")
+    return west, south, east, north
+
+def contains(bbox, lat, lng):
+    west, south, east, north = bbox
+    return lat is not None and lng is not None and south <= lat <= north and west <= lng <= east
+
+def bbox_of(points):
+    lats = [lat for lat, _ in points]
+    lngs = [lng for _, lng in points]
+    return min(lngs), min(lats), max(lngs), max(lats)
+
+def bboxes_overlap(a, b):
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+def path_intersects(points, bbox):
+    """True if any segment of the (lat, lng) path crosses the box (vectorised Liang-Barsky clip)."""
+    import numpy as np
+
+    points = np.asarray(points, dtype=float)
+    if len(points) == 0:
+        return False
+    west, south, east, north = bbox
+    lat, lng = points[:, 0], points[:, 1]
+    if np.any((lat >= south) & (lat <= north) & (lng >= west) & (lng <= east)):
+        return True
+    if len(points) < 2:
+        return False
+
+    x0, y0 = lng[:-1], lat[:-1]
+    dx, dy = lng[1:] - x0, lat[1:] - y0
+    t_enter, t_exit = np.zeros(len(x0)), np.ones(len(x0))
+    for p, q in ((-dx, x0 - west), (dx, east - x0), (-dy, y0 - south), (dy, north - y0)):
+        parallel = p == 0
+        outside = parallel & (q < 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = np.where(parallel, 0.0, q / np.where(parallel, 1.0, p))
+        t_enter = np.where(~parallel & (p < 0), np.maximum(t_enter, t), t_enter)
+        t_exit = np.where(~parallel & (p > 0), np.minimum(t_exit, t), t_exit)
+        t_exit = np.where(outside, -1.0, t_exit)
+    return bool(np.any(t_enter <= t_exit))
+
+
+# --- Per-shipment cache ---
+class FleetMapCache:
+    """LRU of {shipment_id: {'polyline', 'bbox', 'simplified': {bucket: (encoded, points)}}}."""
+
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries or settings.FLEET_MAP_CACHE_SIZE
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._counters = {'hits': 0, 'simplifications': 0, 'evictions': 0}
+
+    def missing(self, shipment_ids):
+        with self._lock:
+            return [pk for pk in shipment_ids if pk not in self._entries]
+
+    def add(self, shipment_id, encoded):
+        """Remembers a shipment's route; shipments without one are remembered too, with a bbox of None."""
+        points = decode_polyline(encoded)
+        with self._lock:
+            self._entries[shipment_id] = {'polyline': encoded, 'bbox': bbox_of(points) if points else None, 'simplified': {}}
+            self._entries.move_to_end(shipment_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters['evictions'] += 1
+
+    def route_bbox(self, shipment_id):
+        with self._lock:
+            entry = self._entries.get(shipment_id)
+            return entry['bbox'] if entry else None
+
+    def simplified(self, shipment_id, zoom):
+        """(encoded polyline, points) simplified for `zoom`, or (None, []) for unknown shipments."""
+        bucket = zoom_bucket(zoom)
+        with self._lock:
+            entry = self._entries.get(shipment_id)
+            if entry is None:
+                return None, []
+            self._entries.move_to_end(shipment_id)
+            cached = entry['simplified'].get(bucket)
+            if cached is not None:
+                self._counters['hits'] += 1
+                return cached
+            encoded = entry['polyline']
+        points = [tuple(point) for point in simplify(decode_polyline(encoded), zoom_tolerance(bucket)).tolist()]
+        result = (encode_polyline(points), points)
+        with self._lock:
+            entry['simplified'][bucket] = result
+            self._counters['simplifications'] += 1
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            for name in self._counters:
+                self._counters[name] = 0
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, shipments=len(self._entries))
+
+
+fleet_map_cache = FleetMapCache()
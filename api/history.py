@@ -0,0 +1,141 @@
+"""
+Append-only GPS track history.
+
+Pings are not stored one row each. Every flush of the location buffer (see
+api/tracking.py) appends one `LocationChunk` per shipment and time bucket:
+the points are delta-encoded as int32 triples (milliseconds, micro-degrees
+of latitude and longitude) and zlib-compressed, which takes a few bytes per
+point instead of a ~100 byte row plus index entries.
+
+`manage.py compact_location_history` merges the chunks of closed buckets
+into one, downsamples buckets older than LOCATION_HISTORY_RAW_RETENTION to
+one point per LOCATION_HISTORY_DOWNSAMPLE_SECONDS, and deletes buckets older
+than LOCATION_HISTORY_MAX_AGE.
+"""
+import sys
+import zlib
+from array import array
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import LocationChunk
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+# --- Encoding ---
+def _millis(moment):
+    return int((moment - EPOCH).total_seconds() * 1000)
+
+def encode_points(points, origin):
+    """Compressed blob for [(ts, lat, lng), ...] sorted by ts, all at or after `origin`."""
+    values = array('i')
+    prev_t, prev_lat, prev_lng = _millis(origin), 0, 0
+    for ts, lat, lng in points:
+        t, lat, lng = _millis(ts), round(lat * 1e6), round(lng * 1e6)
+        values.extend((t - prev_t, lat - prev_lat, lng - prev_lng))
+        prev_t, prev_lat, prev_lng = t, lat, lng
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return zlib.compress(values.tobytes())
+
+def decode_points(blob, origin):
+    values = array('i')
+    values.frombytes(zlib.decompress(bytes(blob)))
+    if sys.byteorder == 'big':
+        values.byteswap()
+    points = []
+    t, lat, lng = _millis(origin), 0, 0
+    for index in range(0, len(values), 3):
+        t, lat, lng = t + values[index], lat + values[index + 1], lng + values[index + 2]
+        points.append((EPOCH + timedelta(milliseconds=t), lat / 1e6, lng / 1e6))
+    return points
+
+
+# --- Writing ---
+def bucket_start(moment):
+    size = int(settings.LOCATION_HISTORY_BUCKET.total_seconds())
+    return EPOCH + timedelta(seconds=int((moment - EPOCH).total_seconds()) // size * size)
+
+def _chunk(shipment_id, bucket, points, resolution=0):
+    points = sorted(points)
+    return LocationChunk(
+        shipment_id=shipment_id, bucket_start=bucket, first_at=points[0][0], last_at=points[-1][0],
+        point_count=len(points), resolution=resolution, data=encode_points(points, bucket),
+    )
+
+def append(points_by_shipment):
+    """Stores {shipment_id: [(ts, lat, lng), ...]} as new chunks in one bulk insert."""
+    chunks = []
+    for shipment_id, points in points_by_shipment.items():
+        by_bucket = {}
+        for point in points:
+            by_bucket.setdefault(bucket_start(point[0]), []).append(point)
+        chunks += [_chunk(shipment_id, bucket, bucket_points) for bucket, bucket_points in by_bucket.items()]
+    LocationChunk.objects.bulk_create(chunks, batch_size=500)
+    return len(chunks)
+
+
+# --- Reading ---
+def track(shipment_id, start=None, end=None):
+    """Every stored (ts, lat, lng) of a shipment within [start, end], oldest first."""
+    chunks = LocationChunk.objects.filter(shipment_id=shipment_id)
+    if start is not None:
+        chunks = chunks.filter(last_at__gte=start)
+    if end is not None:
+        chunks = chunks.filter(first_at__lte=end)
+    points = []
+    for bucket, blob in chunks.values_list('bucket_start', 'data'):
+        points += [
+            point for point in decode_points(blob, bucket)
+            if (start is None or point[0] >= start) and (end is None or point[0] <= end)
+        ]
+    points.sort()
+    return points
+
+
+# --- Retention ---
+def downsample(points, seconds):
+    """Keeps the first point of every `seconds`-long window."""
+    kept, window = [], None
+    for point in points:
+        current = int(point[0].timestamp()) // seconds
+        if current != window:
+            kept.append(point)
+            window = current
+    return kept
+
+def compact(now=None):
+    """
+    Merges, downsamples and expires chunks (see module docstring). Each
+    shipment bucket is rewritten in its own transaction. Returns counts.
+    """
+    now = now or timezone.now()
+    resolution = settings.LOCATION_HISTORY_DOWNSAMPLE_SECONDS
+    raw_cutoff = bucket_start(now - settings.LOCATION_HISTORY_RAW_RETENTION)
+    expired, _ = LocationChunk.objects.filter(bucket_start__lt=now - settings.LOCATION_HISTORY_MAX_AGE).delete()
+    counts = {'expired': expired, 'merged': 0, 'downsampled': 0}
+
+    closed = LocationChunk.objects.filter(bucket_start__lt=bucket_start(now))
+    groups = {}
+    for pk, shipment_id, bucket, chunk_resolution in closed.values_list('pk', 'shipment_id', 'bucket_start', 'resolution'):
+        groups.setdefault((shipment_id, bucket), []).append((pk, chunk_resolution))
+
+    for (shipment_id, bucket), chunks in groups.items():
+        wants_downsample = bucket < raw_cutoff and any(chunk_resolution < resolution for _, chunk_resolution in chunks)
+        if len(chunks) == 1 and not wants_downsample:
+            continue
+        with transaction.atomic():
+            rows = list(LocationChunk.objects.select_for_update().filter(pk__in=[pk for pk, _ in chunks]).values_list('bucket_start', 'data'))
+            points = sorted(point for origin, blob in rows for point in decode_points(blob, origin))
+            if not points:  # compacted concurrently
+                continue
+            merged = _chunk(shipment_id, bucket, downsample(points, resolution) if wants_downsample else points,
+                            resolution if wants_downsample else max(chunk_resolution for _, chunk_resolution in chunks))
+            LocationChunk.objects.filter(pk__in=[pk for pk, _ in chunks]).delete()
+            merged.save()
+        counts['downsampled' if wants_downsample else 'merged'] += 1
+    return counts
@@ -0,0 +1,55 @@
+"""
+Race-free stock reservation.
+
+Stock is reserved when a shipment is created, with a conditional
+`UPDATE ... SET stock = stock - qty WHERE stock >= qty`, so concurrent
+orders can never oversell a product. Editing an undelivered shipment's
+product or quantity moves the reservation, and deleting it releases the
+stock. Shipments carry `stock_reserved` so that delivery only consumes stock
+for shipments created before reservations existed.
+"""
+from django.db.models import F
+
+from . import caching
+from .models import Product
+
+
+class OutOfStock(Exception):
+    pass
+
+
+def _out_of_stock(product_id):
+    product = Product.objects.filter(pk=product_id).only('name', 'stock').first()
+    if product is None:
+        return OutOfStock("Product no longer exists.")
+    return OutOfStock(f"Out of stock. Only {product.stock} units available for {product.name}.")
+
+def reserve(product_id, quantity):
+    """Takes `quantity` units out of stock atomically; raises OutOfStock if there are not enough."""
+    if not Product.objects.filter(pk=product_id, stock__gte=quantity).update(stock=F('stock') - quantity):
+        raise _out_of_stock(product_id)
+    caching.invalidate('products')
+
+def reserve_many(quantities):
+    """reserve() for {product_id: quantity}; call inside a transaction so a failure releases the rest."""
+    for product_id, quantity in sorted(quantities.items()):  # fixed order avoids lock-order deadlocks
+        reserve(product_id, quantity)
+
+def release(product_id, quantity):
+    Product.objects.filter(pk=product_id).update(stock=F('stock') + quantity)
+    caching.invalidate('products')
+
+def consume_on_delivery(shipment):
+    """
+    Stock for a shipment being delivered. Reserved shipments were already
+    deducted; older ones are deducted now if stock allows. Returns False
+    if stock was insufficient.
+    """
+    if shipment.stock_reserved:
+        return True
+    consumed = Product.objects.filter(pk=shipment.product_id, stock__gte=shipment.quantity).update(
+        stock=F('stock') - shipment.quantity
+    )
+    if consumed:
+        caching.invalidate('products')
+    return bool(consumed)
@@ -0,0 +1,96 @@
+"""
+Database-backed queue for asynchronous shipment enrichment.
+
+With SHIPMENT_ENRICHMENT_ASYNC on, creating a shipment only stores it as
+Pending and enqueues an `EnrichmentJob`; `manage.py run_enrichment_worker`
+claims jobs in batches and does the route/ETA/weather/assignment work.
+
+Jobs are claimed with `SELECT ... FOR UPDATE SKIP LOCKED` where the database
+supports it (PostgreSQL) so concurrent workers never wait on each other. On
+SQLite, which serializes writers anyway, the claim is a conditional UPDATE
+that only matches rows still claimable. A job left `running` longer than
+ENRICHMENT_JOB_LEASE (crashed worker) becomes claimable again.
+"""
+import os
+import socket
+import uuid
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import enrichment, inventory, routing
+from .models import EnrichmentJob, Shipment
+
+
+def enqueue(shipment):
+    return EnrichmentJob.objects.create(shipment=shipment, run_after=timezone.now())
+
+def enqueue_many(shipments):
+    now = timezone.now()
+    return EnrichmentJob.objects.bulk_create([EnrichmentJob(shipment=shipment, run_after=now) for shipment in shipments])
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"[:40]
+
+def _claimable(now):
+    return (
+        Q(status='queued', run_after__lte=now)
+        | Q(status='running', locked_at__lt=now - settings.ENRICHMENT_JOB_LEASE)
+    )
+
+def claim_jobs(limit, worker=None):
+    """Atomically marks up to `limit` due jobs as running for this worker and returns them."""
+    now = timezone.now()
+    token = f"{worker or worker_name()}:{uuid.uuid4().hex[:16]}"
+    claim = {'status': 'running', 'locked_by': token, 'locked_at': now, 'attempts': F('attempts') + 1}
+    candidates = EnrichmentJob.objects.filter(_claimable(now)).order_by('run_after', 'id')
+
+    with transaction.atomic():
+        if connection.features.has_select_for_update_skip_locked:
+            ids = list(candidates.select_for_update(skip_locked=True).values_list('id', flat=True)[:limit])
+            EnrichmentJob.objects.filter(id__in=ids).update(**claim)
+        else:
+            ids = list(candidates.values_list('id', flat=True)[:limit])
+            EnrichmentJob.objects.filter(_claimable(now), id__in=ids).update(**claim)
+
+    return list(EnrichmentJob.objects.filter(locked_by=token, status='running').select_related('shipment'))
+
+def _finish(job, **fields):
+    # Only the worker holding the claim may record the outcome.
+    EnrichmentJob.objects.filter(pk=job.pk, locked_by=job.locked_by).update(updated_at=timezone.now(), **fields)
+
+def _release_stock(shipment):
+    # A shipment that will never ship gives its reserved stock back (once).
+    with transaction.atomic():
+        if Shipment.objects.filter(pk=shipment.pk, stock_reserved=True).update(stock_reserved=False):
+            inventory.release(shipment.product_id, shipment.quantity)
+
+def process_job(job):
+    """Runs one claimed job; on failure it is retried with exponential backoff up to ENRICHMENT_JOB_MAX_ATTEMPTS."""
+    if job.shipment.status != 'Pending':
+        _finish(job, status='done', last_error='', locked_at=None)
+        return 'done'
+    try:
+        enrichment.enrich_shipment(job.shipment)
+    except Exception as e:
+        if not isinstance(e, (enrichment.NoResourcesAvailable, routing.RouteLookupError)):
+            print(f"Unexpected error enriching shipment #{job.shipment_id}: {e!r}")
+        error = str(e)[:255]
+        if job.attempts >= settings.ENRICHMENT_JOB_MAX_ATTEMPTS:
+            _finish(job, status='failed', last_error=error, locked_at=None)
+            _release_stock(job.shipment)
+            return 'failed'
+        delay = settings.ENRICHMENT_JOB_BACKOFF * (2 ** (job.attempts - 1))
+        _finish(job, status='queued', last_error=error, locked_at=None, run_after=timezone.now() + delay)
+        return 'retry'
+    _finish(job, status='done', last_error='', locked_at=None)
+    return 'done'
+
+def run_batch(limit=None, worker=None):
+    """Claims and processes one batch; returns {'done': n, 'retry': n, 'failed': n}."""
+    outcomes = {'done': 0, 'retry': 0, 'failed': 0}
+    for job in claim_jobs(limit or settings.ENRICHMENT_JOB_BATCH_SIZE, worker):
+        outcomes[process_job(job)] += 1
+    return outcomes
@@ -0,0 +1,164 @@
+"""
+Live shipment tracking over Server-Sent Events.
+
+`GET /api/live/?token=<access JWT>&shipments=1,2` keeps a connection open and
+pushes `delta` events carrying only what changed (position and/or status)
+for the subscribed shipments, instead of clients polling /api/shipments/.
+The first event is a `snapshot` of the current state.
+
+Publishers (location ingestion and the status views) call `publish()`;
+`broker` fans deltas out in process to every matching subscription. Each
+subscription coalesces pending deltas per shipment, so a slow client gets
+the latest position rather than a growing backlog. Streaming needs an ASGI
+server (e.g. `uvicorn logiflow_backend.asgi:application`), and publishers
+and subscribers must share the process: run a single ASGI worker for the
+stream, or route pings to it. Under WSGI (gunicorn, the Vercel build) an
+endless response would pin a worker and buffer every event, so the
+endpoint answers 501 there and clients should keep polling
+/api/shipments/ or /api/shipments/etas/.
+"""
+import asyncio
+import json
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+
+from .models import Shipment
+
+
+class Subscription:
+    def __init__(self, shipment_ids, loop):
+        self.shipment_ids = frozenset(shipment_ids)
+        self._loop = loop
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._ready = asyncio.Event()
+
+    def push(self, shipment_id, fields):
+        """Called from any thread; merges `fields` into this shipment's pending delta."""
+        with self._lock:
+            self._pending.setdefault(shipment_id, {}).update(fields)
+        try:
+            self._loop.call_soon_threadsafe(self._ready.set)
+        except RuntimeError:  # the subscriber's loop is gone; close() will unsubscribe it
+            pass
+
+    async def next_deltas(self, timeout):
+        """Waits up to `timeout` seconds; returns {shipment_id: fields} (empty on timeout)."""
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return {}
+        self._ready.clear()
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return pending
+
+
+class Broker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_shipment = {}
+        self._counters = {'published': 0, 'delivered': 0}
+
+    def subscribe(self, shipment_ids, loop):
+        subscription = Subscription(shipment_ids, loop)
+        with self._lock:
+            for shipment_id in subscription.shipment_ids:
+                self._by_shipment.setdefault(shipment_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for shipment_id in subscription.shipment_ids:
+                subscribers = self._by_shipment.get(shipment_id)
+                if subscribers:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._by_shipment[shipment_id]
+
+    def publish(self, shipment_id, **fields):
+        with self._lock:
+            subscribers = list(self._by_shipment.get(shipment_id, ()))
+            self._counters['published'] += 1
+            self._counters['delivered'] += len(subscribers)
+        for subscription in subscribers:
+            subscription.push(shipment_id, fields)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, shipments=len(self._by_shipment),
+                        subscriptions=len({s for subs in self._by_shipment.values() for s in subs}))
+
+
+broker = Broker()
+
+def publish(shipment_id, **fields):
+    broker.publish(shipment_id, **fields)
+
+
+# --- SSE endpoint ---
+def _event(name, data):
+    return f"event: {name}\ndata: {json.dumps(data, default=str)}\n\n"
+
+def _authenticate(token):
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+    from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+    auth = JWTAuthentication()
+    try:
+        return auth.get_user(auth.get_validated_token(token))
+    except (InvalidToken, TokenError):
+        return None
+
+def _subscribed_shipments(user, requested):
+    shipments = Shipment.objects.filter(client=user)
+    shipments = shipments.filter(pk__in=requested) if requested else shipments.filter(status__in=Shipment.ACTIVE_STATUSES)
+    return list(shipments.values('id', 'status', 'current_lat', 'current_lng'))
+
+class _EventStream:
+    """Async iterable of SSE chunks; Django calls close() when the response ends or the client leaves."""
+
+    def __init__(self, subscription, snapshot):
+        self.subscription = subscription
+        self.snapshot = snapshot
+
+    async def __aiter__(self):
+        yield _event('snapshot', self.snapshot)
+        while True:
+            deltas = await self.subscription.next_deltas(settings.LIVE_STREAM_HEARTBEAT)
+            if not deltas:
+                yield ": keepalive\n\n"
+                continue
+            for shipment_id, fields in deltas.items():
+                yield _event('delta', {'id': shipment_id, **fields})
+
+    def close(self):
+        broker.unsubscribe(self.subscription)
+
+async def live_stream(request):
+    """SSE stream of the caller's shipments (see module docstring)."""
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse(
+            {'error': "Live streaming needs the ASGI server (logiflow_backend.asgi); poll /api/shipments/etas/ instead."},
+            status=501,
+        )
+    header = request.headers.get('Authorization', '')
+    token = header[7:] if header.startswith('Bearer ') else request.GET.get('token')  # EventSource cannot set headers
+    user = await sync_to_async(_authenticate)(token) if token else None
+    if user is None:
+        return JsonResponse({'error': 'Authentication credentials were not provided or are invalid.'}, status=401)
+    try:
+        requested = [int(pk) for pk in request.GET.get('shipments', '').split(',') if pk.strip()]
+    except ValueError:
+        return HttpResponseBadRequest("shipments must be a comma-separated list of ids.")
+
+    snapshot = await sync_to_async(_subscribed_shipments)(user, requested)
+    subscription = broker.subscribe([row['id'] for row in snapshot], asyncio.get_running_loop())
+    response = StreamingHttpResponse(_EventStream(subscription, snapshot), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from api import history
+
+
+class Command(BaseCommand):
+    help = (
+        "Merges location history chunks of closed time buckets, downsamples old "
+        "tracks and deletes expired ones. Run periodically (e.g. hourly from cron)."
+    )
+
+    def handle(self, *args, **options):
+        counts = history.compact()
+        self.stdout.write(
+            f"merged={counts['merged']} downsampled={counts['downsampled']} expired={counts['expired']}"
+        )
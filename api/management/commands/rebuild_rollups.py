@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from api import rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes the dashboard rollup tables from the shipments, a chunk of "
+        "clients per transaction, to repair drift (`migrate` fills them on deploy)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help="Clients per transaction.")
+
+    def handle(self, *args, **options):
+        clients = rollups.rebuild(chunk_size=options['chunk_size'])
+        self.stdout.write(f"Rebuilt rollups for {clients} clients.")
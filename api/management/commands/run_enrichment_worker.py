@@ -0,0 +1,35 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api import jobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Processes queued shipment enrichment jobs (route, ETA, weather and "
+        "assignment). Run one or more of these when SHIPMENT_ENRICHMENT_ASYNC is on."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.ENRICHMENT_JOB_BATCH_SIZE)
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds to sleep when the queue is empty.")
+        parser.add_argument('--once', action='store_true', help="Drain the queue once and exit.")
+
+    def handle(self, *args, **options):
+        worker = jobs.worker_name()
+        self.stdout.write(f"Enrichment worker {worker} started.")
+        while True:
+            outcomes = jobs.run_batch(options['batch_size'], worker)
+            processed = sum(outcomes.values())
+            if processed:
+                self.stdout.write(
+                    f"done={outcomes['done']} retry={outcomes['retry']} failed={outcomes['failed']}"
+                )
+            close_old_connections()
+            if not processed:
+                if options['once']:
+                    return
+                time.sleep(options['poll_interval'])
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api import training, utils
+
+
+class Command(BaseCommand):
+    help = (
+        "Trains the delivery-time and maintenance-cost models and publishes a "
+        "versioned coefficient artifact. Run this at build/deploy time; the "
+        "app itself never trains on startup. With --from-history the "
+        "delivery-time model is refitted on delivered shipments instead."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help="Retrain and publish a new version even if an artifact already exists.",
+        )
+        parser.add_argument(
+            '--from-history', action='store_true',
+            help="Fit the delivery-time model on delivered shipments (streamed in chunks) and publish it.",
+        )
+        parser.add_argument('--chunk-size', type=int, help="Rows fetched per chunk with --from-history.")
+
+    def handle(self, *args, **options):
+        if options['from_history']:
+            try:
+                artifact = training.retrain_from_history(options['chunk_size'])
+            except training.NotEnoughHistory as e:
+                raise CommandError(str(e))
+            metrics = artifact['training'][utils.DELIVERY_TIME_MODEL]
+            for name in ('train', 'holdout'):
+                fit = metrics[name]
+                rmse = 'n/a' if fit['rmse'] is None else f"{fit['rmse']:.3f} h"
+                r2 = 'n/a' if fit['r2'] is None else f"{fit['r2']:.3f}"
+                self.stdout.write(f"{name}: rows={fit['rows']} rmse={rmse} r2={r2}")
+            self.stdout.write(f"Scanned {metrics['scanned']} shipments in {metrics['seconds']}s ({metrics['rows_per_second']} rows/s).")
+            self.stdout.write(self.style.SUCCESS(
+                f"Published model version {artifact['version']} to {utils.COEFFICIENTS_PATH}"
+            ))
+            return
+
+        artifact = utils.train_and_save_models(force=options['force'])
+        if artifact is None:
+            self.stdout.write(f"Model artifact already present at {utils.COEFFICIENTS_PATH} (use --force to retrain).")
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"Published model version {artifact['version']} to {utils.COEFFICIENTS_PATH}"
+        ))
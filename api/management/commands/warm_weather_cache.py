@@ -0,0 +1,49 @@
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from django.utils import timezone
+
+from api import weather
+from api.models import Shipment
+
+
+class Command(BaseCommand):
+    help = (
+        "Refreshes the cached forecast for the busiest destination cities so "
+        "shipment creation always finds a fresh entry. Use --loop to run it "
+        "as a long-lived worker."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=20, help="Number of destination cities to warm.")
+        parser.add_argument('--days', type=int, default=7, help="Look-back window for ranking destinations.")
+        parser.add_argument(
+            '--loop', type=int, default=0, metavar='SECONDS',
+            help="Keep running, re-warming every SECONDS (0 runs once).",
+        )
+
+    def top_cities(self, top, days):
+        since = timezone.now() - timedelta(days=days)
+        counts = Counter()
+        addresses = (
+            Shipment.objects.filter(created_at__gte=since)
+            .values('end_address').annotate(shipments=Count('id')).order_by('-shipments')
+        )
+        for row in addresses.iterator():
+            counts[weather.destination_city(row['end_address'])] += row['shipments']
+        return [city for city, _ in counts.most_common(top) if city]
+
+    def warm(self, top, days):
+        cities = self.top_cities(top, days)
+        warmed = sum(1 for city in cities if weather.weather_cache.refresh(city))
+        self.stdout.write(f"Warmed {warmed}/{len(cities)} destination cities.")
+
+    def handle(self, *args, **options):
+        while True:
+            self.warm(options['top'], options['days'])
+            if not options['loop']:
+                return
+            time.sleep(options['loop'])
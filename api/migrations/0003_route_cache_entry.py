@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-18 01:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_shipment_current_lat_shipment_current_lng'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RouteCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lane_key', models.CharField(max_length=40, unique=True)),
+                ('origin', models.CharField(max_length=255)),
+                ('destination', models.CharField(max_length=255)),
+                ('distance_m', models.PositiveIntegerField()),
+                ('distance_text', models.CharField(blank=True, max_length=50)),
+                ('duration_text', models.CharField(blank=True, max_length=50)),
+                ('start_lat', models.FloatField()),
+                ('start_lng', models.FloatField()),
+                ('end_lat', models.FloatField()),
+                ('end_lng', models.FloatField()),
+                ('polyline', models.TextField(blank=True)),
+                ('fetched_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
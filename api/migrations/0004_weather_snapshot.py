@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-18 01:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_route_cache_entry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WeatherSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('city_key', models.CharField(max_length=100, unique=True)),
+                ('city', models.CharField(max_length=100)),
+                ('forecast', models.CharField(max_length=100)),
+                ('fetched_at', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.5 on 2026-10-18 01:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_weather_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EnrichmentJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('run_after', models.DateTimeField()),
+                ('locked_by', models.CharField(blank=True, max_length=64)),
+                ('locked_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('shipment', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='enrichment_job', to='api.shipment')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'run_after'], name='api_enrichm_status_41928c_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.5 on 2026-10-18 01:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_enrichment_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deliveryagent',
+            name='last_lat',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='deliveryagent',
+            name='last_lng',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='vehicle',
+            name='last_lat',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='vehicle',
+            name='last_lng',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 01:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_resource_last_position'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shipment',
+            name='stock_reserved',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.5 on 2026-10-18 01:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_shipment_stock_reserved'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='shipment',
+            index=models.Index(fields=['client', '-created_at', '-id'], name='api_shipmen_client__a65d26_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shipment',
+            index=models.Index(fields=['client', 'status', '-created_at', '-id'], name='api_shipmen_client__13eba7_idx'),
+        ),
+    ]
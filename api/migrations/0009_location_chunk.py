@@ -0,0 +1,30 @@
+# Generated by Django 5.2.5 on 2026-10-18 02:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_shipment_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LocationChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket_start', models.DateTimeField()),
+                ('first_at', models.DateTimeField()),
+                ('last_at', models.DateTimeField()),
+                ('point_count', models.PositiveIntegerField()),
+                ('resolution', models.PositiveIntegerField(default=0)),
+                ('data', models.BinaryField()),
+                ('shipment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='location_chunks', to='api.shipment')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['shipment', 'bucket_start'], name='api_locatio_shipmen_754141_idx'), models.Index(fields=['bucket_start'], name='api_locatio_bucket__2aa917_idx')],
+            },
+        ),
+    ]
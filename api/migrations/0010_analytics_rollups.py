@@ -0,0 +1,42 @@
+# Generated by Django 5.2.5 on 2026-10-18 02:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_location_chunk'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyVolumeRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('quantity', models.IntegerField(default=0)),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='volume_rollups', to=settings.AUTH_USER_MODEL)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.product')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('client', 'month', 'product'), name='unique_volume_rollup')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ShipmentStatusRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(max_length=20)),
+                ('shipment_count', models.IntegerField(default=0)),
+                ('distance_km_total', models.FloatField(default=0)),
+                ('distance_count', models.IntegerField(default=0)),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='status_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('client', 'status'), name='unique_status_rollup')],
+            },
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.5 on 2026-10-18 02:15
+
+from datetime import timedelta
+
+from django.db import migrations, models
+
+
+def parse_hours(text):
+    # predicted_duration is written as "2.5 hours"
+    try:
+        return float(text.split()[0])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+def backfill_predictions(apps, schema_editor):
+    Shipment = apps.get_model('api', 'Shipment')
+    rows = Shipment.objects.exclude(predicted_duration=None).order_by('pk').only('pk', 'created_at', 'predicted_duration')
+    last_pk = 0
+    while True:
+        batch = list(rows.filter(pk__gt=last_pk)[:2000])
+        if not batch:
+            return
+        for shipment in batch:
+            shipment.predicted_hours = parse_hours(shipment.predicted_duration)
+            if shipment.predicted_hours is not None:
+                shipment.expected_delivery_at = shipment.created_at + timedelta(hours=shipment.predicted_hours)
+        Shipment.objects.bulk_update(batch, ['predicted_hours', 'expected_delivery_at'])
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_analytics_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shipment',
+            name='expected_delivery_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='shipment',
+            name='predicted_hours',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_predictions, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='shipment',
+            index=models.Index(condition=models.Q(('status', 'Delivered')), fields=['client', 'expected_delivery_at', 'delivered_at'], name='shipment_on_time_idx'),
+        ),
+    ]
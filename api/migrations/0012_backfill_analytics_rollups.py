@@ -0,0 +1,54 @@
+from django.db import migrations
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+
+def backfill_rollups(apps, schema_editor):
+    # Same grouped aggregates as api.rollups.rebuild(), on the historical models.
+    User = apps.get_model('api', 'User')
+    Shipment = apps.get_model('api', 'Shipment')
+    ShipmentStatusRollup = apps.get_model('api', 'ShipmentStatusRollup')
+    MonthlyVolumeRollup = apps.get_model('api', 'MonthlyVolumeRollup')
+
+    client_ids = User.objects.order_by('pk').values_list('pk', flat=True)
+    last_pk = 0
+    while True:
+        batch = list(client_ids.filter(pk__gt=last_pk)[:500])
+        if not batch:
+            return
+        shipments = Shipment.objects.filter(client_id__in=batch)
+        statuses = shipments.values('client_id', 'status').annotate(
+            shipment_count=Count('id'), distance_km_total=Sum('distance_km'), distance_count=Count('distance_km'),
+        ).order_by()
+        volumes = shipments.filter(status='Delivered').annotate(month=TruncMonth('created_at')).values(
+            'client_id', 'month', 'product_id',
+        ).annotate(quantity=Sum('quantity')).order_by()
+        ShipmentStatusRollup.objects.filter(client_id__in=batch).delete()
+        MonthlyVolumeRollup.objects.filter(client_id__in=batch).delete()
+        ShipmentStatusRollup.objects.bulk_create([
+            ShipmentStatusRollup(
+                client_id=row['client_id'], status=row['status'], shipment_count=row['shipment_count'],
+                distance_km_total=row['distance_km_total'] or 0, distance_count=row['distance_count'],
+            )
+            for row in statuses.iterator()
+        ])
+        MonthlyVolumeRollup.objects.bulk_create([
+            MonthlyVolumeRollup(
+                client_id=row['client_id'], month=timezone.localtime(row['month']).date(),
+                product_id=row['product_id'], quantity=row['quantity'],
+            )
+            for row in volumes.iterator()
+        ], batch_size=1000)
+        last_pk = batch[-1]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_shipment_numeric_eta'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -24,6 +24,9 @@ class Vehicle(models.Model):
     is_available = models.BooleanField(default=True)
     purchase_date = models.DateField(null=True, blank=True)
     total_km_driven = models.FloatField(default=0)
+    # Last known position, used for nearest-available assignment (api/assignment.py)
+    last_lat = models.FloatField(null=True, blank=True)
+    last_lng = models.FloatField(null=True, blank=True)
 
     def __str__(self):
         return f"{self.name} ({self.license_plate})"
@@ -32,6 +35,8 @@ class DeliveryAgent(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="delivery_agent_profile")
     phone_number = models.CharField(max_length=15)
     is_available = models.BooleanField(default=True)
+    last_lat = models.FloatField(null=True, blank=True)
+    last_lng = models.FloatField(null=True, blank=True)
 
     def __str__(self):
         return self.user.username
@@ -43,10 +48,13 @@ class Shipment(models.Model):
         ('Out for Delivery', 'Out for Delivery'),
         ('Delivered', 'Delivered'),
     ]
+    ACTIVE_STATUSES = ('In Transit', 'Out for Delivery')
 
     client = models.ForeignKey(User, on_delete=models.CASCADE, related_name="shipments")
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField()
+    # True once `quantity` has been taken out of product stock (see api/inventory.py)
+    stock_reserved = models.BooleanField(default=False)
     agent = models.ForeignKey(DeliveryAgent, on_delete=models.SET_NULL, null=True, blank=True)
     vehicle = models.ForeignKey(Vehicle, on_delete=models.SET_NULL, null=True, blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Pending')
@@ -65,10 +73,126 @@ class Shipment(models.Model):
     route_polyline = models.TextField(blank=True, null=True)
     distance_km = models.FloatField(null=True, blank=True)
     predicted_duration = models.CharField(max_length=50, blank=True, null=True)
+    # predicted_duration as a number, refreshed with live ETAs
+    predicted_hours = models.FloatField(null=True, blank=True)
+    # created_at + the duration predicted at enrichment; the on-time KPI compares delivered_at with it
+    expected_delivery_at = models.DateTimeField(null=True, blank=True)
 
     weather_forecast = models.CharField(max_length=100, blank=True, null=True)
     current_lat = models.FloatField(null=True, blank=True)
     current_lng = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of a client's shipments, optionally filtered by status.
+            models.Index(fields=['client', '-created_at', '-id']),
+            models.Index(fields=['client', 'status', '-created_at', '-id']),
+            # On-time delivery rate of a client, answered from the index alone.
+            models.Index(
+                fields=['client', 'expected_delivery_at', 'delivered_at'],
+                condition=models.Q(status='Delivered'), name='shipment_on_time_idx',
+            ),
+        ]
     
     def __str__(self):
         return f"Shipment #{self.id} for {self.client.username}"
+
+class RouteCacheEntry(models.Model):
+    """Persistent tier of the Google Directions cache (see api/routing.py)."""
+    lane_key = models.CharField(max_length=40, unique=True)
+    origin = models.CharField(max_length=255)
+    destination = models.CharField(max_length=255)
+
+    distance_m = models.PositiveIntegerField()
+    distance_text = models.CharField(max_length=50, blank=True)
+    duration_text = models.CharField(max_length=50, blank=True)
+    start_lat = models.FloatField()
+    start_lng = models.FloatField()
+    end_lat = models.FloatField()
+    end_lng = models.FloatField()
+    polyline = models.TextField(blank=True)
+
+    fetched_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.origin} -> {self.destination}"
+
+class WeatherSnapshot(models.Model):
+    """Latest forecast per destination city, shared by all workers (see api/weather.py)."""
+    city_key = models.CharField(max_length=100, unique=True)
+    city = models.CharField(max_length=100)
+    forecast = models.CharField(max_length=100)
+    fetched_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.city}: {self.forecast}"
+
+class EnrichmentJob(models.Model):
+    """Queued route/ETA/weather/assignment work for a Pending shipment (see api/jobs.py)."""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    shipment = models.OneToOneField(Shipment, on_delete=models.CASCADE, related_name='enrichment_job')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    run_after = models.DateTimeField()
+    locked_by = models.CharField(max_length=64, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'run_after'])]
+
+    def __str__(self):
+        return f"Enrichment for shipment #{self.shipment_id} ({self.status})"
+
+class LocationChunk(models.Model):
+    """Compressed, delta-encoded GPS points of one shipment within one time bucket (see api/history.py)."""
+    shipment = models.ForeignKey(Shipment, on_delete=models.CASCADE, related_name='location_chunks')
+    bucket_start = models.DateTimeField()
+    first_at = models.DateTimeField()
+    last_at = models.DateTimeField()
+    point_count = models.PositiveIntegerField()
+    # Seconds between kept points once downsampled; 0 for raw pings
+    resolution = models.PositiveIntegerField(default=0)
+    data = models.BinaryField()
+
+    class Meta:
+        indexes = [models.Index(fields=['shipment', 'bucket_start']), models.Index(fields=['bucket_start'])]
+
+    def __str__(self):
+        return f"{self.point_count} points for shipment #{self.shipment_id} from {self.bucket_start}"
+
+class ShipmentStatusRollup(models.Model):
+    """Per-client shipment count and distance total by status, kept current by api/rollups.py."""
+    client = models.ForeignKey(User, on_delete=models.CASCADE, related_name='status_rollups')
+    status = models.CharField(max_length=20)
+    shipment_count = models.IntegerField(default=0)
+    # Sum and count of the distances that are known, for the average distance
+    distance_km_total = models.FloatField(default=0)
+    distance_count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['client', 'status'], name='unique_status_rollup')]
+
+    def __str__(self):
+        return f"{self.client_id} {self.status}: {self.shipment_count}"
+
+class MonthlyVolumeRollup(models.Model):
+    """Delivered quantity per client, product and month of creation, kept current by api/rollups.py."""
+    client = models.ForeignKey(User, on_delete=models.CASCADE, related_name='volume_rollups')
+    month = models.DateField()  # first day of the month, in TIME_ZONE
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    quantity = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['client', 'month', 'product'], name='unique_volume_rollup')]
+
+    def __str__(self):
+        return f"{self.client_id} {self.month:%Y-%m} product #{self.product_id}: {self.quantity}"
@@ -0,0 +1,26 @@
+"""
+Keyset (cursor) pagination for shipment listings.
+
+DRF's CursorPagination seeks on the first ordering field only: pages are
+fetched with `WHERE created_at < (last seen created_at)` against the
+(client, created_at, id) index instead of a growing OFFSET, so page 500
+costs about the same as page 1. Rows sharing the boundary timestamp are
+skipped with a small offset encoded in the cursor (`id` only makes the order
+deterministic); with microsecond timestamps such ties are rare and short.
+It is opt-in: clients that pass neither `cursor` nor `page_size` still
+receive the plain list.
+"""
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class ShipmentCursorPagination(CursorPagination):
+    ordering = ('-created_at', '-id')
+    page_size = settings.SHIPMENT_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.SHIPMENT_MAX_PAGE_SIZE
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_query_param not in request.query_params and self.page_size_query_param not in request.query_params:
+            return None
+        return super().paginate_queryset(queryset, request, view)
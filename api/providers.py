@@ -0,0 +1,152 @@
+"""
+Shared HTTP client layer for external providers (Google Maps, OpenWeatherMap).
+
+Each provider gets one keep-alive `requests.Session` per process, a per-call
+deadline, a bounded number of retries for transient failures and a circuit
+breaker, so a degraded upstream fails fast instead of pinning gunicorn workers.
+"""
+import threading
+import time
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+
+
+class ProviderError(Exception):
+    """The provider answered, but not with a usable response (e.g. a 4xx)."""
+
+
+class ProviderUnavailable(ProviderError):
+    """The provider timed out, errored, or its circuit is open."""
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls
+    for `reset_timeout` seconds. After that a single trial call is let
+    through (half-open): success closes the circuit, failure re-opens it.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return 'closed'
+        if self._clock() - self._opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        with self._lock:
+            state = self._state()
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = self._clock()
+
+
+class ProviderClient:
+    def __init__(self, name, timeout=5.0, connect_timeout=2.0, retries=2, backoff=0.2,
+                 pool_size=10, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._counters = {'calls': 0, 'failures': 0, 'retries': 0, 'rejected': 0}
+
+    def get_json(self, url, params=None, timeout=None):
+        """
+        GETs `url` and returns the decoded JSON body. `timeout` is an overall
+        deadline in seconds covering every attempt (defaults to the client's).
+        Raises ProviderUnavailable for timeouts, connection errors, 5xx/429
+        and an open circuit, and ProviderError for other non-2xx answers.
+        """
+        if not self.breaker.allow():
+            self._counters['rejected'] += 1
+            raise ProviderUnavailable(f"{self.name}: circuit open")
+
+        self._counters['calls'] += 1
+        deadline = time.monotonic() + (timeout if timeout is not None else self.timeout)
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    raise requests.exceptions.Timeout("deadline exceeded")
+                response = self.session.get(
+                    url, params=params, timeout=(min(self.connect_timeout, remaining), remaining),
+                )
+                if response.status_code in RETRYABLE_STATUSES:
+                    raise requests.exceptions.HTTPError(f"{response.status_code} from upstream", response=response)
+            except requests.exceptions.RequestException as e:
+                wait = self.backoff * (2 ** attempt)
+                if attempt < self.retries and deadline - time.monotonic() > wait:
+                    attempt += 1
+                    self._counters['retries'] += 1
+                    time.sleep(wait)
+                    continue
+                self._counters['failures'] += 1
+                self.breaker.record_failure()
+                raise ProviderUnavailable(f"{self.name}: {e}") from e
+
+            self.breaker.record_success()
+            if not response.ok:
+                raise ProviderError(f"{self.name}: HTTP {response.status_code}")
+            try:
+                return response.json()
+            except ValueError as e:
+                raise ProviderError(f"{self.name}: invalid JSON response") from e
+
+    def stats(self):
+        return dict(self._counters, circuit=self.breaker.state)
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_client(name):
+    """Returns the process-wide client for a provider configured in settings.EXTERNAL_PROVIDERS."""
+    client = _clients.get(name)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(name)
+            if client is None:
+                client = ProviderClient(name, **settings.EXTERNAL_PROVIDERS.get(name, {}))
+                _clients[name] = client
+    return client
@@ -0,0 +1,128 @@
+"""
+Incrementally maintained dashboard rollups.
+
+`ShipmentStatusRollup` holds per-client counts (and distance totals) by
+status; `MonthlyVolumeRollup` holds delivered quantity per client, product
+and month. Every code path that creates, re-statuses, delivers or deletes a
+shipment reports the change with `record(before, after)` inside its own
+transaction, where before/after are `snapshot()`s (None for create/delete).
+Changes made through bulk_create or queryset.update() elsewhere would
+bypass signals, which is why the hooks are explicit.
+
+Migration 0012 fills the tables from existing shipments on deploy;
+`manage.py rebuild_rollups` recomputes everything from the Shipment table in
+chunks of clients, each in its own transaction, to repair drift.
+"""
+from collections import namedtuple
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from . import caching
+from .models import MonthlyVolumeRollup, Shipment, ShipmentStatusRollup, User
+
+Snapshot = namedtuple('Snapshot', 'client_id status distance_km product_id quantity month')
+
+
+def month_of(moment):
+    return timezone.localtime(moment).date().replace(day=1)
+
+def snapshot(shipment):
+    """The rollup-relevant state of a shipment (take it before changing the shipment)."""
+    return Snapshot(
+        shipment.client_id, shipment.status, shipment.distance_km, shipment.product_id,
+        shipment.quantity, month_of(shipment.created_at or timezone.now()),
+    )
+
+
+def _bump(model, keys, **deltas):
+    """Adds `deltas` to the row identified by `keys`, creating it if needed (race-safe)."""
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    increments = {name: F(name) + delta for name, delta in deltas.items()}
+    if model.objects.filter(**keys).update(**increments):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**keys, **deltas)
+    except IntegrityError:  # created concurrently
+        model.objects.filter(**keys).update(**increments)
+
+def record_many(changes):
+    """Applies [(before, after), ...] snapshot pairs, merging deltas per rollup row first."""
+    status_deltas, volume_deltas = {}, {}
+
+    def add_status(state, sign):
+        key = (state.client_id, state.status)
+        count, total, with_distance = status_deltas.get(key, (0, 0.0, 0))
+        known = state.distance_km is not None
+        status_deltas[key] = (count + sign, total + sign * (state.distance_km or 0), with_distance + sign * known)
+
+    def add_volume(state, sign):
+        if state.status == 'Delivered':
+            key = (state.client_id, state.month, state.product_id)
+            volume_deltas[key] = volume_deltas.get(key, 0) + sign * state.quantity
+
+    for before, after in changes:
+        for state, sign in ((before, -1), (after, 1)):
+            if state is not None:
+                add_status(state, sign)
+                add_volume(state, sign)
+
+    caching.shipments_changed(client_id for client_id, _ in status_deltas)
+    for (client_id, status), (count, total, with_distance) in status_deltas.items():
+        _bump(ShipmentStatusRollup, {'client_id': client_id, 'status': status},
+              shipment_count=count, distance_km_total=total, distance_count=with_distance)
+    for (client_id, month, product_id), quantity in volume_deltas.items():
+        _bump(MonthlyVolumeRollup, {'client_id': client_id, 'month': month, 'product_id': product_id}, quantity=quantity)
+
+def record(before, after):
+    record_many([(before, after)])
+
+def created(shipments):
+    record_many([(None, snapshot(shipment)) for shipment in shipments])
+
+
+# --- Backfill ---
+def rebuild(chunk_size=500, clients=None):
+    """
+    Recomputes all rollups from Shipment with grouped aggregates, `chunk_size`
+    clients at a time (or only `clients`). Returns the number of clients done.
+    """
+    client_ids = User.objects.filter(pk__in=clients) if clients is not None else User.objects.all()
+    client_ids = client_ids.order_by('pk').values_list('pk', flat=True)
+    done, last_pk = 0, 0
+    while True:
+        batch = list(client_ids.filter(pk__gt=last_pk)[:chunk_size])
+        if not batch:
+            return done
+        shipments = Shipment.objects.filter(client_id__in=batch)
+        statuses = shipments.values('client_id', 'status').annotate(
+            shipment_count=Count('id'), distance_km_total=Sum('distance_km'), distance_count=Count('distance_km'),
+        ).order_by()
+        volumes = shipments.filter(status='Delivered').annotate(month=TruncMonth('created_at')).values(
+            'client_id', 'month', 'product_id',
+        ).annotate(quantity=Sum('quantity')).order_by()
+        with transaction.atomic():
+            ShipmentStatusRollup.objects.filter(client_id__in=batch).delete()
+            MonthlyVolumeRollup.objects.filter(client_id__in=batch).delete()
+            ShipmentStatusRollup.objects.bulk_create([
+                ShipmentStatusRollup(
+                    client_id=row['client_id'], status=row['status'], shipment_count=row['shipment_count'],
+                    distance_km_total=row['distance_km_total'] or 0, distance_count=row['distance_count'],
+                )
+                for row in statuses.iterator()
+            ])
+            MonthlyVolumeRollup.objects.bulk_create([
+                MonthlyVolumeRollup(
+                    client_id=row['client_id'], month=timezone.localtime(row['month']).date(),
+                    product_id=row['product_id'], quantity=row['quantity'],
+                )
+                for row in volumes.iterator()
+            ], batch_size=1000)
+        caching.shipments_changed(batch)
+        done += len(batch)
+        last_pk = batch[-1]
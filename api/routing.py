@@ -0,0 +1,181 @@
+"""
+Google Directions lookups behind a two-tier route cache.
+
+Dispatchers reuse the same warehouse -> customer lanes all day, so routes are
+cached on the normalized (origin, destination) pair: an in-process LRU sits in
+front of the `RouteCacheEntry` table, and both tiers expire entries after
+`settings.ROUTE_CACHE_TTL`.
+"""
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import providers
+from .models import RouteCacheEntry
+
+DIRECTIONS_URL = "https://maps.googleapis.com/maps/api/directions/json"
+# Expired/overflow rows are purged once every this many cache writes.
+PURGE_EVERY = 100
+
+ROUTE_FIELDS = (
+    'distance_m', 'distance_text', 'duration_text',
+    'start_lat', 'start_lng', 'end_lat', 'end_lng', 'polyline',
+)
+
+
+class RouteLookupError(Exception):
+    """Raised when Google could not produce a route; the message is user-facing."""
+
+
+def normalize_address(address):
+    return re.sub(r'\s+', ' ', address or '').strip(' ,.').lower()
+
+def lane_key(origin, destination):
+    lane = f"{normalize_address(origin)}\n{normalize_address(destination)}"
+    return hashlib.sha1(lane.encode()).hexdigest()
+
+
+class RouteCache:
+    """In-process LRU in front of the RouteCacheEntry table, with hit/miss counters."""
+
+    def __init__(self, max_entries=None, ttl=None, max_rows=None):
+        self.max_entries = max_entries or settings.ROUTE_CACHE_MEMORY_SIZE
+        self.ttl = ttl or settings.ROUTE_CACHE_TTL
+        self.max_rows = max_rows or settings.ROUTE_CACHE_MAX_ROWS
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._writes = 0
+        self._counters = {'memory_hits': 0, 'db_hits': 0, 'misses': 0, 'expired': 0, 'evictions': 0, 'purged': 0}
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def _remember(self, key, route, fetched_at):
+        with self._lock:
+            self._entries[key] = (route, fetched_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters['evictions'] += 1
+
+    def get(self, key):
+        now = timezone.now()
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached and now - cached[1] < self.ttl:
+                self._entries.move_to_end(key)
+                self._counters['memory_hits'] += 1
+                return cached[0]
+            if cached:
+                del self._entries[key]
+                self._counters['expired'] += 1
+
+        entry = RouteCacheEntry.objects.filter(lane_key=key, fetched_at__gt=now - self.ttl).first()
+        if entry is None:
+            self._count('misses')
+            return None
+        route = {field: getattr(entry, field) for field in ROUTE_FIELDS}
+        self._remember(key, route, entry.fetched_at)
+        self._count('db_hits')
+        return route
+
+    def set(self, key, origin, destination, route):
+        fetched_at = timezone.now()
+        RouteCacheEntry.objects.update_or_create(
+            lane_key=key,
+            defaults={'origin': origin[:255], 'destination': destination[:255], 'fetched_at': fetched_at, **route},
+        )
+        self._remember(key, route, fetched_at)
+        with self._lock:
+            self._writes += 1
+            due = self._writes % PURGE_EVERY == 0
+        if due:
+            self.purge()
+
+    def purge(self):
+        """Deletes expired rows and trims the table to `max_rows`, oldest first."""
+        deleted, _ = RouteCacheEntry.objects.filter(fetched_at__lte=timezone.now() - self.ttl).delete()
+        overflow_ids = list(
+            RouteCacheEntry.objects.order_by('-fetched_at').values_list('id', flat=True)[self.max_rows:]
+        )
+        if overflow_ids:
+            deleted += RouteCacheEntry.objects.filter(id__in=overflow_ids).delete()[0]
+        self._count('purged', deleted)
+        return deleted
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            for name in self._counters:
+                self._counters[name] = 0
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters, memory_entries=len(self._entries))
+        lookups = stats['memory_hits'] + stats['db_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['memory_hits'] + stats['db_hits']) / lookups if lookups else 0.0
+        return stats
+
+
+route_cache = RouteCache()
+
+
+def get_google_maps_route(origin_address, destination_address):
+    """Raw Directions API call; returns the decoded JSON or None on transport errors."""
+    params = { "origin": origin_address, "destination": destination_address, "key": settings.GOOGLE_MAPS_API_KEY }
+    try:
+        return providers.get_client('google_maps').get_json(DIRECTIONS_URL, params=params)
+    except providers.ProviderError as e:
+        print(f"Error calling Google Maps API: {e}")
+        return None
+
+def route_from_directions(google_response):
+    """Flattens the first leg of a Directions response into the cached route fields."""
+    route = google_response['routes'][0]
+    legs = route['legs'][0]
+    return {
+        'distance_m': legs['distance']['value'],
+        'distance_text': legs['distance']['text'],
+        'duration_text': legs['duration']['text'],
+        'start_lat': legs['start_location']['lat'],
+        'start_lng': legs['start_location']['lng'],
+        'end_lat': legs['end_location']['lat'],
+        'end_lng': legs['end_location']['lng'],
+        'polyline': route['overview_polyline']['points'],
+    }
+
+def fetch_route(origin_address, destination_address):
+    """
+    Calls Google for a lane without touching the cache or the database, so it
+    is safe to run on a worker thread. Raises RouteLookupError on failure.
+    """
+    google_response = get_google_maps_route(origin_address, destination_address)
+    if not google_response:
+        raise RouteLookupError("Google Maps Error: UNAVAILABLE. Could not calculate route.")
+    if google_response.get('status') != 'OK':
+        error_message = google_response.get('error_message', 'Could not calculate route.')
+        raise RouteLookupError(f"Google Maps Error: {google_response.get('status')}. {error_message}")
+    return route_from_directions(google_response)
+
+def cached_route(origin_address, destination_address):
+    return route_cache.get(lane_key(origin_address, destination_address))
+
+def store_route(origin_address, destination_address, route):
+    route_cache.set(lane_key(origin_address, destination_address), origin_address, destination_address, route)
+
+def get_route(origin_address, destination_address):
+    """
+    Returns the route fields for a lane, from cache when possible.
+    Raises RouteLookupError if Google cannot route it; failures are not cached.
+    """
+    route = cached_route(origin_address, destination_address)
+    if route is not None:
+        return route
+    route = fetch_route(origin_address, destination_address)
+    store_route(origin_address, destination_address, route)
+    return route
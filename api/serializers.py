@@ -1,7 +1,91 @@
+from collections import defaultdict
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
 from .models import User, Product, Vehicle, DeliveryAgent, Shipment
 
 
+# --- Query planning ---
+def _plan(serializer, model, prefix, related, columns):
+    columns.append(prefix + model._meta.pk.name)
+    for field in serializer.fields.values():
+        if field.write_only or field.source == '*':
+            continue
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            continue  # SerializerMethodFields and properties read declared columns
+        if not model_field.concrete or model_field.primary_key:
+            continue
+        columns.append(prefix + model_field.name)
+        if isinstance(field, serializers.ModelSerializer) and (model_field.many_to_one or model_field.one_to_one):
+            related.append(prefix + model_field.name)
+            _plan(field, model_field.related_model, f"{prefix}{model_field.name}__", related, columns)
+
+class EagerLoadingMixin:
+    """
+    Lets a ModelSerializer plan its own queryset: every nested
+    ModelSerializer on a forward relation becomes a select_related() join
+    and only() is limited to the columns the serializers render, so
+    listing N objects costs one query instead of one per related row.
+    """
+    @classmethod
+    def query_plan(cls, context=None):
+        """
+        (select_related paths, only() fields) derived from the fields the
+        serializer would render with `context` (which may narrow them, see
+        SparseFieldsMixin).
+        """
+        related, columns = [], []
+        _plan(cls(context=context or {}), cls.Meta.model, '', related, columns)
+        return related, columns
+
+    @classmethod
+    def setup_eager_loading(cls, queryset, context=None):
+        related, columns = cls.query_plan(context)
+        if related:  # a bare select_related() would follow every non-null foreign key
+            queryset = queryset.select_related(*related)
+        return queryset.only(*columns)
+
+def _query_list(request, name):
+    raw = request.query_params.get(name) if request is not None else None
+    return {part.strip() for part in raw.split(',') if part.strip()} if raw else None
+
+class SparseFieldsMixin:
+    """
+    Request-driven field selection:
+
+    * ?view=lite    - nested relations in Meta.expandable_fields become plain
+                      ids and Meta.lite_exclude fields (bulky text) are dropped;
+    * ?expand=a,b   - in lite view, render those relations nested after all;
+    * ?fields=a,b   - render only these fields (write-only fields are kept).
+
+    Combined with EagerLoadingMixin the query narrows to the same columns.
+    Writes (POST/PUT/PATCH) always use the full field set, so validation
+    never loses a field to a stray query parameter.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None or not hasattr(request, 'query_params') or request.method not in SAFE_METHODS:
+            return
+        wanted = _query_list(request, 'fields')
+
+        if request.query_params.get('view') == 'lite':
+            expand = _query_list(request, 'expand') or set()
+            for name in getattr(self.Meta, 'expandable_fields', ()):
+                if name in self.fields and name not in expand:
+                    self.fields[name] = serializers.PrimaryKeyRelatedField(read_only=True)
+            for name in getattr(self.Meta, 'lite_exclude', ()):
+                if not wanted or name not in wanted:
+                    self.fields.pop(name, None)
+
+        if wanted:
+            for name in [name for name, field in self.fields.items() if not field.write_only and name not in wanted]:
+                self.fields.pop(name)
+
+
 class UserSerializer(serializers.ModelSerializer):
     avatar_url = serializers.SerializerMethodField()
 
@@ -58,7 +142,7 @@ class DeliveryAgentSerializer(serializers.ModelSerializer):
         model = DeliveryAgent
         fields = '__all__'
 
-class ShipmentSerializer(serializers.ModelSerializer):
+class ShipmentSerializer(SparseFieldsMixin, EagerLoadingMixin, serializers.ModelSerializer):
     client = UserSerializer(read_only=True)
     agent = DeliveryAgentSerializer(read_only=True)
     vehicle = VehicleSerializer(read_only=True)
@@ -75,11 +159,61 @@ class ShipmentSerializer(serializers.ModelSerializer):
             'vehicle', 'status', 'created_at', 'delivered_at', 'start_address', 
             'end_address', 'start_location_lat', 'start_location_lng', 
             'end_location_lat', 'end_location_lng', 'route_polyline',
-            'distance_km', 'predicted_duration','weather_forecast','current_lat', 'current_lng'
+            'distance_km', 'predicted_duration', 'predicted_hours', 'expected_delivery_at',
+            'weather_forecast','current_lat', 'current_lng'
 
         ]
         read_only_fields = ('client', 'agent', 'vehicle', 'status', 'created_at', 'delivered_at', 'start_location_lat', 'start_location_lng', 'end_location_lat', 'end_location_lng', 'route_polyline',
-                            'distance_km', 'predicted_duration',
+                            'distance_km', 'predicted_duration', 'predicted_hours', 'expected_delivery_at',
                             'weather_forecast','current_lat', 'current_lng'
             )
+        expandable_fields = ('client', 'product', 'agent', 'vehicle')
+        lite_exclude = ('route_polyline',)
+
+
+
+class BulkShipmentItemSerializer(serializers.Serializer):
+    product_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1)
+    start_address = serializers.CharField(max_length=255)
+    end_address = serializers.CharField(max_length=255)
+
+class BulkShipmentSerializer(serializers.Serializer):
+    shipments = BulkShipmentItemSerializer(many=True, allow_empty=False, max_length=settings.BULK_SHIPMENT_MAX_ITEMS)
+
+    def validate_shipments(self, items):
+        """
+        Loads every referenced product in one query and checks that the stock
+        covers the total quantity requested per product across the batch.
+        """
+        products = Product.objects.in_bulk({item['product_id'] for item in items})
+        requested = defaultdict(int)
+        errors = [{} for _ in items]
+        for index, item in enumerate(items):
+            product = products.get(item['product_id'])
+            if product is None:
+                errors[index] = {'product_id': [f"Invalid pk \"{item['product_id']}\" - object does not exist."]}
+                continue
+            item['product'] = product
+            requested[product.id] += item['quantity']
+
+        for index, item in enumerate(items):
+            product = item.get('product')
+            if product and product.stock < requested[product.id]:
+                errors[index] = {'quantity': [
+                    f"Out of stock. Only {product.stock} units available for {product.name} "
+                    f"({requested[product.id]} requested in this batch)."
+                ]}
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return items
+
+
+class LocationPointSerializer(serializers.Serializer):
+    shipment_id = serializers.IntegerField()
+    lat = serializers.FloatField(min_value=-90, max_value=90)
+    lng = serializers.FloatField(min_value=-180, max_value=180)
+    ts = serializers.DateTimeField(required=False)
 
+class LocationBatchSerializer(serializers.Serializer):
+    points = LocationPointSerializer(many=True, allow_empty=False, max_length=settings.LOCATION_BATCH_MAX_POINTS)
@@ -0,0 +1,31 @@
+"""Model signal handlers; connected when the app is ready (see ApiConfig.ready)."""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import assignment, caching
+from .models import DeliveryAgent, Product, Shipment, Vehicle
+
+
+@receiver(post_save, sender=Vehicle)
+@receiver(post_save, sender=DeliveryAgent)
+def update_assignment_index(sender, instance, **kwargs):
+    assignment.resource_changed(instance)
+
+
+# --- Response cache invalidation (see api/caching.py) ---
+@receiver(post_save, sender=Shipment)
+@receiver(post_delete, sender=Shipment)
+def invalidate_shipment_responses(sender, instance, **kwargs):
+    caching.shipments_changed([instance.client_id])
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_responses(sender, instance, **kwargs):
+    caching.invalidate('products')
+
+@receiver(post_save, sender=Vehicle)
+@receiver(post_delete, sender=Vehicle)
+@receiver(post_save, sender=DeliveryAgent)
+@receiver(post_delete, sender=DeliveryAgent)
+def invalidate_fleet_responses(sender, instance, **kwargs):
+    caching.invalidate('vehicles')
@@ -1,3 +1,1142 @@
-from django.test import TestCase
+import asyncio
+import os
+import json
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from importlib import import_module
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import (
+    assignment, enrichment, eta, geo, history, inventory, jobs, live, providers, rollups, routing, tracking, training, utils,
+    weather,
+)
+from .models import (
+    User, Product, Vehicle, DeliveryAgent, Shipment, RouteCacheEntry, WeatherSnapshot, EnrichmentJob, LocationChunk,
+    ShipmentStatusRollup, MonthlyVolumeRollup,
+)
+
+
+class ModelRegistryTests(TestCase):
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+        self.addCleanup(os.remove, self.path)
+        self.registry = utils.ModelRegistry(self.path)
+
+    def _write_models(self, intercept, mtime):
+        utils.write_coefficients(self.path, {
+            utils.DELIVERY_TIME_MODEL: ('polynomial', intercept, [0.5, 0.01]),
+            utils.MAINTENANCE_COST_MODEL: ('linear', intercept, [10, 0.001]),
+        })
+        os.utime(self.path, (mtime, mtime))
+
+    def test_models_are_loaded_once_per_process(self):
+        self._write_models(1.0, mtime=1_000_000)
+        for _ in range(5):
+            self.assertAlmostEqual(self.registry.predict(utils.DELIVERY_TIME_MODEL, 10), 1.0 + 5 + 1)
+        self.assertAlmostEqual(self.registry.predict(utils.MAINTENANCE_COST_MODEL, 2, 1000), 1.0 + 20 + 1)
+
+        stats = self.registry.stats()
+        self.assertEqual(stats['loads'], 1)
+        self.assertEqual(stats['models'][utils.DELIVERY_TIME_MODEL]['predictions'], 5)
+
+    def test_models_are_reloaded_when_file_changes(self):
+        self._write_models(1.0, mtime=1_000_000)
+        self.registry.get(utils.DELIVERY_TIME_MODEL)
+        self._write_models(2.0, mtime=1_000_100)
+
+        self.assertAlmostEqual(self.registry.predict(utils.DELIVERY_TIME_MODEL, 0), 2.0)
+        self.assertEqual(self.registry.stats()['loads'], 2)
+
+    def test_missing_file_returns_none(self):
+        registry = utils.ModelRegistry(self.path + '.missing')
+        self.assertIsNone(registry.predict(utils.DELIVERY_TIME_MODEL, 10))
+
+
+class HistoryTrainingTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'model_coefficients.json')
+        for name, value in (('COEFFICIENTS_PATH', self.path), ('VERSIONS_DIR', os.path.join(directory, 'versions'))):
+            patcher = mock.patch.object(utils, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        utils.write_coefficients(self.path, {utils.MAINTENANCE_COST_MODEL: ('linear', 155.5, [-20.4, 0.008])})
+        self.user = User.objects.create_user(email='client@example.com', username='client', password='pw')
+        self.product = Product.objects.create(name='Widget', sku='W-1', stock=100)
+
+    def _deliveries(self, distances, hours):
+        placed = timezone.now() - timedelta(days=30)
+        Shipment.objects.bulk_create([
+            Shipment(
+                client=self.user, product=self.product, quantity=1, start_address='A', end_address='B',
+                status='Delivered', distance_km=distance, delivered_at=placed + timedelta(hours=hours(distance)),
+            )
+            for distance in distances
+        ])
+        Shipment.objects.update(created_at=placed)
+
+    def test_fit_streams_history_and_recovers_the_curve(self):
+        self._deliveries(range(20, 320), lambda d: 0.3 + 0.02 * d + 0.00005 * d * d)
+        self._deliveries([5, 10], lambda d: 40)  # short trips are not part of the model
+        out = StringIO()
+        call_command('train_models', '--from-history', '--chunk-size', '64', stdout=out)
+
+        specs = utils.read_model_specs(self.path)
+        kind, intercept, coefficients = specs[utils.DELIVERY_TIME_MODEL]
+        self.assertEqual(kind, 'polynomial')
+        self.assertAlmostEqual(intercept, 0.3, places=4)
+        self.assertAlmostEqual(coefficients[0], 0.02, places=6)
+        self.assertAlmostEqual(coefficients[1], 0.00005, places=8)
+        self.assertEqual(specs[utils.MAINTENANCE_COST_MODEL], ('linear', 155.5, [-20.4, 0.008]))  # kept
+
+        with open(self.path) as f:
+            metrics = json.load(f)['training'][utils.DELIVERY_TIME_MODEL]
+        self.assertEqual((metrics['scanned'], metrics['train']['rows'], metrics['holdout']['rows']), (300, 270, 30))
+        self.assertAlmostEqual(metrics['holdout']['rmse'], 0, places=4)
+        self.assertAlmostEqual(metrics['train']['r2'], 1, places=6)
+        self.assertIn('holdout: rows=30', out.getvalue())
+        self.assertEqual(len(os.listdir(utils.VERSIONS_DIR)), 1)
+
+    @override_settings(MODEL_TRAINING_MIN_ROWS=100)
+    def test_too_little_history_publishes_nothing(self):
+        self._deliveries(range(20, 60), lambda d: d / 40)
+        with self.assertRaises(training.NotEnoughHistory):
+            training.retrain_from_history()
+        self.assertNotIn(utils.DELIVERY_TIME_MODEL, utils.read_model_specs(self.path))
+
+
+class InferenceImportTests(TestCase):
+    def test_request_path_does_not_import_training_stack(self):
+        code = (
+            "import sys, django; django.setup(); import api.views; "
+            "print('loaded:' + ','.join(m for m in ('sklearn', 'bs4', 'numpy') if m in sys.modules))"
+        )
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE='logiflow_backend.settings', RUN_MAIN='true')
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, env=env, check=True)
+        self.assertEqual(result.stdout.strip().splitlines()[-1], 'loaded:')
+
+
+class BatchPredictionTests(TestCase):
+    def test_delivery_time_batch_matches_scalar(self):
+        distances = [0, 5, 19.9, 20, 75, 210]
+        batch = utils.predict_delivery_time_batch(distances)
+        for distance, predicted in zip(distances, batch):
+            self.assertAlmostEqual(predicted, utils.predict_delivery_time(distance))
+
+    def test_maintenance_cost_batch_matches_scalar(self):
+        ages, mileages = [1, 3, 6, 2], [5000, 45000, 120000, 9999]
+        batch = utils.predict_maintenance_cost_batch(ages, mileages)
+        for age, mileage, predicted in zip(ages, mileages, batch):
+            self.assertAlmostEqual(predicted, utils.predict_maintenance_cost(age, mileage))
+
+    def test_empty_batch(self):
+        self.assertEqual(len(utils.predict_delivery_time_batch([])), 0)
+
+
+class ShipmentEtaEndpointTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='client@example.com', username='client', password='pw')
+        self.product = Product.objects.create(name='Widget', sku='W-1', stock=100)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _shipment(self, status, distance_km, client=None):
+        return Shipment.objects.create(
+            client=client or self.user, product=self.product, quantity=1, status=status,
+            start_address='A', end_address='B', distance_km=distance_km,
+        )
+
+    def test_returns_only_active_shipments_of_the_client(self):
+        in_transit = self._shipment('In Transit', 50)
+        out_for_delivery = self._shipment('Out for Delivery', 10)
+        self._shipment('Delivered', 30)
+        other = User.objects.create_user(email='other@example.com', username='other', password='pw')
+        self._shipment('In Transit', 40, client=other)
+
+        response = self.client.get('/api/shipments/etas/')
+
+        self.assertEqual(response.status_code, 200)
+        by_id = {row['id']: row for row in response.data}
+        self.assertEqual(set(by_id), {in_transit.id, out_for_delivery.id})
+        self.assertAlmostEqual(by_id[out_for_delivery.id]['predicted_hours'], round(10 / 30.0 + 0.17, 2))
+
+    def test_requires_authentication(self):
+        self.assertEqual(APIClient().get('/api/shipments/etas/').status_code, 401)
+
+    def test_eta_follows_progress_along_the_route(self):
+        eta.geometry_cache.clear()
+        self.addCleanup(eta.geometry_cache.clear)
+        road = [(18.0 + i * 0.01, 73.0) for i in range(101)]  # ~110 km due north
+        shipment = self._shipment('In Transit', 120)
+        Shipment.objects.filter(pk=shipment.pk).update(
+            route_polyline=geo.encode_polyline(road), current_lat=18.75, current_lng=73.02,  # 3/4 along, off to the side
+        )
+
+        row = self.client.get('/api/shipments/etas/').data[0]
+        self.assertAlmostEqual(row['remaining_km'], 30, delta=0.5)
+        self.assertAlmostEqual(row['predicted_hours'], round(utils.predict_delivery_time(row['remaining_km']), 2), delta=0.01)
+
+        with mock.patch.object(tracking.location_buffer, 'interval', 0):
+            with self.assertNumQueries(5):  # ownership check, then flush: savepoint, bulk_update, history, release
+                tracking.ingest(self.user, [{'shipment_id': shipment.id, 'lat': 18.9, 'lng': 73.0}])
+        self.assertEqual(Shipment.objects.get(pk=shipment.pk).predicted_duration, eta.format_hours(utils.predict_delivery_time(12)))
+
+
+DIRECTIONS_OK = {
+    'status': 'OK',
+    'routes': [{
+        'overview_polyline': {'points': '_p~iF~ps|U_ulLnnqC_mqNvxq`@'},
+        'legs': [{
+            'distance': {'value': 42000, 'text': '42 km'},
+            'duration': {'value': 3600, 'text': '1 hour'},
+            'start_location': {'lat': 38.5, 'lng': -120.2},
+            'end_location': {'lat': 43.252, 'lng': -126.453},
+        }],
+    }],
+}
+
+
+class RouteCacheTests(TestCase):
+    def setUp(self):
+        routing.route_cache.clear()
+        self.addCleanup(routing.route_cache.clear)
+        patcher = mock.patch.object(routing, 'get_google_maps_route', return_value=DIRECTIONS_OK)
+        self.fetch = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_repeated_lane_is_served_from_memory(self):
+        first = routing.get_route('Warehouse 1, Pune', 'Customer St, Mumbai')
+        second = routing.get_route('  warehouse 1,   PUNE ', 'customer st, mumbai.')
+
+        self.assertEqual(first, second)
+        self.assertEqual(first['distance_m'], 42000)
+        self.assertEqual(self.fetch.call_count, 1)
+        self.assertEqual(routing.route_cache.stats()['memory_hits'], 1)
+
+    def test_database_tier_survives_process_cache_loss(self):
+        routing.get_route('A', 'B')
+        routing.route_cache.clear()
+
+        route = routing.get_route('A', 'B')
+
+        self.assertEqual(route['polyline'], DIRECTIONS_OK['routes'][0]['overview_polyline']['points'])
+        self.assertEqual(self.fetch.call_count, 1)
+        self.assertEqual(routing.route_cache.stats()['db_hits'], 1)
+
+    def test_expired_entries_are_refetched_and_purged(self):
+        routing.get_route('A', 'B')
+        routing.route_cache.clear()
+        RouteCacheEntry.objects.update(fetched_at=timezone.now() - routing.route_cache.ttl - timedelta(minutes=1))
+
+        self.assertEqual(routing.route_cache.purge(), 1)
+        self.assertEqual(routing.route_cache.stats()['purged'], 1)
+        self.assertEqual(routing.route_cache.stats()['evictions'], 0)  # in-memory LRU only
+        routing.get_route('A', 'B')
+        self.assertEqual(self.fetch.call_count, 2)
+
+    def test_failed_lookups_are_not_cached(self):
+        self.fetch.return_value = {'status': 'ZERO_RESULTS'}
+        with self.assertRaises(routing.RouteLookupError):
+            routing.get_route('A', 'Nowhere')
+        self.assertFalse(RouteCacheEntry.objects.exists())
+
+
+class _StubProviderHandler(BaseHTTPRequestHandler):
+    """/ok answers JSON, /flaky fails with 503 until `failures_left` runs out, /slow sleeps."""
+
+    def do_GET(self):
+        server = self.server
+        server.hits += 1
+        if self.path.startswith('/slow'):
+            time.sleep(0.5)
+        if self.path.startswith('/flaky') and server.failures_left > 0:
+            server.failures_left -= 1
+            self.send_response(503)
+            self.end_headers()
+            return
+        if self.path.startswith('/missing'):
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = json.dumps({'ok': True}).encode()
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client gave up (deadline tests)
+
+    def log_message(self, *args):
+        pass
+
+
+class ProviderClientTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), _StubProviderHandler)
+        cls.server.daemon_threads = True
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_address[1]}"
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.server.hits = 0
+        self.server.failures_left = 0
+        self.client = providers.ProviderClient(
+            'stub', timeout=1.0, retries=2, backoff=0.01, failure_threshold=2, reset_timeout=60,
+        )
+
+    def test_returns_json_over_a_pooled_session(self):
+        self.assertEqual(self.client.get_json(f"{self.base_url}/ok"), {'ok': True})
+        self.assertEqual(self.client.get_json(f"{self.base_url}/ok"), {'ok': True})
+        self.assertEqual(self.client.stats()['calls'], 2)
+
+    def test_transient_failures_are_retried(self):
+        self.server.failures_left = 2
+        self.assertEqual(self.client.get_json(f"{self.base_url}/flaky"), {'ok': True})
+        self.assertEqual(self.server.hits, 3)
+        self.assertEqual(self.client.breaker.state, 'closed')
+
+    def test_deadline_bounds_slow_upstream(self):
+        started = time.monotonic()
+        with self.assertRaises(providers.ProviderUnavailable):
+            self.client.get_json(f"{self.base_url}/slow", timeout=0.2)
+        self.assertLess(time.monotonic() - started, 0.45)
+
+    def test_client_errors_do_not_trip_the_breaker(self):
+        for _ in range(3):
+            with self.assertRaises(providers.ProviderError):
+                self.client.get_json(f"{self.base_url}/missing")
+        self.assertEqual(self.client.breaker.state, 'closed')
+
+    def test_circuit_opens_and_fails_fast(self):
+        self.server.failures_left = 100
+        for _ in range(2):
+            with self.assertRaises(providers.ProviderUnavailable):
+                self.client.get_json(f"{self.base_url}/flaky")
+        hits = self.server.hits
+
+        with self.assertRaises(providers.ProviderUnavailable):
+            self.client.get_json(f"{self.base_url}/ok")
+        self.assertEqual(self.server.hits, hits)
+        self.assertEqual(self.client.breaker.state, 'open')
+
+    def test_half_open_trial_closes_the_circuit(self):
+        now = [0.0]
+        breaker = providers.CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=lambda: now[0])
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+
+        now[0] = 10.0
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, 'closed')
+
+
+class WeatherCacheTests(TestCase):
+    def setUp(self):
+        self.cache = weather.WeatherCache(ttl=timedelta(minutes=30), max_stale=timedelta(hours=1), workers=1)
+        patcher = mock.patch.object(self.cache, 'schedule_refresh')
+        self.schedule_refresh = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _snapshot(self, age):
+        WeatherSnapshot.objects.create(
+            city_key='pune', city='Pune', forecast='28°C, Clear Sky', fetched_at=timezone.now() - age,
+        )
+
+    def test_fresh_entry_is_served_without_refresh(self):
+        self._snapshot(timedelta(minutes=5))
+        self.assertEqual(self.cache.get(' PUNE '), '28°C, Clear Sky')
+        self.schedule_refresh.assert_not_called()
+
+    def test_stale_entry_is_served_while_revalidating(self):
+        self._snapshot(timedelta(minutes=45))
+        self.assertEqual(self.cache.get('Pune'), '28°C, Clear Sky')
+        self.schedule_refresh.assert_called_once_with('Pune')
+        self.assertEqual(self.cache.stats()['stale_hits'], 1)
+
+    def test_miss_never_blocks_on_the_api(self):
+        with mock.patch.object(utils, 'fetch_weather_forecast') as fetch:
+            self.assertIsNone(self.cache.get('Nagpur'))
+        fetch.assert_not_called()
+        self.schedule_refresh.assert_called_once_with('Nagpur')
+
+    def test_refresh_stores_snapshot(self):
+        with mock.patch.object(utils, 'fetch_weather_forecast', return_value='31°C, Haze'):
+            self.assertEqual(self.cache.refresh('Nagpur'), '31°C, Haze')
+        self.assertEqual(WeatherSnapshot.objects.get(city_key='nagpur').forecast, '31°C, Haze')
+        self.assertEqual(self.cache.get('nagpur'), '31°C, Haze')
+
+
+
+ROUTE = routing.route_from_directions(DIRECTIONS_OK)
+
+
+def _slow(value, delay):
+    def call(*args):
+        time.sleep(delay)
+        return value
+    return call
+
+
+@override_settings(WEATHER_API_KEY='test-key')
+class EnrichmentTests(TestCase):
+    def setUp(self):
+        routing.route_cache.clear()
+        weather.weather_cache.clear()
+        self.addCleanup(routing.route_cache.clear)
+        self.addCleanup(weather.weather_cache.clear)
+
+    def test_weather_miss_never_waits(self):
+        with mock.patch.object(routing, 'fetch_route', _slow(ROUTE, 0.3)), \
+                mock.patch.object(weather, 'fetch_forecast', _slow('30°C, Clear Sky', 0.5)):
+            started = time.monotonic()
+            enriched = enrichment.enrich('Warehouse, Pune, India', 'Client Rd, Mumbai, India', timeout=2)
+            elapsed = time.monotonic() - started
+
+        self.assertLess(elapsed, 0.45)
+        self.assertEqual(enriched['distance_km'], 42.0)
+        self.assertEqual(enriched['weather_forecast'], weather.FORECAST_PENDING)  # filled after commit by the caller
+        self.assertEqual(enriched['destination_city'], 'Mumbai')
+        self.assertTrue(RouteCacheEntry.objects.exists())
+        self.assertFalse(WeatherSnapshot.objects.exists())
+
+    def test_cached_weather_is_used(self):
+        weather.weather_cache.store('Mumbai', '30°C, Clear Sky')
+        with mock.patch.object(routing, 'fetch_route', _slow(ROUTE, 0)), \
+                mock.patch.object(weather, 'fetch_forecast') as fetch:
+            enriched = enrichment.enrich('Warehouse, Pune, India', 'Client Rd, Mumbai, India', timeout=0.5)
+        self.assertEqual(enriched['weather_forecast'], '30°C, Clear Sky')
+        fetch.assert_not_called()
+
+    def test_route_deadline_raises(self):
+        with mock.patch.object(routing, 'fetch_route', _slow(ROUTE, 0.5)), \
+                mock.patch.object(weather, 'fetch_forecast', return_value='30°C, Clear Sky'):
+            with self.assertRaises(routing.RouteLookupError):
+                enrichment.enrich('A', 'B', timeout=0.1)
+
+
+@override_settings(WEATHER_API_KEY='test-key')
+class ShipmentCreationTests(TestCase):
+    def setUp(self):
+        routing.route_cache.clear()
+        weather.weather_cache.clear()
+        self.user = User.objects.create_user(email='client@example.com', username='client', password='pw')
+        self.product = Product.objects.create(name='Widget', sku='W-1', stock=100)
+        driver = User.objects.create_user(email='driver@example.com', username='driver', password='pw')
+        self.agent = DeliveryAgent.objects.create(user=driver, phone_number='123')
+        self.vehicle = Vehicle.objects.create(name='Truck', license_plate='MH-01')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        for target, value in ((routing, ('fetch_route', ROUTE)), (weather, ('fetch_forecast', '30°C, Clear Sky'))):
+            patcher = mock.patch.object(target, value[0], return_value=value[1])
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _create(self):
+        return self.client.post('/api/shipments/', {
+            'product_id': self.product.id, 'quantity': 2,
+            'start_address': 'Warehouse, Pune, India', 'end_address': 'Client Rd, Mumbai, India',
+        }, format='json')
+
+    def test_sync_creation_enriches_inline(self):
+        response = self._create()
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['status'], 'In Transit')
+        self.assertEqual(response.data['distance_km'], 42.0)
+        self.assertEqual(response.data['weather_forecast'], weather.FORECAST_PENDING)  # filled in after commit
+        self.vehicle.refresh_from_db()
+        self.assertFalse(self.vehicle.is_available)
+
+    def test_sparse_fields_do_not_apply_to_writes(self):
+        order = {'product_id': self.product.id, 'quantity': 2, 'start_address': 'Warehouse, Pune, India', 'end_address': 'Client Rd, Mumbai, India'}
+        response = self.client.post('/api/shipments/?fields=id&view=lite', order, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['quantity'], 2)
+
+        del order['start_address']
+        response = self.client.post('/api/shipments/?fields=id', order, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('start_address', response.data)
+
+    def test_sync_creation_without_resources_is_rejected(self):
+        Vehicle.objects.update(is_available=False)
+        self.assertEqual(self._create().status_code, 400)
+        self.assertFalse(Shipment.objects.exists())
+        self.agent.refresh_from_db()
+        self.assertTrue(self.agent.is_available)  # the half-claimed pair was rolled back
+
+    def test_stock_is_reserved_at_creation_and_not_consumed_again(self):
+        shipment_id = self._create().data['id']
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 98)
+
+        for _ in range(2):
+            self.assertEqual(self.client.post(f'/api/shipments/{shipment_id}/deliver/').status_code, 200)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 98)
+        self.vehicle.refresh_from_db()
+        self.assertEqual(self.vehicle.total_km_driven, 42)
+        self.assertTrue(self.vehicle.is_available)
+
+    def _rollups(self):
+        statuses = ShipmentStatusRollup.objects.exclude(shipment_count=0)
+        volumes = MonthlyVolumeRollup.objects.exclude(quantity=0)
+        return (
+            sorted(statuses.values_list('client_id', 'status', 'shipment_count', 'distance_km_total', 'distance_count')),
+            sorted(volumes.values_list('client_id', 'month', 'product_id', 'quantity')),
+        )
+
+    def test_rollups_follow_every_write_path(self):
+        delivered_id = self._create().data['id']
+        with override_settings(SHIPMENT_ENRICHMENT_ASYNC=True):
+            pending_id = self._create().data['id']
+            deleted_id = self._create().data['id']
+        self.client.post(f'/api/shipments/{delivered_id}/update_status/', {'status': 'Out for Delivery'}, format='json')
+        self.client.post(f'/api/shipments/{delivered_id}/deliver/')
+        self.client.delete(f'/api/shipments/{deleted_id}/')
+        incremental = self._rollups()
+
+        statuses, volumes = incremental
+        self.assertEqual([row[1:3] for row in statuses], [('Delivered', 1), ('Pending', 1)])
+        self.assertEqual([row[2:] for row in volumes], [(self.product.id, 2)])
+        rollups.rebuild(chunk_size=1)
+        self.assertEqual(self._rollups(), incremental)
+
+        self.vehicle.is_available = True
+        self.vehicle.save()
+        self.assertEqual(jobs.run_batch(), {'done': 1, 'retry': 0, 'failed': 0})  # the deleted shipment's job went with it
+        incremental = self._rollups()
+        self.assertEqual([row[1:] for row in incremental[0]], [('Delivered', 1, 42.0, 1), ('In Transit', 1, 42.0, 1)])
+        rollups.rebuild()
+        self.assertEqual(self._rollups(), incremental)
+        self.assertTrue(Shipment.objects.filter(pk=pending_id, status='In Transit').exists())
+
+    def test_migration_backfills_existing_shipments(self):
+        self.client.post(f'/api/shipments/{self._create().data["id"]}/deliver/')
+        self._create()
+        expected = self._rollups()
+        ShipmentStatusRollup.objects.all().delete()
+        MonthlyVolumeRollup.objects.all().delete()
+        import_module('api.migrations.0012_backfill_analytics_rollups').backfill_rollups(apps, None)
+        self.assertEqual(self._rollups(), expected)
+
+    def test_reservation_cannot_oversell(self):
+        Product.objects.filter(pk=self.product.pk).update(stock=1)  # sold elsewhere after validation
+        with self.assertRaises(inventory.OutOfStock):
+            inventory.reserve(self.product.pk, 2)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 1)
+
+    def _stock(self):
+        self.product.refresh_from_db()
+        return self.product.stock
+
+    def test_edits_and_deletes_move_the_reservation(self):
+        shipment_id = self._create().data['id']
+        self.assertEqual(self._stock(), 98)
+        self.assertEqual(self.client.patch(f'/api/shipments/{shipment_id}/', {'quantity': 5}, format='json').status_code, 200)
+        self.assertEqual(self._stock(), 95)
+
+        other = Product.objects.create(name='Gadget', sku='G-1', stock=3)
+        response = self.client.patch(f'/api/shipments/{shipment_id}/', {'product_id': other.id}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual((self._stock(), Shipment.objects.get(pk=shipment_id).quantity), (95, 5))
+
+        self.assertEqual(self.client.delete(f'/api/shipments/{shipment_id}/').status_code, 204)
+        self.assertEqual(self._stock(), 100)
+
+    def test_deleting_a_delivered_shipment_keeps_the_stock_spent(self):
+        shipment_id = self._create().data['id']
+        self.client.post(f'/api/shipments/{shipment_id}/deliver/')
+        self.client.delete(f'/api/shipments/{shipment_id}/')
+        self.assertEqual(self._stock(), 98)
+
+    @override_settings(SHIPMENT_ENRICHMENT_ASYNC=True)
+    def test_async_creation_is_enriched_by_the_worker(self):
+        response = self._create()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['status'], 'Pending')
+        shipment_id = response.data['id']
+
+        poll = self.client.get(f'/api/shipments/{shipment_id}/enrichment/')
+        self.assertEqual(poll.data['enrichment']['status'], 'queued')
+
+        self.assertEqual(jobs.run_batch(), {'done': 1, 'retry': 0, 'failed': 0})
+        shipment = Shipment.objects.get(pk=shipment_id)
+        self.assertEqual(shipment.status, 'In Transit')
+        self.assertEqual(shipment.vehicle, self.vehicle)
+        self.assertEqual(shipment.predicted_duration, eta.format_hours(shipment.predicted_hours))
+        # The promise counts from when the order was placed, not from when the worker got to it.
+        self.assertEqual(shipment.expected_delivery_at, shipment.created_at + timedelta(hours=shipment.predicted_hours))
+        self.assertEqual(self.client.get(f'/api/shipments/{shipment_id}/enrichment/').data['enrichment']['status'], 'done')
+
+    @override_settings(SHIPMENT_ENRICHMENT_ASYNC=True, ENRICHMENT_JOB_MAX_ATTEMPTS=2)
+    def test_failed_jobs_are_retried_then_given_up(self):
+        Vehicle.objects.update(is_available=False)
+        shipment_id = self._create().data['id']
+
+        self.assertEqual(jobs.run_batch(), {'done': 0, 'retry': 1, 'failed': 0})
+        self.assertEqual(jobs.run_batch(), {'done': 0, 'retry': 0, 'failed': 0})  # backing off
+        EnrichmentJob.objects.update(run_after=timezone.now())
+        self.assertEqual(jobs.run_batch(), {'done': 0, 'retry': 0, 'failed': 1})
+
+        job = EnrichmentJob.objects.get(shipment_id=shipment_id)
+        self.assertEqual(job.attempts, 2)
+        self.assertIn('No available', job.last_error)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 100)  # reservation handed back
+
+    def test_claimed_jobs_are_not_claimed_twice(self):
+        shipment = Shipment.objects.create(
+            client=self.user, product=self.product, quantity=1, start_address='A', end_address='B',
+        )
+        jobs.enqueue(shipment)
+        self.assertEqual(len(jobs.claim_jobs(10, worker='w1')), 1)
+        self.assertEqual(jobs.claim_jobs(10, worker='w2'), [])
+
+
+@override_settings(WEATHER_API_KEY='test-key')
+class BulkShipmentCreationTests(TestCase):
+    def setUp(self):
+        routing.route_cache.clear()
+        weather.weather_cache.clear()
+        self.user = User.objects.create_user(email='erp@example.com', username='erp', password='pw')
+        self.product = Product.objects.create(name='Widget', sku='W-1', stock=10)
+        for i in range(3):
+            driver = User.objects.create_user(email=f'driver{i}@example.com', username=f'driver{i}', password='pw')
+            DeliveryAgent.objects.create(user=driver, phone_number='123')
+            Vehicle.objects.create(name='Truck', license_plate=f'MH-0{i}')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        route_patcher = mock.patch.object(routing, 'fetch_route', return_value=ROUTE)
+        self.fetch_route = route_patcher.start()
+        self.addCleanup(route_patcher.stop)
+        weather_patcher = mock.patch.object(weather, 'fetch_forecast', return_value='30°C, Clear Sky')
+        self.fetch_forecast = weather_patcher.start()
+        self.addCleanup(weather_patcher.stop)
+
+    def _order(self, quantity=1, end='Client Rd, Mumbai, India'):
+        return {'product_id': self.product.id, 'quantity': quantity, 'start_address': 'Warehouse, Pune, India', 'end_address': end}
+
+    def test_identical_lanes_share_one_lookup(self):
+        with mock.patch.object(weather, 'fill_shipments_forecast') as fill, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/shipments/bulk/', [self._order(), self._order(), self._order()], format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['created']), 3)
+        self.assertEqual(response.data['errors'], [])
+        self.assertEqual(self.fetch_route.call_count, 1)
+        self.fetch_forecast.assert_not_called()  # never inline
+        fill.assert_called_once_with(sorted(row['id'] for row in response.data['created']), 'Mumbai')
+        self.assertEqual(Shipment.objects.filter(status='In Transit', stock_reserved=True).count(), 3)
+        self.assertFalse(Vehicle.objects.filter(is_available=True).exists())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 7)
+
+    def test_stock_is_checked_across_the_whole_batch(self):
+        response = self.client.post('/api/shipments/bulk/', {'shipments': [self._order(6), self._order(6)]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Out of stock', str(response.data))
+        self.assertFalse(Shipment.objects.exists())
+
+    def test_orders_beyond_available_fleet_are_reported(self):
+        response = self.client.post('/api/shipments/bulk/', [self._order() for _ in range(4)], format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['created']), 3)
+        self.assertEqual([error['index'] for error in response.data['errors']], [3])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 7)  # only assigned orders reserve stock
+
+    @override_settings(SHIPMENT_ENRICHMENT_ASYNC=True)
+    def test_async_mode_queues_every_order(self):
+        response = self.client.post('/api/shipments/bulk/', [self._order(), self._order()], format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(EnrichmentJob.objects.filter(status='queued').count(), 2)
+        self.fetch_route.assert_not_called()
+
+
+class AssignmentIndexTests(TestCase):
+    # Pune, Mumbai and Delhi depots
+    DEPOTS = {'pune': (18.52, 73.85), 'mumbai': (19.07, 72.88), 'delhi': (28.61, 77.21)}
+
+    def setUp(self):
+        self.vehicles = {
+            name: Vehicle.objects.create(name=name, license_plate=name.upper(), last_lat=lat, last_lng=lng)
+            for name, (lat, lng) in self.DEPOTS.items()
+        }
+        self.index = assignment.ResourceIndex(Vehicle)
+
+    def test_nearest_orders_by_great_circle_distance(self):
+        result = self.index.nearest(19.0, 72.9, k=3)  # near Mumbai
+        self.assertEqual([pk for pk, _ in result], [self.vehicles[name].pk for name in ('mumbai', 'pune', 'delhi')])
+        self.assertLess(result[0][1], 10)
+
+    def test_availability_and_moves_are_applied_incrementally(self):
+        self.index.nearest(0, 0)  # load
+        rebuilds = self.index.stats()['rebuilds']
+
+        self.index.update(self.vehicles['mumbai'].pk, is_available=False)
+        self.index.update(self.vehicles['delhi'].pk, True, 19.1, 72.9)  # delhi truck is now in Mumbai
+
+        self.assertEqual(self.index.nearest(19.0, 72.9)[0][0], self.vehicles['delhi'].pk)
+        self.assertEqual(self.index.stats()['rebuilds'], rebuilds)
+
+    def test_positionless_resources_are_a_last_resort(self):
+        spare = Vehicle.objects.create(name='spare', license_plate='SPARE')
+        self.index.reload()
+        self.assertEqual(self.index.nearest(19.0, 72.9, k=4)[-1], (spare.pk, None))
+
+    def test_claims_are_confirmed_against_the_database(self):
+        assignment.vehicle_index.reload()
+        Vehicle.objects.filter(pk=self.vehicles['mumbai'].pk).update(is_available=False)  # bypasses signals
+
+        _, vehicle = assignment.claim_nearest(19.0, 72.9)
+        self.assertEqual(vehicle, self.vehicles['pune'])
+        self.assertFalse(Vehicle.objects.get(pk=vehicle.pk).is_available)
+
+    def test_a_resource_is_never_claimed_twice(self):
+        assignment.vehicle_index.reload()
+        claimed = [assignment.claim_nearest(19.0, 72.9)[1] for _ in range(4)]
+        self.assertEqual(claimed[:3], [self.vehicles[name] for name in ('mumbai', 'pune', 'delhi')])
+        self.assertIsNone(claimed[3])
+
+    def test_claim_many_skips_resources_taken_behind_the_index(self):
+        assignment.vehicle_index.reload()
+        Vehicle.objects.filter(pk=self.vehicles['mumbai'].pk).update(is_available=False)
+
+        pairs = assignment.claim_many([(19.0, 72.9), (19.0, 72.9)])
+        self.assertEqual([vehicle for _, vehicle in pairs], [self.vehicles['pune'], self.vehicles['delhi']])
+
+
+class ShipmentQueryBudgetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='client@example.com', username='client', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _add_shipments(self, count):
+        start = Shipment.objects.count()
+        for i in range(start, start + count):
+            driver = User.objects.create_user(email=f'driver{i}@example.com', username=f'driver{i}', password='pw')
+            Shipment.objects.create(
+                client=self.user, quantity=1, start_address='A', end_address='B', status='In Transit',
+                product=Product.objects.create(name=f'P{i}', sku=f'P-{i}', stock=5),
+                agent=DeliveryAgent.objects.create(user=driver, phone_number='123'),
+                vehicle=Vehicle.objects.create(name='Truck', license_plate=f'MH-{i}'),
+            )
+
+    def test_listing_costs_one_query_whatever_the_page_size(self):
+        self._add_shipments(2)
+        with self.assertNumQueries(1):
+            self.assertEqual(len(self.client.get('/api/shipments/').data), 2)
+        self._add_shipments(8)
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/shipments/')
+        self.assertEqual(len(response.data), 10)
+        self.assertEqual(response.data[0]['agent']['user']['username'], 'driver9')
+
+    def test_fleet_listing_does_not_query_per_active_shipment(self):
+        self._add_shipments(5)
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/vehicles/')
+        self.assertEqual(len(response.data['active_shipments']), 5)
+
+    def test_lite_view_flattens_relations_and_drops_the_polyline(self):
+        self._add_shipments(3)
+        Shipment.objects.update(route_polyline='x' * 5000)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/shipments/?view=lite&expand=vehicle')
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('route_polyline', queries[0]['sql'])
+        self.assertNotIn('api_deliveryagent', queries[0]['sql'])
+
+        shipment = response.data[0]
+        self.assertNotIn('route_polyline', shipment)
+        self.assertIsInstance(shipment['agent'], int)
+        self.assertEqual(shipment['client'], self.user.id)
+        self.assertEqual(shipment['vehicle']['license_plate'], 'MH-2')
+
+    def test_fields_selects_columns(self):
+        self._add_shipments(1)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/shipments/?fields=id,status')
+        self.assertEqual(list(response.data[0]), ['id', 'status'])
+        self.assertNotIn('JOIN', queries[0]['sql'])
+
+
+class ShipmentPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='client@example.com', username='client', password='pw')
+        product = Product.objects.create(name='Widget', sku='W-1', stock=5)
+        created_at = timezone.now()
+        for i in range(5):
+            shipment = Shipment.objects.create(
+                client=self.user, product=product, quantity=1, start_address='A', end_address='B',
+                status='Delivered' if i % 2 else 'In Transit',
+            )
+            Shipment.objects.filter(pk=shipment.pk).update(created_at=created_at)  # ties are broken by id
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_cursor_pages_cover_every_shipment_once(self):
+        seen, url = [], '/api/shipments/?page_size=2&view=lite'
+        while url:
+            page = self.client.get(url).data
+            seen += [shipment['id'] for shipment in page['results']]
+            url = page['next']
+        self.assertEqual(seen, sorted(Shipment.objects.values_list('id', flat=True), reverse=True))
+
+    def test_unpaginated_listing_and_status_filter(self):
+        self.assertEqual(len(self.client.get('/api/shipments/').data), 5)
+        response = self.client.get('/api/shipments/?status=Delivered&page_size=10')
+        self.assertEqual({shipment['status'] for shipment in response.data['results']}, {'Delivered'})
+        self.assertEqual(len(response.data['results']), 2)
+
+
+class FleetMapTests(TestCase):
+    def setUp(self):
+        geo.fleet_map_cache.clear()
+        self.addCleanup(geo.fleet_map_cache.clear)
+        self.user = User.objects.create_user(email='ops@example.com', username='ops', password='pw')
+        product = Product.objects.create(name='Widget', sku='W-1', stock=5)
+        # A wiggly Pune -> Mumbai road with 400 vertices, and a truck parked in Delhi.
+        road = [(18.52 + i * 0.00137, 73.85 - i * 0.00243 + (0.002 if i % 2 else 0)) for i in range(400)]
+        self.pune_mumbai = Shipment.objects.create(
+            client=self.user, product=product, quantity=1, start_address='Pune', end_address='Mumbai',
+            status='In Transit', route_polyline=geo.encode_polyline(road), current_lat=18.52, current_lng=73.85,
+        )
+        self.delhi = Shipment.objects.create(
+            client=self.user, product=product, quantity=1, start_address='Delhi', end_address='Delhi',
+            status='Out for Delivery', current_lat=28.61, current_lng=77.21,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_polyline_round_trip(self):
+        encoded = '_p~iF~ps|U_ulLnnqC_mqNvxq`@'
+        self.assertEqual(geo.decode_polyline(encoded), [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)])
+        self.assertEqual(geo.encode_polyline(geo.decode_polyline(encoded)), encoded)
+
+    def test_viewport_selects_routes_crossing_it(self):
+        # Lonavala sits on the route, away from both ends and the current position.
+        response = self.client.get('/api/fleet-map/?bbox=73.3,18.7,73.5,18.8&zoom=8')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([shipment['id'] for shipment in response.data['shipments']], [self.pune_mumbai.id])
+
+        response = self.client.get('/api/fleet-map/?bbox=77,28,78,29&zoom=8')
+        self.assertEqual([shipment['id'] for shipment in response.data['shipments']], [self.delhi.id])
+
+    def test_routes_are_simplified_per_zoom_and_cached(self):
+        far = self.client.get('/api/fleet-map/?bbox=72,18,75,20&zoom=6').data['shipments'][0]['route_polyline']
+        near = self.client.get('/api/fleet-map/?bbox=72,18,75,20&zoom=16').data['shipments'][0]['route_polyline']
+        self.assertLess(len(geo.decode_polyline(far)), 10)
+        self.assertGreater(len(geo.decode_polyline(near)), len(geo.decode_polyline(far)))
+
+        with self.assertNumQueries(2):  # active shipments and vehicles; polylines come from the cache
+            self.client.get('/api/fleet-map/?bbox=72,18,75,20&zoom=6')
+        self.assertEqual(geo.fleet_map_cache.stats()['simplifications'], 2)
+
+    def test_invalid_bbox_is_rejected(self):
+        self.assertEqual(self.client.get('/api/fleet-map/?bbox=78,18,72,20').status_code, 400)
+
+    def test_zoom_must_be_finite_and_is_clamped(self):
+        for zoom in ('nan', 'inf', '-inf', 'x'):
+            self.assertEqual(self.client.get(f'/api/fleet-map/?bbox=72,18,75,20&zoom={zoom}').status_code, 400)
+        self.assertEqual(self.client.get('/api/fleet-map/?bbox=72,18,75,20&zoom=1e300').data['zoom'], geo.MAX_ZOOM)
+        self.assertEqual(self.client.get('/api/fleet-map/?bbox=72,18,75,20&zoom=-3').data['zoom'], geo.MIN_ZOOM)
+
+
+class LocationIngestionTests(TestCase):
+    def setUp(self):
+        tracking.location_buffer.clear()
+        self.addCleanup(tracking.location_buffer.clear)
+        self.user = User.objects.create_user(email='client@example.com', username='client', password='pw')
+        product = Product.objects.create(name='Widget', sku='W-1', stock=5)
+        self.shipments = [
+            Shipment.objects.create(client=self.user, product=product, quantity=1, start_address='A', end_address='B')
+            for _ in range(2)
+        ]
+        other = User.objects.create_user(email='other@example.com', username='other', password='pw')
+        self.foreign = Shipment.objects.create(client=other, product=product, quantity=1, start_address='A', end_address='B')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _point(self, shipment, lat, minute):
+        return {'shipment_id': shipment.id, 'lat': lat, 'lng': 73.0, 'ts': f'2026-01-01T10:{minute:02d}:00Z'}
+
+    def test_pings_are_coalesced_into_one_write_per_shipment(self):
+        first, second = self.shipments
+        with mock.patch.object(tracking.location_buffer, 'interval', 3600):
+            response = self.client.post('/api/locations/', [
+                self._point(first, 18.3, 3), self._point(first, 18.1, 1), self._point(second, 19.0, 1),
+                self._point(self.foreign, 20.0, 1),
+            ], format='json')
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(response.data, {'accepted': 3, 'rejected': [3]})
+            self.assertIsNone(Shipment.objects.get(pk=first.pk).current_lat)  # still buffered
+
+            with self.assertNumQueries(5):  # route lookup (no routes yet), savepoint, bulk_update, history, release
+                self.assertEqual(tracking.location_buffer.flush(), 2)
+
+        self.assertEqual(Shipment.objects.get(pk=first.pk).current_lat, 18.3)  # the newest point wins
+        self.assertEqual(Shipment.objects.get(pk=second.pk).current_lat, 19.0)
+        self.assertIsNone(Shipment.objects.get(pk=self.foreign.pk).current_lat)
+
+    def test_reads_see_buffered_positions(self):
+        first, _ = self.shipments
+        with mock.patch.object(tracking.location_buffer, 'interval', 3600):
+            self.client.post('/api/locations/', [self._point(first, 18.1, 1), self._point(first, 18.3, 3)], format='json')
+            detail = self.client.get(f'/api/shipments/{first.id}/')
+            listed = self.client.get('/api/shipments/')
+            track = self.client.get(f'/api/shipments/{first.id}/track/?from=2026-01-01T10:02:00Z')
+
+        self.assertIsNone(Shipment.objects.get(pk=first.pk).current_lat)  # still buffered
+        self.assertEqual(detail.data['current_lat'], 18.3)
+        self.assertEqual({row['id']: row['current_lat'] for row in listed.data}[first.id], 18.3)
+        self.assertEqual([point[1] for point in track.data['points']], [18.3])
+
+    def test_failed_flush_keeps_the_points(self):
+        first, second = self.shipments
+        at = lambda minute: datetime(2026, 1, 1, 10, minute, tzinfo=dt_timezone.utc)
+        buffer = tracking.LocationBuffer(interval=3600)
+        buffer.add([(first.id, 18.1, 73.0, at(1)), (second.id, 19.0, 73.0, at(1))])
+        with mock.patch.object(history, 'append', side_effect=OperationalError('database is locked')):
+            with self.assertRaises(OperationalError):
+                buffer.flush()
+        buffer.add([(first.id, 18.3, 73.0, at(3))])  # arrived while the write was failing
+
+        self.assertEqual(buffer.latest(first.id), (18.3, 73.0, at(3)))
+        self.assertEqual(buffer.latest(second.id), (19.0, 73.0, at(1)))
+        self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(Shipment.objects.get(pk=first.pk).current_lat, 18.3)
+        self.assertEqual([point[1] for point in history.track(first.id)], [18.1, 18.3])
+        self.assertEqual(buffer.stats()['failed_flushes'], 1)
+
+    def test_single_update_writes_through_when_due(self):
+        with mock.patch.object(tracking.location_buffer, 'interval', 0):
+            response = self.client.post(f'/api/shipments/{self.shipments[0].id}/update_location/', {'lat': 18.5, 'lng': 73.8}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Shipment.objects.get(pk=self.shipments[0].pk).current_lng, 73.8)
+        self.assertEqual(self.client.post(f'/api/shipments/{self.foreign.id}/update_location/', {'lat': 1, 'lng': 1}).status_code, 404)
+        self.assertEqual(self.client.post(f'/api/shipments/{self.shipments[0].id}/update_location/', {'lat': 1}).status_code, 400)
+
+
+class LocationHistoryTests(TestCase):
+    def setUp(self):
+        tracking.location_buffer.clear()
+        self.addCleanup(tracking.location_buffer.clear)
+        self.user = User.objects.create_user(email='client@example.com', username='client', password='pw')
+        product = Product.objects.create(name='Widget', sku='W-1', stock=5)
+        self.shipment = Shipment.objects.create(client=self.user, product=product, quantity=1, start_address='A', end_address='B')
+        self.start = datetime(2026, 1, 1, 10, 0, tzinfo=dt_timezone.utc)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _ping(self, seconds):
+        return (self.shipment.id, 18.5 + seconds * 1e-5, 73.8 - seconds * 1e-5, self.start + timedelta(seconds=seconds))
+
+    def test_every_ping_is_kept_and_range_queries_replay_it(self):
+        with mock.patch.object(tracking.location_buffer, 'interval', 3600):
+            for second in range(0, 7200, 5):  # two hours of 5-second pings, flushed every minute
+                tracking.location_buffer.add([self._ping(second)])
+                if second % 60 == 55:
+                    tracking.location_buffer.flush()
+
+        self.assertEqual(LocationChunk.objects.count(), 120)
+        points = history.track(self.shipment.id)
+        self.assertEqual(len(points), 1440)
+        self.assertEqual(points[1], (self.start + timedelta(seconds=5), 18.50005, 73.79995))
+        self.assertLess(sum(len(chunk.data) for chunk in LocationChunk.objects.all()) / 1440, 8)  # bytes per point
+
+        response = self.client.get(f'/api/shipments/{self.shipment.id}/track/', {'from': '2026-01-01T10:30:00Z', 'to': '2026-01-01T10:31:00Z'})
+        self.assertEqual(len(response.data['points']), 13)
+        self.assertEqual(len(geo.decode_polyline(response.data['polyline'])), 13)
+
+    def test_track_range_accepts_local_times_and_rejects_impossible_dates(self):
+        with mock.patch.object(tracking.location_buffer, 'interval', 3600):
+            tracking.location_buffer.add([self._ping(second) for second in range(0, 300, 30)])
+            tracking.location_buffer.flush()
+        url = f'/api/shipments/{self.shipment.id}/track/'
+
+        # No offset: read in TIME_ZONE (Asia/Kolkata), so 15:30-15:31 local is 10:00-10:01 UTC.
+        response = self.client.get(url, {'from': '2026-01-01T15:30', 'to': '2026-01-01T15:31'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['points']), 3)
+        for bad in ('2024-02-30T00:00', 'yesterday'):
+            self.assertEqual(self.client.get(url, {'from': bad}).status_code, 400)
+
+    def test_compaction_merges_downsamples_and_expires(self):
+        with mock.patch.object(tracking.location_buffer, 'interval', 0):  # write through
+            tracking.location_buffer.add([self._ping(second) for second in range(0, 120, 5)])
+            tracking.location_buffer.add([self._ping(second) for second in range(120, 240, 5)])
+        history.append({self.shipment.id: [(self.start + timedelta(seconds=300), 18.6, 73.7)]})
+
+        self.assertEqual(history.compact(self.start + timedelta(hours=2)), {'expired': 0, 'merged': 1, 'downsampled': 0})
+        self.assertEqual(LocationChunk.objects.get().point_count, 49)
+
+        self.assertEqual(history.compact(self.start + timedelta(days=8)), {'expired': 0, 'merged': 0, 'downsampled': 1})
+        self.assertEqual(len(history.track(self.shipment.id)), 5)  # one point per minute
+
+        self.assertEqual(history.compact(self.start + timedelta(days=365))['expired'], 1)
+        self.assertFalse(LocationChunk.objects.exists())
+
+
+class LiveStreamTests(TestCase):
+    def setUp(self):
+        tracking.location_buffer.clear()
+        self.addCleanup(tracking.location_buffer.clear)
+        self.user = User.objects.create_user(email='client@example.com', username='client', password='pw')
+        product = Product.objects.create(name='Widget', sku='W-1', stock=5)
+        self.shipment = Shipment.objects.create(
+            client=self.user, product=product, quantity=1, start_address='A', end_address='B', status='In Transit',
+        )
+        self.token = str(RefreshToken.for_user(self.user).access_token)
+
+    def test_ingested_pings_are_published_coalesced(self):
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        subscription = live.broker.subscribe([self.shipment.id], loop)
+        self.addCleanup(live.broker.unsubscribe, subscription)
+
+        with mock.patch.object(tracking.location_buffer, 'interval', 3600):
+            tracking.ingest(self.user, [
+                {'shipment_id': self.shipment.id, 'lat': 18.6, 'lng': 73.9, 'ts': timezone.now()},
+                {'shipment_id': self.shipment.id, 'lat': 18.5, 'lng': 73.8, 'ts': timezone.now() - timedelta(minutes=1)},
+            ])
+        live.publish(self.shipment.id, status='Out for Delivery')
+
+        deltas = loop.run_until_complete(subscription.next_deltas(1))
+        self.assertEqual(list(deltas), [self.shipment.id])
+        self.assertEqual(deltas[self.shipment.id]['current_lat'], 18.6)
+        self.assertEqual(deltas[self.shipment.id]['status'], 'Out for Delivery')
+
+    def test_stream_is_refused_under_wsgi(self):
+        response = APIClient().get('/api/live/', {'token': self.token})
+        self.assertEqual(response.status_code, 501)
+        self.assertEqual(live.broker.stats()['subscriptions'], 0)
+
+    async def test_stream_sends_a_snapshot_then_deltas(self):
+        client = AsyncClient()
+        self.assertEqual((await client.get('/api/live/', {'token': 'nope'})).status_code, 401)
+
+        response = await client.get('/api/live/', {'token': self.token})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        snapshot = (await anext(stream)).decode()
+        self.assertTrue(snapshot.startswith('event: snapshot'))
+        self.assertIn(f'"id": {self.shipment.id}', snapshot)
+
+        live.publish(self.shipment.id, status='Delivered')
+        delta = (await asyncio.wait_for(anext(stream), 2)).decode()
+        self.assertEqual(delta, f'event: delta\ndata: {{"id": {self.shipment.id}, "status": "Delivered"}}\n\n')
+
+        await stream.aclose()
+        response.close()  # what the ASGI handler does once the client is gone
+        self.assertEqual(live.broker.stats()['subscriptions'], 0)
+
+
+class DashboardAnalyticsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user(email='client@example.com', username='client', password='pw')
+        self.products = [Product.objects.create(name=name, sku=name, stock=stock) for name, stock in (('Bolts', 0), ('Nuts', 5), ('Gears', 50))]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _history(self, rounds):
+        for _ in range(rounds):
+            for product in self.products:
+                Shipment.objects.create(client=self.user, product=product, quantity=2, start_address='A', end_address='B', status='Delivered', distance_km=10)
+            Shipment.objects.create(client=self.user, product=self.products[0], quantity=1, start_address='A', end_address='B', status='In Transit', distance_km=40)
+            Vehicle.objects.create(name='Truck', license_plate=f'MH-{Vehicle.objects.count()}', purchase_date=date.today() - timedelta(days=730), total_km_driven=1000)
+        rollups.rebuild()
+
+    def test_query_count_does_not_grow_with_history(self):
+        self._history(2)
+        with self.assertNumQueries(5):
+            self.client.get('/api/dashboard/')
+        self._history(10)
+        with self.assertNumQueries(5):  # four aggregates and the on-time scan
+            response = self.client.get('/api/dashboard/')
+
+        self.assertEqual(response.data['stats'], {'totalShipments': 48, 'inTransit': 12, 'delivered': 36, 'lowStockAlerts': 2})
+        month = next(row for row in response.data['charts']['monthlyVolume'] if row['totalVolume'])
+        self.assertEqual(month['totalVolume'], 72)
+        self.assertEqual(month['products'], [{'name': name, 'quantity': 24} for name in ('Bolts', 'Gears', 'Nuts')])
+        self.assertEqual(response.data['predictions']['maintenanceCost'], f"₹{utils.predict_maintenance_cost(730 / 365.25, 1000):.2f}")
+
+    def test_responses_are_cached_until_a_relevant_write(self):
+        self._history(1)
+        first = self.client.get('/api/dashboard/')
+        etag = first['ETag']
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/dashboard/').data, first.data)
+            self.assertEqual(self.client.get('/api/dashboard/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        other = User.objects.create_user(email='other@example.com', username='other', password='pw')
+        Shipment.objects.create(client=other, product=self.products[2], quantity=1, start_address='A', end_address='B')
+        self.assertEqual(self.client.get('/api/dashboard/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        inventory.reserve(self.products[2].id, 45)  # conditional UPDATE, no signal: Gears is now low on stock
+        response = self.client.get('/api/dashboard/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['stats']['lowStockAlerts'], 3)
+
+        shipment = Shipment.objects.filter(client=self.user, status='In Transit').first()
+        etag = response['ETag']
+        self.client.post(f'/api/shipments/{shipment.id}/deliver/')
+        response = self.client.get('/api/dashboard/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['stats']['delivered'], 4)
+
+    def test_on_time_percentage_compares_delivery_with_prediction(self):
+        promised = timezone.now() - timedelta(days=1)
+        for hours_late in (-2, -1, 0, 3):
+            Shipment.objects.create(
+                client=self.user, product=self.products[2], quantity=1, start_address='A', end_address='B',
+                status='Delivered', expected_delivery_at=promised, delivered_at=promised + timedelta(hours=hours_late),
+            )
+        Shipment.objects.create(client=self.user, product=self.products[2], quantity=1, start_address='A', end_address='B', status='Delivered')
+        Shipment.objects.create(  # not delivered yet, however late
+            client=self.user, product=self.products[2], quantity=1, start_address='A', end_address='B',
+            status='In Transit', expected_delivery_at=promised,
+        )
+        rollups.rebuild()
+
+        with CaptureQueriesContext(connection) as queries:
+            performance = self.client.get('/api/dashboard/').data['charts']['deliveryPerformance']
+        self.assertEqual(performance['data'], [75, 25])
+        self.assertIn('expected_delivery_at', queries[-1]['sql'])  # the KPI is one aggregate, not a scan
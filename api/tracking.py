@@ -0,0 +1,216 @@
+"""
+Coalesced GPS ingestion.
+
+Trucks ping every few seconds, but only the latest position of a shipment
+matters to anyone reading it. Pings are put in an in-process buffer that
+keeps the newest point per shipment and is flushed with one
+`bulk_update(['current_lat', 'current_lng'])` per LOCATION_FLUSH_INTERVAL,
+so write volume follows the number of moving shipments, not the ping rate.
+Every ping is also kept for the track history, which is appended in the
+same flush as compressed chunks (see api/history.py). Live subscribers
+get each batch's newest point and its recomputed ETA straight away (see
+api/live.py and api/eta.py); the flush also stores the ETA in
+predicted_duration/predicted_hours (expected_delivery_at, the original
+promise, is left alone).
+
+Until then, shipment reads overlay the buffered position and the track
+includes the buffered points (`overlay()`, `LocationBuffer.track()`), for
+pings received by the same process.
+
+Flushes happen on a daemon thread, opportunistically on the request that
+finds the buffer due (serverless instances may freeze background threads)
+or full, and at interpreter exit. LOCATION_FLUSH_INTERVAL = 0 writes
+through on every request.
+"""
+import atexit
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from . import caching, eta, history, live
+from .models import Shipment
+
+
+class LocationBuffer:
+    def __init__(self, interval=None, max_size=None):
+        self.interval = settings.LOCATION_FLUSH_INTERVAL if interval is None else interval
+        self.max_size = max_size or settings.LOCATION_BUFFER_MAX_SIZE
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = {}
+        self._history = {}
+        self._history_points = 0
+        self._last_flush = time.monotonic()
+        self._flusher = None
+        self._counters = {'points': 0, 'coalesced': 0, 'flushes': 0, 'failed_flushes': 0, 'rows_written': 0}
+
+    def add(self, points):
+        """
+        Buffers (shipment_id, lat, lng, ts) points; an older point never
+        replaces a newer one. Flushes inline when the buffer is due or full.
+        """
+        with self._lock:
+            for shipment_id, lat, lng, ts in points:
+                self._counters['points'] += 1
+                self._history.setdefault(shipment_id, []).append((ts, lat, lng))
+                self._history_points += 1
+                current = self._pending.get(shipment_id)
+                if current is not None:
+                    self._counters['coalesced'] += 1
+                    if current[2] > ts:
+                        continue
+                self._pending[shipment_id] = (lat, lng, ts)
+            due = time.monotonic() - self._last_flush >= self.interval or self._history_points >= self.max_size
+        if due:
+            self.flush()
+        else:
+            self._ensure_flusher()
+
+    def flush(self):
+        """
+        Writes the buffered positions and history; returns the number of
+        shipments updated. If the write fails the points go back into the
+        buffer for the next flush and the error is re-raised.
+        """
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                track, self._history, self._history_points = self._history, {}, 0
+                self._last_flush = time.monotonic()
+            if not pending:
+                return 0
+            try:
+                shipments = self._write(pending, track)
+            except Exception:
+                self._restore(pending, track)
+                raise
+            caching.invalidate('shipments')
+            with self._lock:
+                self._counters['flushes'] += 1
+                self._counters['rows_written'] += len(shipments)
+            return len(shipments)
+
+    def _write(self, pending, track):
+        etas = eta.live_etas({pk: (lat, lng) for pk, (lat, lng, _) in pending.items()})
+        moved, timed = [], []
+        for pk, (lat, lng, _) in pending.items():
+            if pk in etas:
+                timed.append(Shipment(
+                    pk=pk, current_lat=lat, current_lng=lng,
+                    predicted_duration=eta.format_hours(etas[pk][1]), predicted_hours=etas[pk][1],
+                ))
+            else:
+                moved.append(Shipment(pk=pk, current_lat=lat, current_lng=lng))
+        with transaction.atomic():
+            if moved:
+                Shipment.objects.bulk_update(moved, ['current_lat', 'current_lng'], batch_size=500)
+            if timed:
+                Shipment.objects.bulk_update(timed, ['current_lat', 'current_lng', 'predicted_duration', 'predicted_hours'], batch_size=500)
+            history.append(track)
+        return moved + timed
+
+    def _restore(self, pending, track):
+        """Puts the points of a failed flush back, behind anything buffered since; newer positions win."""
+        with self._lock:
+            for pk, point in pending.items():
+                current = self._pending.get(pk)
+                if current is None or current[2] < point[2]:
+                    self._pending[pk] = point
+            for pk, points in track.items():
+                self._history[pk] = points + self._history.get(pk, [])
+                self._history_points += len(points)
+            self._counters['failed_flushes'] += 1
+
+    def latest(self, shipment_id):
+        """The buffered (lat, lng, ts) not yet written for a shipment, or None."""
+        with self._lock:
+            return self._pending.get(shipment_id)
+
+    def track(self, shipment_id, start=None, end=None):
+        """The buffered (ts, lat, lng) points not yet written for a shipment, within [start, end]."""
+        with self._lock:
+            points = list(self._history.get(shipment_id, ()))
+        return [point for point in points if (start is None or point[0] >= start) and (end is None or point[0] <= end)]
+
+    def _ensure_flusher(self):
+        with self._lock:
+            if self._flusher is not None or not self.interval:
+                return
+            self._flusher = threading.Thread(target=self._run_flusher, name='location-flusher', daemon=True)
+        self._flusher.start()
+
+    def _run_flusher(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error flushing buffered locations: {e!r}")
+            finally:
+                close_old_connections()
+
+    def clear(self):
+        with self._lock:
+            self._pending.clear()
+            self._history.clear()
+            self._history_points = 0
+            for name in self._counters:
+                self._counters[name] = 0
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, buffered=len(self._pending))
+
+
+location_buffer = LocationBuffer()
+
+
+@atexit.register
+def _flush_at_exit():
+    try:
+        location_buffer.flush()
+    except Exception as e:
+        print(f"Error flushing buffered locations at exit: {e!r}")
+
+
+def overlay(shipments):
+    """
+    Gives `shipments` the newest position buffered in this process, so reads
+    agree with the pings just acknowledged. Returns them.
+    """
+    for shipment in shipments:
+        point = location_buffer.latest(shipment.pk)
+        if point is not None:
+            shipment.current_lat, shipment.current_lng = point[0], point[1]
+    return shipments
+
+def ingest(client, points):
+    """
+    Buffers `points` (dicts with shipment_id, lat, lng and optional ts) for
+    the client's own shipments. Returns the indexes of rejected points.
+    """
+    ids = {point['shipment_id'] for point in points}
+    owned = set(Shipment.objects.filter(client=client, pk__in=ids).values_list('pk', flat=True))
+    now = timezone.now()
+    accepted, rejected = [], []
+    for index, point in enumerate(points):
+        if point['shipment_id'] not in owned:
+            rejected.append(index)
+            continue
+        accepted.append((point['shipment_id'], point['lat'], point['lng'], point.get('ts') or now))
+    location_buffer.add(accepted)
+
+    latest = {}
+    for shipment_id, lat, lng, ts in accepted:
+        if shipment_id not in latest or latest[shipment_id][2] <= ts:
+            latest[shipment_id] = (lat, lng, ts)
+    etas = eta.live_etas({shipment_id: (lat, lng) for shipment_id, (lat, lng, _) in latest.items()})
+    for shipment_id, (lat, lng, ts) in latest.items():
+        fields = {'current_lat': lat, 'current_lng': lng, 'ts': ts}
+        if shipment_id in etas:
+            fields['remaining_km'], fields['predicted_hours'] = round(etas[shipment_id][0], 2), round(etas[shipment_id][1], 2)
+        live.publish(shipment_id, **fields)
+    return rejected
@@ -0,0 +1,143 @@
+"""
+Delivery-time model trained on real shipment history.
+
+`manage.py train_models --from-history` streams delivered shipments
+(distance_km, created_at, delivered_at) from the database with
+`.iterator(chunk_size=...)` and folds each chunk into the normal equations
+of the quadratic model `hours = b0 + b1*d + b2*d^2` (X'X, X'y and y'y). Only
+those 3x3 sums are kept, so memory does not grow with the table, and the
+fit is exact least squares, the same model the seed training produced.
+
+Every tenth shipment (by pk) is held out and accumulated separately, and
+RMSE/R^2 for both sets are derived from the same sums, so fit quality is
+reported without a second pass. Shipments under 20 km are skipped: their
+ETA comes from the heuristic in utils.predict_delivery_time.
+"""
+import math
+import time
+
+from django.conf import settings
+
+from . import utils
+from .models import Shipment
+
+MIN_DISTANCE_KM = 20
+HOLDOUT_EVERY = 10
+# Distances are scaled before squaring so that X'X stays well conditioned.
+DISTANCE_SCALE = 100.0
+
+
+class NotEnoughHistory(Exception):
+    pass
+
+
+class NormalEquations:
+    """Sufficient statistics of a least-squares fit on features [1, u, u^2]."""
+
+    def __init__(self):
+        import numpy as np
+
+        self.xtx = np.zeros((3, 3))
+        self.xty = np.zeros(3)
+        self.yty = 0.0
+        self.y_sum = 0.0
+        self.rows = 0
+
+    def add(self, u, y):
+        import numpy as np
+
+        x = np.column_stack((np.ones_like(u), u, u * u))
+        self.xtx += x.T @ x
+        self.xty += x.T @ y
+        self.yty += float(y @ y)
+        self.y_sum += float(y.sum())
+        self.rows += len(y)
+
+    def solve(self):
+        import numpy as np
+
+        return np.linalg.lstsq(self.xtx, self.xty, rcond=None)[0]
+
+    def metrics(self, beta):
+        """RMSE and R^2 of `beta` on the accumulated rows."""
+        if not self.rows:
+            return {'rows': 0, 'rmse': None, 'r2': None}
+        sse = max(0.0, self.yty - 2 * float(beta @ self.xty) + float(beta @ self.xtx @ beta))
+        sst = self.yty - self.y_sum ** 2 / self.rows
+        return {
+            'rows': self.rows,
+            'rmse': math.sqrt(sse / self.rows),
+            'r2': 1 - sse / sst if sst > 0 else None,
+        }
+
+
+def _delivered_history():
+    return (
+        Shipment.objects.filter(status='Delivered', delivered_at__isnull=False, distance_km__gte=MIN_DISTANCE_KM)
+        .order_by()
+        .values_list('pk', 'distance_km', 'created_at', 'delivered_at')
+    )
+
+def fit_delivery_time(chunk_size=None):
+    """
+    Fits the delivery-time model on the delivered history. Returns
+    ((kind, intercept, coefficients), metrics); raises NotEnoughHistory when
+    fewer than MODEL_TRAINING_MIN_ROWS usable shipments exist.
+    """
+    import numpy as np
+
+    chunk_size = chunk_size or settings.MODEL_TRAINING_CHUNK_SIZE
+    train, holdout = NormalEquations(), NormalEquations()
+    started = time.perf_counter()
+    scanned = 0
+
+    def fold(rows):
+        data = np.array(rows, dtype=float).reshape(-1, 3)
+        data = data[data[:, 2] > 0]  # clock skew or bad data
+        holdout_rows = data[:, 0] % HOLDOUT_EVERY == 0
+        for target, part in ((holdout, data[holdout_rows]), (train, data[~holdout_rows])):
+            if len(part):
+                target.add(part[:, 1] / DISTANCE_SCALE, part[:, 2])
+
+    buffer = []
+    for pk, distance_km, created_at, delivered_at in _delivered_history().iterator(chunk_size=chunk_size):
+        buffer.append((pk, distance_km, (delivered_at - created_at).total_seconds() / 3600))
+        if len(buffer) >= chunk_size:
+            fold(buffer)
+            scanned += len(buffer)
+            buffer = []
+    if buffer:
+        fold(buffer)
+        scanned += len(buffer)
+
+    if train.rows < settings.MODEL_TRAINING_MIN_ROWS:
+        raise NotEnoughHistory(
+            f"Only {train.rows} delivered shipments of {MIN_DISTANCE_KM} km or more to train on "
+            f"(MODEL_TRAINING_MIN_ROWS is {settings.MODEL_TRAINING_MIN_ROWS})."
+        )
+
+    beta = train.solve()
+    seconds = time.perf_counter() - started
+    metrics = {
+        'source': 'shipment_history',
+        'scanned': scanned,
+        'train': train.metrics(beta),
+        'holdout': holdout.metrics(beta),
+        'seconds': round(seconds, 3),
+        'rows_per_second': round(scanned / seconds) if seconds > 0 else None,
+    }
+    coefficients = [beta[1] / DISTANCE_SCALE, beta[2] / DISTANCE_SCALE ** 2]
+    return ('polynomial', float(beta[0]), coefficients), metrics
+
+def retrain_from_history(chunk_size=None):
+    """
+    Fits the delivery-time model on history and publishes it together with
+    the current maintenance-cost model (seeding one first if there is no
+    artifact yet). Returns the published artifact.
+    """
+    spec, metrics = fit_delivery_time(chunk_size)
+    if not utils.model_artifacts_exist():
+        utils.train_and_save_models()
+    models = utils.read_model_specs()
+    models[utils.DELIVERY_TIME_MODEL] = spec
+    return utils.publish_coefficients(models, training={utils.DELIVERY_TIME_MODEL: metrics})
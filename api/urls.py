@@ -1,10 +1,11 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from .live import live_stream
 from .views import (
     SignupView, ProfileView, ProductViewSet, VehicleViewSet,
     ShipmentViewSet, DashboardAnalyticsView, MarkAsDeliveredView,
-    GetDirectionsView ,UpdateLocationView,UpdateStatusView 
+    GetDirectionsView ,UpdateLocationView,UpdateStatusView, FleetMapView, LocationBatchView
 )
 
 router = DefaultRouter()
@@ -17,8 +18,11 @@ urlpatterns = [
     path('dashboard/', DashboardAnalyticsView.as_view(), name='dashboard-analytics'),
     path('shipments/<int:pk>/deliver/', MarkAsDeliveredView.as_view(), name='shipment-deliver'),
     path('get-directions/', GetDirectionsView.as_view(), name='get-directions'),
+    path('fleet-map/', FleetMapView.as_view(), name='fleet-map'),
 
     path('shipments/<int:pk>/update_location/', UpdateLocationView.as_view(), name='shipment-update-location'),
+    path('locations/', LocationBatchView.as_view(), name='location-batch'),
+    path('live/', live_stream, name='live-stream'),
     path('shipments/<int:pk>/update_status/', UpdateStatusView.as_view(), name='shipment-update-status'),
 
     # Auth
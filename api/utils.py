@@ -1,80 +1,320 @@
+import hashlib
+import json
 import os
-import pickle 
-import numpy as np
-import requests
-from bs4 import BeautifulSoup
+import threading
+import time
 from django.conf import settings
-from sklearn.linear_model import LinearRegression
-from sklearn.preprocessing import PolynomialFeatures
-from sklearn.pipeline import Pipeline
+
+from . import providers
 
 
 MODEL_DIR = os.path.join(os.path.dirname(__file__), 'ml_models')
-TIME_MODEL_PATH = os.path.join(MODEL_DIR, 'delivery_time_model.pkl')
-COST_MODEL_PATH = os.path.join(MODEL_DIR, 'maintenance_cost_model.pkl')
+# Fitted models are exported as plain coefficients so that request-time
+# inference needs neither scikit-learn nor numpy.
+COEFFICIENTS_PATH = os.path.join(MODEL_DIR, 'model_coefficients.json')
+# Every trained artifact is also archived here under its version stamp.
+VERSIONS_DIR = os.path.join(MODEL_DIR, 'versions')
+DELIVERY_TIME_MODEL = 'delivery_time'
+MAINTENANCE_COST_MODEL = 'maintenance_cost'
+
+
+class PolynomialRegressor:
+    """intercept + c1*x + c2*x**2 + ... evaluated with plain arithmetic (works on scalars and numpy arrays)."""
+
+    def __init__(self, intercept, coefficients):
+        self.intercept = float(intercept)
+        self.coefficients = [float(c) for c in coefficients]
+
+    def predict(self, x):
+        result = self.intercept
+        power = x
+        for coefficient in self.coefficients:
+            result = result + coefficient * power
+            power = power * x
+        return result
+
+
+class LinearRegressor:
+    """intercept + sum(c_i * feature_i) evaluated with plain arithmetic (works on scalars and numpy arrays)."""
+
+    def __init__(self, intercept, coefficients):
+        self.intercept = float(intercept)
+        self.coefficients = [float(c) for c in coefficients]
+
+    def predict(self, *features):
+        result = self.intercept
+        for coefficient, feature in zip(self.coefficients, features):
+            result = result + coefficient * feature
+        return result
+
+
+MODEL_KINDS = {
+    'polynomial': PolynomialRegressor,
+    'linear': LinearRegressor,
+}
+
+def load_coefficients(path):
+    """Builds the regressors described by a coefficient file."""
+    with open(path) as f:
+        artifact = json.load(f)
+    models = {}
+    for name, spec in artifact.get('models', {}).items():
+        models[name] = MODEL_KINDS[spec['kind']](spec['intercept'], spec['coefficients'])
+    return artifact.get('version'), models
+
+def build_coefficients_artifact(models, version=None, training=None):
+    """
+    Turns {name: (kind, intercept, coefficients)} into a version-stamped
+    artifact, with optional `training` metadata (data source, fit metrics).
+    """
+    models = {
+        name: {'kind': kind, 'intercept': float(intercept), 'coefficients': [float(c) for c in coefficients]}
+        for name, (kind, intercept, coefficients) in models.items()
+    }
+    if version is None:
+        digest = hashlib.sha1(json.dumps(models, sort_keys=True).encode()).hexdigest()[:8]
+        version = f"{time.strftime('%Y%m%d%H%M%S')}-{digest}"
+    artifact = {'version': version, 'models': models}
+    if training:
+        artifact['training'] = training
+    return artifact
+
+def read_model_specs(path=None):
+    """{name: (kind, intercept, coefficients)} from a coefficient file (the live one by default), or {} if it is missing."""
+    try:
+        with open(path or COEFFICIENTS_PATH) as f:
+            artifact = json.load(f)
+    except OSError:
+        return {}
+    return {
+        name: (spec['kind'], spec['intercept'], spec['coefficients'])
+        for name, spec in artifact.get('models', {}).items()
+    }
+
+def write_coefficients(path, models, version=None, training=None):
+    """Atomically writes {name: (kind, intercept, coefficients)} to a coefficient file."""
+    artifact = build_coefficients_artifact(models, version, training)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(artifact, f, indent=2)
+    os.replace(tmp_path, path)
+    return artifact
+
+
+class ModelRegistry:
+    """
+    Keeps the regressors from the coefficient file in memory for the lifetime
+    of the process. The file is re-read only when its mtime changes, so
+    retraining on disk is picked up without a restart.
+    """
+
+    def __init__(self, path=COEFFICIENTS_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._version = None
+        self._models = {}
+        self._loads = 0
+        self._load_seconds = 0.0
+        self._counters = {}
+
+    def _counter(self, name):
+        return self._counters.setdefault(name, {'hits': 0, 'predictions': 0, 'predict_seconds': 0.0})
+
+    def get(self, name):
+        """Returns the named model, or None if the coefficient file (or the model) is missing."""
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return None
+
+        if self._mtime != mtime:
+            with self._lock:
+                if self._mtime != mtime:
+                    started = time.perf_counter()
+                    self._version, self._models = load_coefficients(self.path)
+                    self._mtime = mtime
+                    self._loads += 1
+                    self._load_seconds += time.perf_counter() - started
+        else:
+            self._counter(name)['hits'] += 1
+        return self._models.get(name)
+
+    def predict(self, name, *features):
+        """Runs the named model on `features` and records its latency."""
+        model = self.get(name)
+        if model is None:
+            return None
+        started = time.perf_counter()
+        result = model.predict(*features)
+        counter = self._counter(name)
+        counter['predictions'] += 1
+        counter['predict_seconds'] += time.perf_counter() - started
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._mtime = None
+            self._version = None
+            self._models = {}
+            self._loads = 0
+            self._load_seconds = 0.0
+            self._counters.clear()
+
+    def stats(self):
+        """Load count, loaded version and per-model hit counts and average latencies (ms)."""
+        models = {}
+        for name, counter in self._counters.items():
+            predictions = counter['predictions']
+            models[name] = {
+                'hits': counter['hits'],
+                'predictions': predictions,
+                'avg_predict_ms': (counter['predict_seconds'] / predictions * 1000) if predictions else 0.0,
+            }
+        return {
+            'version': self._version,
+            'loads': self._loads,
+            'avg_load_ms': (self._load_seconds / self._loads * 1000) if self._loads else 0.0,
+            'models': models,
+        }
+
+
+model_registry = ModelRegistry()
 
 def ensure_model_dir_exists():
-    if not os.path.exists(MODEL_DIR):
-        os.makedirs(MODEL_DIR)
+    if not os.path.exists(VERSIONS_DIR):
+        os.makedirs(VERSIONS_DIR)
 
-def train_and_save_models():
+def model_artifacts_exist():
+    return os.path.exists(COEFFICIENTS_PATH)
+
+def model_artifact_mtime():
+    """When the coefficient file last changed (None if missing); cached predictions depend on it."""
+    try:
+        return os.path.getmtime(COEFFICIENTS_PATH)
+    except OSError:
+        return None
+
+def publish_coefficients(models, training=None):
+    """Archives a new versioned artifact and then makes it the live coefficient file."""
     ensure_model_dir_exists()
+    version = build_coefficients_artifact(models)['version']
+    write_coefficients(os.path.join(VERSIONS_DIR, f"model_coefficients-{version}.json"), models, version, training)
+    return write_coefficients(COEFFICIENTS_PATH, models, version, training)
+
+def train_and_save_models(force=False):
+    """
+    Fits the seed models and publishes their coefficients. This is a
+    build/deploy step (`manage.py train_models`), never part of startup.
+    Returns the published artifact, or None if one already exists.
+    """
+    if model_artifacts_exist() and not force:
+        return None
+
+    # Training is the only place that needs the heavy ML stack.
+    import numpy as np
+    from sklearn.linear_model import LinearRegression
+    from sklearn.preprocessing import PolynomialFeatures
+    from sklearn.pipeline import Pipeline
 
-    if not os.path.exists(TIME_MODEL_PATH):
-        print("Training Delivery Time model...")
-        X_time = np.array([10, 25, 50, 80, 100, 150, 200]).reshape(-1, 1)
-        y_time = np.array([0.5, 1.1, 2.0, 3.5, 4.2, 6.8, 9.0])
-        time_model_pipeline = Pipeline([
-            ("poly_features", PolynomialFeatures(degree=2, include_bias=False)),
-            ("lin_reg", LinearRegression()),
-        ])
-        time_model_pipeline.fit(X_time, y_time)
-        
-        with open(TIME_MODEL_PATH, 'wb') as f:
-            pickle.dump(time_model_pipeline, f)
-        print("Delivery Time model trained and saved as .pkl.")
-
-    if not os.path.exists(COST_MODEL_PATH):
-        print("Training Maintenance Cost model...")
-        X_cost = np.array([[1, 20000], [2, 45000], [3, 60000], [4, 85000], [5, 110000]])
-        y_cost = np.array([150, 320, 480, 700, 950])
-        cost_model = LinearRegression()
-        cost_model.fit(X_cost, y_cost)
-        
-        with open(COST_MODEL_PATH, 'wb') as f:
-            pickle.dump(cost_model, f)
-        print("Maintenance Cost model trained and saved as .pkl.")
+    print("Training Delivery Time model...")
+    X_time = np.array([10, 25, 50, 80, 100, 150, 200]).reshape(-1, 1)
+    y_time = np.array([0.5, 1.1, 2.0, 3.5, 4.2, 6.8, 9.0])
+    time_model_pipeline = Pipeline([
+        ("poly_features", PolynomialFeatures(degree=2, include_bias=False)),
+        ("lin_reg", LinearRegression()),
+    ])
+    time_model_pipeline.fit(X_time, y_time)
+    time_regression = time_model_pipeline.named_steps['lin_reg']
+
+    print("Training Maintenance Cost model...")
+    X_cost = np.array([[1, 20000], [2, 45000], [3, 60000], [4, 85000], [5, 110000]])
+    y_cost = np.array([150, 320, 480, 700, 950])
+    cost_model = LinearRegression()
+    cost_model.fit(X_cost, y_cost)
+
+    return publish_coefficients({
+        DELIVERY_TIME_MODEL: ('polynomial', time_regression.intercept_, time_regression.coef_),
+        MAINTENANCE_COST_MODEL: ('linear', cost_model.intercept_, cost_model.coef_),
+    })
 
 #intercept=0.1892,linearCoeff=0.0195,quadraCoeff=0.00011
 def predict_delivery_time(distance_km):      #PredictedTime = intercept+(linearCoeff*dist)+(quadraCoeff*dist²)
-    """Loads the time prediction model and predicts delivery time."""
+    """Predicts delivery time from the cached coefficients."""
     if distance_km < 20:
         return (distance_km / 30.0) + 0.17
-    
-    if not os.path.exists(TIME_MODEL_PATH):
-        return (distance_km / 40.0)
 
-   
-    with open(TIME_MODEL_PATH, 'rb') as f:
-        model = pickle.load(f)
-    predicted_time = model.predict(np.array([[distance_km]]))
-    return predicted_time[0]
+    predicted_time = model_registry.predict(DELIVERY_TIME_MODEL, distance_km)
+    if predicted_time is None:
+        return (distance_km / 40.0)
+    return predicted_time
 
 #intercept=155.51,ageCoeff=-20.45,mileageCoeff=0.0082
 def predict_maintenance_cost(vehicle_age_years, distance_covered_km):  #PredictedCost =intercept+(ageCoeff*avgAge)+(MileageCoeff*avg_Mileage)
-    """Loads the cost prediction model and predicts maintenance cost."""
+    """Predicts maintenance cost from the cached coefficients."""
     if distance_covered_km < 10000:
         return 50 + (distance_covered_km * 0.01)
 
-    if not os.path.exists(COST_MODEL_PATH):
+    predicted_cost = model_registry.predict(MAINTENANCE_COST_MODEL, vehicle_age_years, distance_covered_km)
+    if predicted_cost is None:
         return 100 + (vehicle_age_years * 50)
+    return max(50, predicted_cost)
 
-    with open(COST_MODEL_PATH, 'rb') as f:
-        model = pickle.load(f)
-    predicted_cost = model.predict(np.array([[vehicle_age_years, distance_covered_km]]))
-    
-    return max(50, predicted_cost[0])
+def predict_delivery_time_batch(distances):
+    """Vectorized predict_delivery_time: one model call for a whole array of distances."""
+    import numpy as np
 
+    distances = np.asarray(distances, dtype=float).reshape(-1)
+    predicted = np.empty_like(distances)
+
+    short = distances < 20
+    predicted[short] = (distances[short] / 30.0) + 0.17
+
+    long_haul = ~short
+    if long_haul.any():
+        model_output = model_registry.predict(DELIVERY_TIME_MODEL, distances[long_haul])
+        if model_output is None:
+            predicted[long_haul] = distances[long_haul] / 40.0
+        else:
+            predicted[long_haul] = model_output
+    return predicted
+
+def predict_maintenance_cost_batch(vehicle_ages_years, distances_covered_km):
+    """Vectorized predict_maintenance_cost over matching arrays of ages and mileages."""
+    import numpy as np
+
+    ages = np.asarray(vehicle_ages_years, dtype=float).reshape(-1)
+    mileages = np.asarray(distances_covered_km, dtype=float).reshape(-1)
+    if ages.shape != mileages.shape:
+        raise ValueError("vehicle_ages_years and distances_covered_km must have the same length")
+    predicted = np.empty_like(mileages)
+
+    low_mileage = mileages < 10000
+    predicted[low_mileage] = 50 + (mileages[low_mileage] * 0.01)
+
+    high_mileage = ~low_mileage
+    if high_mileage.any():
+        model_output = model_registry.predict(MAINTENANCE_COST_MODEL, ages[high_mileage], mileages[high_mileage])
+        if model_output is None:
+            predicted[high_mileage] = 100 + (ages[high_mileage] * 50)
+        else:
+            predicted[high_mileage] = np.maximum(50, model_output)
+    return predicted
+
+
+def fetch_weather_forecast(city):
+    """
+    Calls OpenWeatherMap for `city` and returns e.g. "31.2°C, Light Rain".
+    Returns None when no forecast is available; raises ProviderError on API failures.
+    """
+    url = "http://api.openweathermap.org/data/2.5/weather"
+    params = {"q": city, "appid": settings.WEATHER_API_KEY, "units": "metric"}
+    data = providers.get_client('openweather').get_json(url, params=params)
+    if data.get("weather"):
+        temp = data['main']['temp']
+        description = data['weather'][0]['description'].title()
+        return f"{temp}°C, {description}"
+    return None
 
 def get_weather_forecast(city):
     if not city:
@@ -85,20 +325,9 @@ def get_weather_forecast(city):
         print("ERROR: WEATHER_API_KEY not set in settings.py")
         return "API key missing"
 
-    url = f"http://api.openweathermap.org/data/2.5/weather?q={city}&appid={api_key}&units=metric"
-
     try:
-        response = requests.get(url, timeout=5)
-        response.raise_for_status() 
-        data = response.json()
-
-        if data.get("weather"):
-            temp = data['main']['temp']
-            description = data['weather'][0]['description'].title()
-            return f"{temp}°C, {description}"
-        else:
-            return "Forecast unavailable"
-
-    except requests.exceptions.RequestException as e:
+        forecast = fetch_weather_forecast(city)
+    except providers.ProviderError as e:
         print(f"Error fetching weather from API: {e}")
         return "Forecast unavailable"
+    return forecast or "Forecast unavailable"
@@ -1,35 +1,27 @@
 import random
-import requests
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
-from django.db.models import Avg, Sum
-from django.db.models.functions import TruncMonth
-from datetime import date
+from django.utils.dateparse import parse_datetime
+from django.db.models import Avg, Case, Count, ExpressionWrapper, Q, Sum, Value, When
+from datetime import date, timedelta
 from collections import defaultdict
 import calendar as cal
 from rest_framework import viewsets, status, generics, serializers
+from rest_framework.decorators import action
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
-from .models import User, Product, Vehicle, Shipment, DeliveryAgent
+from .models import (
+    User, Product, Vehicle, Shipment, EnrichmentJob, ShipmentStatusRollup, MonthlyVolumeRollup,
+)
 from .serializers import (
     UserSerializer, ProductSerializer, VehicleSerializer,
-    ShipmentSerializer, DeliveryAgentSerializer
+    ShipmentSerializer, BulkShipmentSerializer,
+    LocationPointSerializer, LocationBatchSerializer,
 )
-from . import utils
-
-# --- Helper Function to get route from Google Maps ---
-def get_google_maps_route(origin_address, destination_address):
-    base_url = "https://maps.googleapis.com/maps/api/directions/json"
-    params = { "origin": origin_address, "destination": destination_address, "key": settings.GOOGLE_MAPS_API_KEY }
-    try:
-        response = requests.get(base_url, params=params)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        print(f"Error calling Google Maps API: {e}")
-        return None
+from .pagination import ShipmentCursorPagination
+from . import caching, enrichment, eta, geo, history, inventory, jobs, live, rollups, routing, tracking, utils
 
 # --- View for getting directions in the modal ---
 class GetDirectionsView(APIView):
@@ -39,13 +31,11 @@ class GetDirectionsView(APIView):
         end_address = request.data.get('end_address')
         if not start_address or not end_address:
             return Response({'error': 'Start and end addresses are required.'}, status=status.HTTP_400_BAD_REQUEST)
-        google_response = get_google_maps_route(start_address, end_address)
-        if not google_response or google_response['status'] != 'OK':
-            error_message = google_response.get('error_message', 'Could not calculate route.')
-            status_message = f"Google Maps Error: {google_response['status']}. {error_message}"
-            return Response({'error': status_message}, status=status.HTTP_400_BAD_REQUEST)
-        legs = google_response['routes'][0]['legs'][0]
-        return Response({'distance': legs['distance']['text'], 'duration': legs['duration']['text']}, status=status.HTTP_200_OK)
+        try:
+            route = routing.get_route(start_address, end_address)
+        except routing.RouteLookupError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'distance': route['distance_text'], 'duration': route['duration_text']}, status=status.HTTP_200_OK)
 
 # --- Authentication Views ---
 class SignupView(generics.CreateAPIView):
@@ -77,18 +67,24 @@ class ProductViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
 
+    @caching.cached_response('products')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
 class VehicleViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Vehicle.objects.all()
     serializer_class = VehicleSerializer
-    
+
+    @caching.cached_response('vehicles', 'shipments')
     def list(self, request, *args, **kwargs):
         vehicles_queryset = self.get_queryset()
         vehicles_serializer = self.get_serializer(vehicles_queryset, many=True)
         
-        active_shipments_queryset = Shipment.objects.filter(
-            status__in=['In Transit', 'Out for Delivery']
+        context = self.get_serializer_context()
+        active_shipments_queryset = ShipmentSerializer.setup_eager_loading(
+            Shipment.objects.filter(status__in=Shipment.ACTIVE_STATUSES), context
         )
-        active_shipments_serializer = ShipmentSerializer(active_shipments_queryset, many=True)
+        active_shipments_serializer = ShipmentSerializer(active_shipments_queryset, many=True, context=context)
         
         data = {
             'vehicles': vehicles_serializer.data,
@@ -97,11 +93,99 @@ class VehicleViewSet(viewsets.ReadOnlyModelViewSet):
         return Response(data)
 
 
+# --- Fleet Map ---
+class FleetMapView(APIView):
+    """
+    GET /api/fleet-map/?bbox=west,south,east,north&zoom=Z
+
+    Active shipments whose current position or route falls inside the
+    viewport, with routes simplified for the zoom level (see api/geo.py),
+    and the vehicles last seen inside it.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            bbox = geo.parse_bbox(request.query_params.get('bbox', ''))
+            zoom = geo.parse_zoom(request.query_params.get('zoom', geo.MAX_ZOOM))
+        except ValueError as e:
+            return Response({'error': f"Invalid bbox or zoom: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+        west, south, east, north = bbox
+
+        rows = list(
+            Shipment.objects.filter(status__in=Shipment.ACTIVE_STATUSES)
+            .values_list('id', 'status', 'agent_id', 'vehicle_id', 'current_lat', 'current_lng')
+        )
+        missing = geo.fleet_map_cache.missing([row[0] for row in rows])
+        if missing:
+            for shipment_id, encoded in Shipment.objects.filter(pk__in=missing).values_list('id', 'route_polyline').iterator():
+                geo.fleet_map_cache.add(shipment_id, encoded)
+
+        shipments = []
+        for shipment_id, shipment_status, agent_id, vehicle_id, lat, lng in rows:
+            visible = geo.contains(bbox, lat, lng)
+            route_bbox = geo.fleet_map_cache.route_bbox(shipment_id)
+            polyline = None
+            if route_bbox and geo.bboxes_overlap(route_bbox, bbox):
+                polyline, points = geo.fleet_map_cache.simplified(shipment_id, zoom)
+                visible = visible or geo.path_intersects(points, bbox)
+            if visible:
+                shipments.append({
+                    'id': shipment_id, 'status': shipment_status, 'agent': agent_id, 'vehicle': vehicle_id,
+                    'current_lat': lat, 'current_lng': lng, 'route_polyline': polyline,
+                })
+
+        vehicles = Vehicle.objects.filter(last_lat__range=(south, north), last_lng__range=(west, east)).values(
+            'id', 'name', 'license_plate', 'is_available', 'last_lat', 'last_lng'
+        )
+        return Response({'zoom': geo.zoom_bucket(zoom), 'shipments': shipments, 'vehicles': list(vehicles)})
+
+
 # --- Main Shipment Logic ---
 class ShipmentViewSet(viewsets.ModelViewSet):
     serializer_class = ShipmentSerializer
+    pagination_class = ShipmentCursorPagination
+
+    def get_object(self):
+        return tracking.overlay([super().get_object()])[0]
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(tracking.overlay(page), many=True).data)
+        return Response(self.get_serializer(tracking.overlay(list(queryset)), many=True).data)
+
     def get_queryset(self):
-        return Shipment.objects.filter(client=self.request.user).order_by('-created_at')
+        queryset = Shipment.objects.filter(client=self.request.user).order_by('-created_at', '-id')
+        status_filter = self.request.query_params.get('status')
+        if status_filter:
+            queryset = queryset.filter(status__in=status_filter.split(','))
+        return self.get_serializer_class().setup_eager_loading(queryset, self.get_serializer_context())
+
+    @action(detail=False, methods=['get'])
+    def etas(self, request):
+        """
+        ETAs for all of the client's active shipments, from the distance left
+        along the stored route (see api/eta.py), predicted in one batch.
+        """
+        rows = list(
+            self.get_queryset()
+            .filter(status__in=Shipment.ACTIVE_STATUSES, distance_km__isnull=False)
+            .values_list('id', 'status', 'distance_km', 'current_lat', 'current_lng')
+        )
+        estimates = eta.live_etas({row[0]: (row[3], row[4]) for row in rows})
+        fallback = [row for row in rows if row[0] not in estimates]
+        for row, hours in zip(fallback, utils.predict_delivery_time_batch([row[2] for row in fallback])):
+            estimates[row[0]] = (row[2], float(hours))
+        data = [
+            {
+                'id': shipment_id, 'status': shipment_status, 'distance_km': distance_km,
+                'remaining_km': round(estimates[shipment_id][0], 2), 'predicted_hours': round(estimates[shipment_id][1], 2),
+            }
+            for shipment_id, shipment_status, distance_km, _, _ in rows
+        ]
+        return Response(data, status=status.HTTP_200_OK)
 
     def perform_create(self, serializer):
         product = serializer.validated_data.get('product')
@@ -109,102 +193,217 @@ class ShipmentViewSet(viewsets.ModelViewSet):
         if product.stock < quantity:
             raise serializers.ValidationError(f"Out of stock. Only {product.stock} units available for {product.name}.")
         
-        available_agents = list(DeliveryAgent.objects.filter(is_available=True))
-        available_vehicles = list(Vehicle.objects.filter(is_available=True))
-        if not available_agents or not available_vehicles:
-            raise serializers.ValidationError("No available delivery agents or vehicles at the moment.")
-        
-        agent = random.choice(available_agents)
-        vehicle = random.choice(available_vehicles)
-        start_address = serializer.validated_data.get('start_address')
-        end_address = serializer.validated_data.get('end_address')
-        
-        google_response = get_google_maps_route(start_address, end_address)
-        if not google_response or google_response['status'] != 'OK':
-            error_message = google_response.get('error_message', 'Could not calculate route.')
-            status_message = f"Google Maps Error: {google_response['status']}. {error_message}"
-            raise serializers.ValidationError(status_message)
-        
-        route = google_response['routes'][0]
-        legs = route['legs'][0]
-        distance_km = legs['distance']['value'] / 1000.0
-        predicted_duration_hours = utils.predict_delivery_time(distance_km)
-        predicted_duration_text = f"{predicted_duration_hours:.1f} hours"
-        
-        
-        
-        print(f"DEBUG: Full address received: '{end_address}'")
-        
-        address_parts = [part.strip() for part in end_address.split(',')]
-        if len(address_parts) >= 2:
-            destination_city = address_parts[-2]
-        else:
-            destination_city = address_parts[0]
-
-        print(f"DEBUG: Parsed city for weather: '{destination_city}'")
-        weather_forecast = utils.get_weather_forecast(destination_city)
-        print(f"DEBUG: Fetched weather result: '{weather_forecast}'")
-        
-        shipment = serializer.save(
-            client=self.request.user, agent=agent, vehicle=vehicle, status='In Transit',
-            start_location_lat=legs['start_location']['lat'],
-            start_location_lng=legs['start_location']['lng'],
-            end_location_lat=legs['end_location']['lat'],
-            end_location_lng=legs['end_location']['lng'],
-            route_polyline=route['overview_polyline']['points'],
-            distance_km=distance_km,
-            predicted_duration=predicted_duration_text,
-            weather_forecast=weather_forecast,
-            current_lat=legs['start_location']['lat'], 
-            current_lng=legs['start_location']['lng']
-        )
-        
-        agent.is_available = False
-        vehicle.is_available = False
-        agent.save()
-        vehicle.save()
-        
+        client = self.request.user
+
+        def reserve_and_save(**fields):
+            inventory.reserve(product.id, quantity)
+            shipment = serializer.save(client=client, stock_reserved=True, **fields)
+            rollups.created([shipment])
+            return shipment
+
+        try:
+            if settings.SHIPMENT_ENRICHMENT_ASYNC:
+                with transaction.atomic():
+                    jobs.enqueue(reserve_and_save(status='Pending'))
+                return
+
+            enrichment.enrich_and_save(
+                serializer.validated_data.get('start_address'),
+                serializer.validated_data.get('end_address'),
+                reserve_and_save,
+            )
+        except (enrichment.NoResourcesAvailable, routing.RouteLookupError, inventory.OutOfStock) as e:
+            raise serializers.ValidationError(str(e))
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            # Locked so the reservation and rollup deltas match the row being replaced.
+            serializer.instance = shipment = Shipment.objects.select_for_update().get(pk=serializer.instance.pk)
+            before = rollups.snapshot(shipment)
+            product = serializer.validated_data.get('product', shipment.product)
+            quantity = serializer.validated_data.get('quantity', shipment.quantity)
+            reservation_changed = (product.id, quantity) != (shipment.product_id, shipment.quantity)
+            if shipment.stock_reserved and shipment.status != 'Delivered' and reservation_changed:
+                inventory.release(shipment.product_id, shipment.quantity)
+                try:
+                    inventory.reserve(product.id, quantity)
+                except inventory.OutOfStock as e:
+                    raise serializers.ValidationError(str(e))
+            rollups.record(before, rollups.snapshot(serializer.save()))
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            before = rollups.snapshot(instance)
+            # Undelivered shipments give their reserved stock back (once).
+            reserved = Shipment.objects.filter(pk=instance.pk, stock_reserved=True).exclude(status='Delivered')
+            if reserved.update(stock_reserved=False):
+                inventory.release(instance.product_id, instance.quantity)
+            instance.delete()
+            rollups.record(before, None)
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Creates many shipments in one request. Accepts a list of orders (or
+        {"shipments": [...]}) with product_id, quantity, start_address and
+        end_address. Validation is all-or-nothing; orders that cannot be
+        routed or assigned are reported per index in `errors`.
+        """
+        payload = {'shipments': request.data} if isinstance(request.data, list) else request.data
+        serializer = BulkShipmentSerializer(data=payload)
+        serializer.is_valid(raise_exception=True)
+        items = serializer.validated_data['shipments']
+
+        try:
+            if settings.SHIPMENT_ENRICHMENT_ASYNC:
+                with transaction.atomic():
+                    inventory.reserve_many(enrichment.quantities_by_product(items))
+                    shipments = Shipment.objects.bulk_create([
+                        Shipment(
+                            client=request.user, product=item['product'], quantity=item['quantity'], stock_reserved=True,
+                            start_address=item['start_address'], end_address=item['end_address'], status='Pending',
+                        )
+                        for item in items
+                    ])
+                    jobs.enqueue_many(shipments)
+                    rollups.created(shipments)
+                created, errors = list(enumerate(shipments)), []
+            else:
+                created, errors = enrichment.bulk_enrich_and_create(request.user, items)
+        except inventory.OutOfStock as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        data = {
+            'created': [
+                {'index': index, 'id': shipment.id, 'status': shipment.status, 'predicted_duration': shipment.predicted_duration}
+                for index, shipment in created
+            ],
+            'errors': errors,
+        }
+        return Response(data, status=status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=True, methods=['get'])
+    def enrichment(self, request, pk=None):
+        """Progress of the background enrichment for a shipment created in async mode."""
+        shipment = self.get_object()
+        job = EnrichmentJob.objects.filter(shipment=shipment).first()
+        data = {'id': shipment.id, 'status': shipment.status, 'enrichment': None}
+        if job:
+            data['enrichment'] = {
+                'status': job.status,
+                'attempts': job.attempts,
+                'last_error': job.last_error or None,
+                'next_attempt_at': job.run_after if job.status == 'queued' else None,
+            }
+        return Response(data, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=['get'])
+    def track(self, request, pk=None):
+        """
+        Recorded GPS track for replay: ?from= and ?to= (ISO 8601) bound the
+        range. Points still in the ingestion buffer are included.
+        """
+        shipment = self.get_object()
+        bounds = {}
+        for name in ('from', 'to'):
+            raw = request.query_params.get(name)
+            if raw:
+                try:
+                    bounds[name] = parse_datetime(raw)
+                except ValueError:  # well formed but impossible, e.g. February 30th
+                    bounds[name] = None
+                if bounds[name] is None:
+                    return Response({'error': f"Invalid '{name}' datetime."}, status=status.HTTP_400_BAD_REQUEST)
+                if timezone.is_naive(bounds[name]):
+                    bounds[name] = timezone.make_aware(bounds[name])
+        points = history.track(shipment.id, bounds.get('from'), bounds.get('to'))
+        points = sorted(points + tracking.location_buffer.track(shipment.id, bounds.get('from'), bounds.get('to')))
+        return Response({
+            'id': shipment.id,
+            'points': [[ts.isoformat(), lat, lng] for ts, lat, lng in points],
+            'polyline': geo.encode_polyline([(lat, lng) for _, lat, lng in points]),
+        }, status=status.HTTP_200_OK)
+
 # --- Analytics View ---
 class DashboardAnalyticsView(APIView):
+    """
+    Dashboard stats, charts and predictions. Shipment counts and monthly
+    volume come from the rollup tables maintained by api/rollups.py, and
+    the whole response is cached per user until one of their shipments, a
+    product or a vehicle changes (see api/caching.py).
+    """
+    @staticmethod
+    def on_time_percentage(user):
+        """
+        Share of the user's delivered shipments that arrived by their
+        expected_delivery_at, in one aggregate over shipment_on_time_idx.
+        """
+        counts = Shipment.objects.filter(client=user, status='Delivered').aggregate(
+            measured=Count('expected_delivery_at', filter=Q(delivered_at__isnull=False)),
+            on_time=Count('expected_delivery_at', filter=Q(delivered_at__lte=models.F('expected_delivery_at'))),
+        )
+        return round(100 * counts['on_time'] / counts['measured']) if counts['measured'] else None
+
+    @caching.cached_response(
+        'shipments:{user}', 'products', 'vehicles',
+        extra=lambda request: (date.today(), utils.model_artifact_mtime()),
+    )
     def get(self, request):
         user = request.user
-        total_shipments = Shipment.objects.filter(client=user).count()
-        in_transit_count = Shipment.objects.filter(client=user, status='In Transit').count()
-        delivered_count = Shipment.objects.filter(client=user, status='Delivered').count()
-        low_stock_products = Product.objects.filter(stock__gt=0, stock__lt=models.F('low_stock_threshold')).count()
-        out_of_stock_products = Product.objects.filter(stock=0).count()
-        total_alerts = low_stock_products + out_of_stock_products
-        
-        user_shipments = Shipment.objects.filter(client=user)
-        average_distance_agg = user_shipments.aggregate(Avg('distance_km'))
-        average_distance = average_distance_agg['distance_km__avg'] or 75
+        status_rows = list(
+            ShipmentStatusRollup.objects.filter(client=user)
+            .values_list('status', 'shipment_count', 'distance_km_total', 'distance_count')
+        )
+        counts = {row[0]: row[1] for row in status_rows}
+        total_shipments = sum(counts.values())
+        in_transit_count = counts.get('In Transit', 0)
+        delivered_count = counts.get('Delivered', 0)
+        distance_count = sum(row[3] for row in status_rows)
+
+        product_stats = Product.objects.aggregate(
+            low_stock=Count('id', filter=Q(stock__gt=0, stock__lt=models.F('low_stock_threshold'))),
+            out_of_stock=Count('id', filter=Q(stock=0)),
+        )
+        total_alerts = product_stats['low_stock'] + product_stats['out_of_stock']
+
+        average_distance = (sum(row[2] for row in status_rows) / distance_count if distance_count else 0) or 75
         predicted_time_hours = utils.predict_delivery_time(average_distance)
-        
-        all_vehicles = Vehicle.objects.filter(purchase_date__isnull=False)
-        total_age_days = 0
-        for vehicle in all_vehicles:
-            age_in_days = (date.today() - vehicle.purchase_date).days
-            total_age_days += max(0, age_in_days)
-        average_age_years = (total_age_days / 365.25) / all_vehicles.count() if all_vehicles.count() > 0 else 2
-        average_mileage_agg = all_vehicles.aggregate(Avg('total_km_driven'))
-        average_mileage = average_mileage_agg['total_km_driven__avg'] or 50000
+
+        today = date.today()
+        vehicle_age = Case(
+            When(purchase_date__lte=today, then=ExpressionWrapper(
+                Value(today, output_field=models.DateField()) - models.F('purchase_date'), output_field=models.DurationField(),
+            )),
+            default=Value(timedelta(0)),
+            output_field=models.DurationField(),
+        )
+        vehicle_stats = Vehicle.objects.filter(purchase_date__isnull=False).aggregate(
+            count=Count('id'), average_age=Avg(vehicle_age), average_mileage=Avg('total_km_driven'),
+        )
+        average_age_years = vehicle_stats['average_age'].days / 365.25 if vehicle_stats['count'] > 0 else 2
+        average_mileage = vehicle_stats['average_mileage'] or 50000
         predicted_maint_cost = utils.predict_maintenance_cost(average_age_years, average_mileage)
         if predicted_maint_cost < 50:
             predicted_maint_cost = 50.0
-        
-        delivered_shipments = Shipment.objects.filter(client=request.user, status='Delivered')
-        monthly_totals = delivered_shipments.annotate(month=TruncMonth('created_at')).values('month').annotate(total_quantity=Sum('quantity')).values('month', 'total_quantity')
-        
+
+        volume_by_month_and_product = (
+            MonthlyVolumeRollup.objects.filter(client=user, quantity__gt=0)
+            .values('month', 'product_id', 'product__name')
+            .annotate(total_quantity=Sum('quantity'))
+            .order_by('month', 'product__name')
+        )
+        month_map = defaultdict(int)
         product_details_by_month = defaultdict(list)
-        for shipment in delivered_shipments:
-            month_key = shipment.created_at.month
-            product_details_by_month[month_key].append({
-                'name': shipment.product.name,
-                'quantity': shipment.quantity
+        for row in volume_by_month_and_product:
+            if not row['month']:
+                continue
+            month_map[row['month'].month] += row['total_quantity']
+            product_details_by_month[row['month'].month].append({
+                'name': row['product__name'],
+                'quantity': row['total_quantity']
             })
 
         monthly_volume_data = []
-        month_map = {item['month'].month: item['total_quantity'] for item in monthly_totals if item['month']}
         for i in range(1, 13):
             month_name = cal.month_abbr[i]
             total_volume = month_map.get(i, 0)
@@ -215,12 +414,13 @@ class DashboardAnalyticsView(APIView):
                 "products": products
             })
         
-        on_time_percentage = random.randint(85, 98)
+        on_time_percentage = self.on_time_percentage(user)
+        delivery_performance = [on_time_percentage, 100 - on_time_percentage] if on_time_percentage is not None else [0, 0]
         data = {
             'stats': { 'totalShipments': total_shipments, 'inTransit': in_transit_count, 'delivered': delivered_count, 'lowStockAlerts': total_alerts },
             'charts': {
                 'monthlyVolume': monthly_volume_data,
-                'deliveryPerformance': { 'labels': ['On-Time', 'Delayed'], 'data': [on_time_percentage, 100 - on_time_percentage] }
+                'deliveryPerformance': { 'labels': ['On-Time', 'Delayed'], 'data': delivery_performance }
             },
             'predictions': { 'deliveryTime': f"{predicted_time_hours:.1f} hours", 'maintenanceCost': f"₹{predicted_maint_cost:.2f}" }
         }
@@ -236,32 +436,47 @@ class MarkAsDeliveredView(APIView):
         except Shipment.DoesNotExist:
             return Response({'error': 'Shipment not found.'}, status=status.HTTP_404_NOT_FOUND)
 
-        if shipment.status != 'Delivered':
-            product = shipment.product
-            if product.stock >= shipment.quantity:
-                product.stock -= shipment.quantity
-                product.save()
-            else:
-                print(f"Warning: Stock for {product.name} was insufficient at time of delivery.")
+        with transaction.atomic():
+            # Locked so only one concurrent request delivers it, and the rollup
+            # delta is taken from the status actually being replaced.
+            shipment = Shipment.objects.select_for_update().get(pk=shipment.pk)
+            if shipment.status == 'Delivered':
+                return Response({'status': 'Shipment was already delivered'}, status=status.HTTP_200_OK)
+            delivered_at = timezone.now()
+            Shipment.objects.filter(pk=shipment.pk).update(status='Delivered', delivered_at=delivered_at)
+            before = rollups.snapshot(shipment)
+            shipment.status, shipment.delivered_at = 'Delivered', delivered_at
+            rollups.record(before, rollups.snapshot(shipment))
+            transaction.on_commit(lambda: live.publish(shipment.id, status='Delivered', delivered_at=delivered_at))
+
+            if not inventory.consume_on_delivery(shipment):
+                print(f"Warning: Stock for {shipment.product.name} was insufficient at time of delivery.")
 
-            shipment.status = 'Delivered'
-            shipment.delivered_at = timezone.now()
-            shipment.save()
+            # The drop-off point becomes the agent's and vehicle's last known position.
+            drop_lat = shipment.end_location_lat if shipment.end_location_lat is not None else shipment.current_lat
+            drop_lng = shipment.end_location_lng if shipment.end_location_lng is not None else shipment.current_lng
+            has_drop = drop_lat is not None and drop_lng is not None
 
             if shipment.agent:
                 shipment.agent.is_available = True
-                shipment.agent.save()
+                update_fields = ['is_available']
+                if has_drop:
+                    shipment.agent.last_lat, shipment.agent.last_lng = drop_lat, drop_lng
+                    update_fields += ['last_lat', 'last_lng']
+                shipment.agent.save(update_fields=update_fields)
 
             if shipment.vehicle:
+                update_fields = ['is_available']
                 if shipment.distance_km:
-                    shipment.vehicle.total_km_driven += shipment.distance_km
+                    shipment.vehicle.total_km_driven = models.F('total_km_driven') + shipment.distance_km
+                    update_fields.append('total_km_driven')
                 shipment.vehicle.is_available = True
-                shipment.vehicle.save()
-            
-            return Response({'status': 'Shipment marked as delivered'}, status=status.HTTP_200_OK)
-        
-        
-        return Response({'status': 'Shipment was already delivered'}, status=status.HTTP_200_OK)
+                if has_drop:
+                    shipment.vehicle.last_lat, shipment.vehicle.last_lng = drop_lat, drop_lng
+                    update_fields += ['last_lat', 'last_lng']
+                shipment.vehicle.save(update_fields=update_fields)
+
+        return Response({'status': 'Shipment marked as delivered'}, status=status.HTTP_200_OK)
 
 # --- View to Update Intermediate Statuses ---
 class UpdateStatusView(APIView):
@@ -274,8 +489,14 @@ class UpdateStatusView(APIView):
         new_status = request.data.get('status')
         valid_statuses = [choice[0] for choice in Shipment.STATUS_CHOICES]
         if new_status in valid_statuses:
-            shipment.status = new_status
-            shipment.save()
+            with transaction.atomic():
+                # Locked so the rollup delta is taken from the status actually being replaced.
+                shipment = Shipment.objects.select_for_update().get(pk=shipment.pk)
+                before = rollups.snapshot(shipment)
+                shipment.status = new_status
+                shipment.save(update_fields=['status'])
+                rollups.record(before, rollups.snapshot(shipment))
+            live.publish(shipment.id, status=new_status)
             return Response({'status': f'Shipment status updated to {new_status}'}, status=status.HTTP_200_OK)
         return Response({'error': 'Invalid status provided'}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -284,15 +505,27 @@ class UpdateLocationView(APIView):
     permission_classes = [IsAuthenticated]
     
     def post(self, request, pk):
-        try:
-            shipment = Shipment.objects.get(pk=pk, client=request.user)
-        except Shipment.DoesNotExist:
+        point = {name: request.data.get(name) for name in ('lat', 'lng', 'ts') if request.data.get(name) is not None}
+        serializer = LocationPointSerializer(data={**point, 'shipment_id': pk})
+        if not serializer.is_valid():
+            return Response({'error': 'Invalid coordinates'}, status=status.HTTP_400_BAD_REQUEST)
+        if tracking.ingest(request.user, [serializer.validated_data]):
             return Response({'error': 'Shipment not found.'}, status=status.HTTP_404_NOT_FOUND)
-        lat = request.data.get('lat')
-        lng = request.data.get('lng')
-        if lat is not None and lng is not None:
-            shipment.current_lat = lat
-            shipment.current_lng = lng
-            shipment.save()
-            return Response({'status': 'Location updated'}, status=status.HTTP_200_OK)
-        return Response({'error': 'Invalid coordinates'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'status': 'Location updated'}, status=status.HTTP_200_OK)
+
+class LocationBatchView(APIView):
+    """
+    POST /api/locations/ with a list of {shipment_id, lat, lng, ts} points (or
+    {"points": [...]}). Points are coalesced per shipment and written in
+    batches (see api/tracking.py); `rejected` lists the indexes of points for
+    shipments the caller does not own.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        payload = {'points': request.data} if isinstance(request.data, list) else request.data
+        serializer = LocationBatchSerializer(data=payload)
+        serializer.is_valid(raise_exception=True)
+        points = serializer.validated_data['points']
+        rejected = tracking.ingest(request.user, points)
+        return Response({'accepted': len(points) - len(rejected), 'rejected': rejected}, status=status.HTTP_202_ACCEPTED)
@@ -0,0 +1,173 @@
+"""
+Per-city weather cache with stale-while-revalidate semantics.
+
+Hundreds of shipments go to the same few cities every hour, so forecasts are
+cached per city in process memory and in the `WeatherSnapshot` table:
+
+* younger than WEATHER_CACHE_TTL   -> served as is;
+* within WEATHER_CACHE_MAX_STALE   -> served stale while a background refresh runs;
+* missing or older                 -> "Forecast pending" is returned and the
+                                      forecast is fetched in the background.
+
+Request handlers therefore never block on OpenWeatherMap. The
+`warm_weather_cache` management command keeps the busiest destinations fresh.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from . import caching, providers, utils
+from .models import Shipment, WeatherSnapshot
+
+FORECAST_PENDING = "Forecast pending"
+FORECAST_UNAVAILABLE = "Forecast unavailable"
+
+
+def fetch_forecast(city):
+    """Calls the API for `city` without touching the cache; returns None on failure."""
+    try:
+        return utils.fetch_weather_forecast(city)
+    except providers.ProviderError as e:
+        print(f"Error refreshing weather for {city}: {e}")
+        return None
+
+def destination_city(end_address):
+    """Best-effort city from a Google-formatted address ("street, city, state pin, country")."""
+    address_parts = [part.strip() for part in (end_address or '').split(',')]
+    if len(address_parts) >= 2:
+        return address_parts[-2]
+    return address_parts[0]
+
+def city_key(city):
+    return ' '.join((city or '').split()).lower()
+
+
+class WeatherCache:
+    def __init__(self, ttl=None, max_stale=None, workers=None):
+        self.ttl = ttl or settings.WEATHER_CACHE_TTL
+        self.max_stale = max_stale or settings.WEATHER_CACHE_MAX_STALE
+        self.workers = workers or settings.WEATHER_REFRESH_WORKERS
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._in_flight = {}
+        self._executor = None
+        self._counters = {'fresh_hits': 0, 'stale_hits': 0, 'misses': 0, 'refreshes': 0, 'refresh_failures': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _lookup(self, key):
+        """(forecast, fetched_at) from memory, falling back to the table when memory is not fresh."""
+        entry = self._entries.get(key)
+        if entry and timezone.now() - entry[1] < self.ttl:
+            return entry
+        snapshot = WeatherSnapshot.objects.filter(city_key=key).values_list('forecast', 'fetched_at').first()
+        if snapshot:
+            self._entries[key] = snapshot
+            return snapshot
+        return entry
+
+    def lookup(self, city):
+        """
+        Returns (forecast, state) without scheduling anything, where state is
+        'fresh', 'stale' or 'missing' (forecast is None when missing).
+        """
+        entry = self._lookup(city_key(city))
+        age = timezone.now() - entry[1] if entry else None
+        if entry and age < self.ttl:
+            self._count('fresh_hits')
+            return entry[0], 'fresh'
+        if entry and age < self.ttl + self.max_stale:
+            self._count('stale_hits')
+            return entry[0], 'stale'
+        self._count('misses')
+        return None, 'missing'
+
+    def get(self, city):
+        """Returns the cached forecast for `city` (possibly stale) or None, never calling the API inline."""
+        forecast, state = self.lookup(city)
+        if state != 'fresh':
+            self.schedule_refresh(city)
+        return forecast
+
+    def store(self, city, forecast):
+        key, fetched_at = city_key(city), timezone.now()
+        WeatherSnapshot.objects.update_or_create(
+            city_key=key, defaults={'city': city[:100], 'forecast': forecast[:100], 'fetched_at': fetched_at},
+        )
+        self._entries[key] = (forecast, fetched_at)
+        self._count('refreshes')
+
+    def refresh(self, city):
+        """Fetches and stores the forecast for `city` synchronously; returns it, or None on failure."""
+        forecast = fetch_forecast(city)
+        if not forecast:
+            self._count('refresh_failures')
+            return None
+        self.store(city, forecast)
+        return forecast
+
+    def schedule_refresh(self, city, callback=None):
+        """Refreshes `city` on the background pool; concurrent requests for one city share a single fetch."""
+        key = city_key(city)
+        with self._lock:
+            if key in self._in_flight:
+                if callback:
+                    self._in_flight[key].append(callback)
+                return
+            self._in_flight[key] = [callback] if callback else []
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='weather-refresh')
+        self._executor.submit(self._background_refresh, city, key)
+
+    def _background_refresh(self, city, key):
+        forecast = None
+        try:
+            forecast = self.refresh(city)
+        finally:
+            with self._lock:
+                callbacks = self._in_flight.pop(key, [])
+            try:
+                for callback in callbacks:
+                    callback(forecast)
+            finally:
+                close_old_connections()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            for name in self._counters:
+                self._counters[name] = 0
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, cities=len(self._entries), refreshing=len(self._in_flight))
+
+
+weather_cache = WeatherCache()
+
+
+def get_forecast(city):
+    """Forecast text for a shipment destination, or FORECAST_PENDING while it is being fetched."""
+    if not city:
+        return "N/A"
+    if not settings.WEATHER_API_KEY:
+        print("ERROR: WEATHER_API_KEY not set in settings.py")
+        return "API key missing"
+    return weather_cache.get(city) or FORECAST_PENDING
+
+def fill_shipments_forecast(shipment_ids, city):
+    """Fetches `city` in the background and writes it onto those shipments still showing FORECAST_PENDING."""
+    def apply(forecast):
+        Shipment.objects.filter(pk__in=shipment_ids, weather_forecast=FORECAST_PENDING).update(
+            weather_forecast=forecast or FORECAST_UNAVAILABLE
+        )
+        caching.invalidate('shipments')
+    weather_cache.schedule_refresh(city, callback=apply)
+
+def fill_shipment_forecast(shipment_id, city):
+    fill_shipments_forecast([shipment_id], city)
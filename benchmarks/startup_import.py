@@ -0,0 +1,63 @@
+"""
+Cold-start import benchmark.
+
+Measures, in fresh interpreters, how long it takes to set up Django and import
+the API views (what every Vercel cold start pays), and compares it with the
+same startup plus the scikit-learn / numpy / BeautifulSoup imports that the
+request path used to pull in.
+
+    python benchmarks/startup_import.py [--runs 7]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STARTUP = "import django; django.setup(); import api.views"
+LEGACY_STACK = (
+    "; import numpy, bs4; "
+    "from sklearn.linear_model import LinearRegression; "
+    "from sklearn.preprocessing import PolynomialFeatures; "
+    "from sklearn.pipeline import Pipeline"
+)
+
+SCENARIOS = {
+    'closed-form inference (current)': STARTUP,
+    'with sklearn/numpy/bs4 (previous)': STARTUP + LEGACY_STACK,
+}
+
+
+def time_import(statement):
+    code = (
+        "import time; _t = time.perf_counter(); "
+        f"{statement}; "
+        "print(time.perf_counter() - _t)"
+    )
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE='logiflow_backend.settings', RUN_MAIN='true')
+    result = subprocess.run(
+        [sys.executable, '-c', code], cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=7)
+    args = parser.parse_args()
+
+    medians = {}
+    for label, statement in SCENARIOS.items():
+        time_import(statement)  # warm the OS page cache
+        samples = [time_import(statement) for _ in range(args.runs)]
+        medians[label] = statistics.median(samples)
+        print(f"{label:<36} median {medians[label] * 1000:8.1f} ms  (min {min(samples) * 1000:.1f} ms)")
+
+    current, previous = medians.values()
+    print(f"{'saved per cold start':<36} {(previous - current) * 1000:8.1f} ms  ({previous / current:.1f}x faster)")
+
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,15 @@ ASGI config for logiflow project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The live tracking stream (GET /api/live/, see api/live.py) only works when
+the app is served through this entry point, e.g.
+
+    uvicorn logiflow_backend.asgi:application
+
+with a single worker, since its publish/subscribe broker is in process.
+The WSGI entry point (gunicorn, vercel.json) serves everything else and
+answers /api/live/ with 501.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
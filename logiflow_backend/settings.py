@@ -119,6 +119,13 @@ DATABASES = {
     }
 }
 
+# Cache (response cache in api/caching.py). The in-memory default is per
+# process; set CACHE_REDIS_URL when running several workers.
+if os.getenv("CACHE_REDIS_URL"):
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': os.getenv("CACHE_REDIS_URL")}}
+else:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'OPTIONS': {'MAX_ENTRIES': 10000}}}
+
 AUTHENTICATION_BACKENDS = [
     'django.contrib.auth.backends.ModelBackend',
 ]
@@ -184,3 +191,78 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 load_dotenv()
 #Your weather API key
 WEATHER_API_KEY = os.getenv("WEATHER_API_KEY")
+
+# Google Directions route cache (api/routing.py)
+ROUTE_CACHE_TTL = timedelta(hours=int(os.getenv("ROUTE_CACHE_TTL_HOURS", 24)))
+ROUTE_CACHE_MEMORY_SIZE = 1024
+ROUTE_CACHE_MAX_ROWS = 50000
+
+# Pooled HTTP clients for external providers (api/providers.py).
+# `timeout` is the overall per-call deadline in seconds, including retries.
+EXTERNAL_PROVIDERS = {
+    'google_maps': {'timeout': 6.0, 'retries': 2, 'failure_threshold': 5, 'reset_timeout': 30.0},
+    'openweather': {'timeout': 3.0, 'retries': 1, 'failure_threshold': 5, 'reset_timeout': 60.0},
+}
+
+# Per-city weather cache (api/weather.py)
+WEATHER_CACHE_TTL = timedelta(minutes=int(os.getenv("WEATHER_CACHE_TTL_MINUTES", 30)))
+WEATHER_CACHE_MAX_STALE = timedelta(hours=6)
+WEATHER_REFRESH_WORKERS = 2
+
+# Concurrent route/weather enrichment on shipment creation (api/enrichment.py)
+ENRICHMENT_WORKERS = 8
+ENRICHMENT_TIMEOUT = float(os.getenv("ENRICHMENT_TIMEOUT_SECONDS", 8))
+
+# Asynchronous shipment enrichment (api/jobs.py). When enabled, creating a
+# shipment only stores it as Pending; `manage.py run_enrichment_worker` must
+# be running to fill in route, ETA, weather and assignment.
+SHIPMENT_ENRICHMENT_ASYNC = os.getenv("SHIPMENT_ENRICHMENT_ASYNC", "false").lower() in ("1", "true", "yes")
+ENRICHMENT_JOB_BATCH_SIZE = 20
+ENRICHMENT_JOB_MAX_ATTEMPTS = 5
+ENRICHMENT_JOB_BACKOFF = timedelta(seconds=15)
+ENRICHMENT_JOB_LEASE = timedelta(minutes=5)
+
+# Maximum number of orders accepted by POST /api/shipments/bulk/
+BULK_SHIPMENT_MAX_ITEMS = 500
+
+# Cursor pagination of GET /api/shipments/ (used when ?cursor= or ?page_size= is given)
+SHIPMENT_PAGE_SIZE = 50
+SHIPMENT_MAX_PAGE_SIZE = 500
+
+# Fleet map (api/geo.py): route simplification tolerance in screen pixels and
+# the number of shipments whose simplified routes are kept in memory
+FLEET_MAP_TOLERANCE_PX = 1.0
+FLEET_MAP_CACHE_SIZE = 5000
+
+# GPS ingestion (api/tracking.py): buffered positions are written at most once
+# per interval (0 = write through); a full buffer is flushed immediately
+LOCATION_FLUSH_INTERVAL = float(os.getenv("LOCATION_FLUSH_INTERVAL_SECONDS", 2))
+LOCATION_BUFFER_MAX_SIZE = 5000
+LOCATION_BATCH_MAX_POINTS = 1000
+
+# Track history (api/history.py, manage.py compact_location_history)
+LOCATION_HISTORY_BUCKET = timedelta(hours=1)
+LOCATION_HISTORY_RAW_RETENTION = timedelta(days=7)
+LOCATION_HISTORY_DOWNSAMPLE_SECONDS = 60
+LOCATION_HISTORY_MAX_AGE = timedelta(days=180)
+
+# Progress-aware ETAs (api/eta.py): decoded routes kept in memory per process
+ETA_GEOMETRY_CACHE_SIZE = 5000
+
+# Live tracking stream (api/live.py): seconds between keepalive comments
+LIVE_STREAM_HEARTBEAT = 15
+
+# Nearest-available assignment index (api/assignment.py)
+ASSIGNMENT_INDEX_TTL = 60  # seconds between full reloads from the database
+ASSIGNMENT_INDEX_OVERLAY_LIMIT = 64  # moved resources tolerated before the KD-tree is rebuilt
+ASSIGNMENT_CANDIDATES = 5  # nearest candidates confirmed against the database per lookup
+ASSIGNMENT_CLAIM_RETRIES = 3  # index reloads after losing every candidate to concurrent claims
+
+# Cached dashboard/product/vehicle responses (api/caching.py): seconds a body
+# is kept; writes invalidate them earlier
+RESPONSE_CACHE_TIMEOUT = 300
+
+# Delivery-time training from shipment history (api/training.py,
+# manage.py train_models --from-history)
+MODEL_TRAINING_CHUNK_SIZE = 5000  # rows fetched and folded per step
+MODEL_TRAINING_MIN_ROWS = 100  # refuse to publish a model fitted on less